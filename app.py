@@ -1,44 +1,22 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
-from pathlib import Path
+
+import dados
 
 # --- Configuração da página ---
 st.set_page_config(page_title="Dashboard de FIIs", page_icon="🏠", layout="wide")
 
-# --- Caminho do banco de dados ---
-DB_PATH = Path(__file__).resolve().parent / "data" / "fiis.db"
-
-# --- Carregamento dos dados ---
-conn = sqlite3.connect(DB_PATH)
-sql_meta = """
-SELECT f.id, f.ticker, f.nome, s.nome AS setor, t.nome AS tipo
-FROM fiis f
-LEFT JOIN setor s ON f.setor_id = s.id
-LEFT JOIN tipo_fii t ON f.tipo_id = t.id
-WHERE f.ativo = 1
-"""
-df_meta = pd.read_sql_query(sql_meta, conn)
-
-cotacoes = pd.read_sql_query(
-    "SELECT fii_id, data, preco_fechamento FROM cotacoes",
-    conn,
-    parse_dates=['data']
-)
-
-inds = pd.read_sql_query(
-    """
-    SELECT fi.fii_id, i.nome AS indicador, fi.valor, fi.data_referencia
-    FROM fiis_indicadores fi
-    JOIN indicadores i ON i.id = fi.indicador_id
-    """,
-    conn,
-    parse_dates=['data_referencia']
-)
-conn.close()
+# --- Carregamento dos dados (em cache por versão do banco) ---
+df_meta = dados.carregar_fiis()[['id', 'ticker', 'nome', 'setor', 'tipo']]
+snapshot = dados.carregar_snapshot()
 
 # --- Preparação do DataFrame principal ---
-df = df_meta.copy()
+# Preço, VPA, P/VP, DY 12M e Cap Rate já vêm calculados do fii_snapshot
+df = df_meta.merge(
+    snapshot[['fii_id', 'preco_atual', 'vpa', 'pvp', 'dy_12m', 'cap_rate']]
+    .rename(columns={'vpa': 'vpa_calc', 'pvp': 'pvp_calc', 'dy_12m': 'dy_calc'}),
+    left_on='id', right_on='fii_id', how='left'
+)
 
 def format_brl(valor):
     return f"R$ {valor:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
@@ -53,56 +31,6 @@ st.warning(
     """
 )
 
-# --- Último preço de fechamento ---
-ultimo = (
-    cotacoes
-    .sort_values(['fii_id', 'data'])
-    .groupby('fii_id')['preco_fechamento']
-    .last()
-    .rename('preco_atual')
-)
-df = df.merge(ultimo, left_on='id', right_index=True, how='left')
-df['preco_atual'] = pd.to_numeric(df['preco_atual'], errors='coerce')
-
-# --- Pivot de indicadores (PL, Qt e Cap Rate) ---
-pivot = (
-    inds
-    .pivot_table(
-        index='fii_id',
-        columns='indicador',
-        values='valor',
-        aggfunc='max'
-    )
-    .rename(columns={
-        'Patrimônio Líquido':   'pl',
-        'Quantidade de Cotas':   'qt',
-        'Cap Rate':              'cap_rate'
-    })
-)
-pivot[['pl', 'qt', 'cap_rate']] = pivot[['pl', 'qt', 'cap_rate']].apply(
-    pd.to_numeric, errors='coerce'
-)
-
-# Mescla indicadores ao DataFrame principal
-df = df.merge(
-    pivot[['pl', 'qt', 'cap_rate']],
-    left_on='id', right_index=True, how='left'
-)
-
-# --- Cálculo de VPA e P/VP ---
-df['vpa_calc'] = df['pl'] / df['qt']
-df['pvp_calc'] = df['preco_atual'] / df['vpa_calc']
-
-# --- Cálculo de DY 12M ---
-divs = inds[inds['indicador'] == 'Dividendos'].copy()
-divs['periodo'] = divs['data_referencia'].dt.to_period('M')
-ultimo_periodo = divs['periodo'].max()
-inicio_periodo = ultimo_periodo - 11
-d12 = divs[divs['periodo'].between(inicio_periodo, ultimo_periodo)]
-soma_divs = d12.groupby('fii_id')['valor'].sum().rename('div12m')
-df = df.merge(soma_divs, left_on='id', right_index=True, how='left')
-df['dy_calc'] = (df['div12m'] / df['preco_atual']) * 100
-
 # --- Definição dinâmica dos filtros “avançados” ---
 setores = ['Todos'] + sorted(df['setor'].dropna().unique().tolist())
 tipos   = ['Todos'] + sorted(df['tipo'].dropna().unique().tolist())
@@ -0,0 +1,421 @@
+"""
+Camada de acesso a dados compartilhada por todas as páginas do dashboard.
+
+Cada tabela é lida uma única vez por versão do banco. A versão é o mtime do
+arquivo SQLite (e do arquivo -wal, já que os scripts gravam em modo WAL) e
+entra como argumento das funções em cache: enquanto o pipeline não gravar
+nada, todas as sessões reaproveitam o mesmo DataFrame do st.cache_data.
+"""
+import sqlite3
+from contextlib import closing
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+from dateutil.relativedelta import relativedelta
+
+# --- Caminho do banco de dados ---
+DB_PATH = Path(__file__).resolve().parent / "data" / "fiis.db"
+# telemetria do pipeline (scripts/setup.py), separada para sobreviver à recriação do fiis.db
+TELEMETRIA_PATH = DB_PATH.with_name("pipeline.db")
+
+
+def versao_banco(caminho=DB_PATH) -> int:
+    """Retorna o mtime (ns) mais recente entre o banco e seu arquivo WAL."""
+    versao = 0
+    for arq in (caminho, caminho.with_name(caminho.name + "-wal")):
+        try:
+            versao = max(versao, arq.stat().st_mtime_ns)
+        except FileNotFoundError:
+            pass
+    return versao
+
+
+def conectar(caminho=DB_PATH):
+    # o `with` de uma conexão sqlite3 só faz commit/rollback: closing() a fecha
+    # ao fim de cada leitura, sem conexões abertas segurando o checkpoint do WAL
+    return closing(sqlite3.connect(caminho))
+
+
+# --- Leituras em cache (uma por tabela e por versão do banco) ---
+@st.cache_data(show_spinner=False)
+def _carregar_fiis(versao):
+    with conectar() as conn:
+        return pd.read_sql(
+            """
+            SELECT f.id, f.ticker, f.nome, f.gestao, f.admin,
+                   f.setor_id, f.tipo_id,
+                   s.nome AS setor, t.nome AS tipo, t.descricao AS tipo_desc
+            FROM fiis f
+            LEFT JOIN setor s    ON f.setor_id = s.id
+            LEFT JOIN tipo_fii t ON f.tipo_id = t.id
+            WHERE f.ativo = 1
+            """,
+            conn,
+        )
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_setores(versao):
+    with conectar() as conn:
+        return pd.read_sql("SELECT id, nome FROM setor", conn)
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_tipos(versao):
+    with conectar() as conn:
+        return pd.read_sql("SELECT id, nome, descricao FROM tipo_fii", conn)
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_cotacoes(versao):
+    with conectar() as conn:
+        return pd.read_sql(
+            "SELECT fii_id, data, preco_fechamento FROM cotacoes",
+            conn,
+            parse_dates=['data'],
+        )
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_indicadores(versao):
+    with conectar() as conn:
+        return pd.read_sql(
+            """
+            SELECT fi.fii_id, f.ticker, i.nome AS indicador,
+                   fi.valor, fi.data_referencia
+            FROM fiis_indicadores fi
+            JOIN indicadores i ON i.id = fi.indicador_id
+            JOIN fiis f        ON f.id = fi.fii_id
+            """,
+            conn,
+            parse_dates=['data_referencia'],
+        )
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_imoveis(versao):
+    with conectar() as conn:
+        return pd.read_sql(
+            """
+            SELECT fii_id, nome_imovel, endereco,
+                   area_m2, num_unidades, tx_ocupacao
+            FROM fiis_imoveis
+            """,
+            conn,
+        )
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_snapshot(versao):
+    with conectar() as conn:
+        return pd.read_sql(
+            "SELECT * FROM fii_snapshot",
+            conn,
+            parse_dates=['data_cotacao'],
+        )
+
+
+# --- Leituras por fundo (consultas parametrizadas no índice (fii_id, data)) ---
+@st.cache_data(show_spinner=False)
+def _carregar_cotacoes_fii(ticker, anos, versao):
+    desde = (date.today() - relativedelta(years=anos)).isoformat()
+    with conectar() as conn:
+        return pd.read_sql(
+            """
+            SELECT c.data, c.preco_fechamento
+            FROM cotacoes c
+            WHERE c.fii_id = (SELECT id FROM fiis WHERE ticker = ?)
+              AND c.data >= ?
+            ORDER BY c.data DESC
+            """,
+            conn,
+            params=(ticker, desde),
+            parse_dates=['data'],
+        )
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_semanal_fii(ticker, anos, versao):
+    desde = (date.today() - relativedelta(years=anos)).isoformat()
+    with conectar() as conn:
+        return pd.read_sql(
+            """
+            SELECT s.semana AS data, s.abertura, s.maxima, s.minima,
+                   s.fechamento AS preco_fechamento, s.volume
+            FROM cotacoes_semanal s
+            WHERE s.fii_id = (SELECT id FROM fiis WHERE ticker = ?)
+              AND s.semana >= ?
+            ORDER BY s.semana
+            """,
+            conn,
+            params=(ticker, desde),
+            parse_dates=['data'],
+        )
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_mensal_fii(ticker, anos, versao):
+    desde = (date.today().replace(day=1) - relativedelta(years=anos)).isoformat()
+    with conectar() as conn:
+        return pd.read_sql(
+            """
+            SELECT m.mes AS data, m.abertura, m.maxima, m.minima,
+                   m.fechamento AS preco_fechamento, m.volume
+            FROM cotacoes_mensal m
+            WHERE m.fii_id = (SELECT id FROM fiis WHERE ticker = ?)
+              AND m.mes >= ?
+            ORDER BY m.mes
+            """,
+            conn,
+            params=(ticker, desde),
+            parse_dates=['data'],
+        )
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_indicadores_fii(ticker, anos, versao):
+    desde = (date.today().replace(day=1) - relativedelta(years=anos)).isoformat()
+    with conectar() as conn:
+        return pd.read_sql(
+            """
+            SELECT i.nome AS indicador, fi.valor, fi.data_referencia
+            FROM fiis_indicadores fi
+            JOIN indicadores i ON i.id = fi.indicador_id
+            WHERE fi.fii_id = (SELECT id FROM fiis WHERE ticker = ?)
+              AND fi.data_referencia >= ?
+            ORDER BY fi.data_referencia
+            """,
+            conn,
+            params=(ticker, desde),
+            parse_dates=['data_referencia'],
+        )
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_dividendos_mensais_fii(ticker, anos, versao):
+    desde = (date.today().replace(day=1) - relativedelta(years=anos)).isoformat()
+    with conectar() as conn:
+        return pd.read_sql(
+            """
+            SELECT d.mes, d.valor, d.n_pagamentos
+            FROM dividendos_mensais d
+            WHERE d.fii_id = (SELECT id FROM fiis WHERE ticker = ?)
+              AND d.mes >= ?
+            ORDER BY d.mes
+            """,
+            conn,
+            params=(ticker, desde),
+            parse_dates=['mes'],
+        )
+
+
+# --- Leitura em lote de vários fundos (Comparador) ---
+def _marcadores(n):
+    return ", ".join("?" * n)
+
+
+@st.cache_data(show_spinner=False)
+def _carregar_fundos(tickers, anos_cot, anos_div, versao):
+    hoje = date.today()
+    desde_cot = (hoje - relativedelta(years=anos_cot)).isoformat()
+    # meses de dividendos: do mês de início do período de DY, cobrindo
+    # também o gráfico dos últimos 12 meses
+    desde_dy = (hoje - relativedelta(years=anos_div)).replace(day=1)
+    desde_div = min(desde_dy, hoje.replace(day=1) - relativedelta(months=12)).isoformat()
+
+    with conectar() as conn:
+        meta = pd.read_sql(
+            f"""
+            SELECT f.id AS fii_id, f.ticker, s.nome AS setor,
+                   sn.preco_atual, sn.pl, sn.qt_cotas, sn.vpa, sn.pvp,
+                   sn.cap_rate, sn.qtd_imoveis
+            FROM fiis f
+            LEFT JOIN setor s         ON s.id = f.setor_id
+            LEFT JOIN fii_snapshot sn ON sn.fii_id = f.id
+            WHERE f.ticker IN ({_marcadores(len(tickers))})
+            """,
+            conn,
+            params=list(tickers),
+        )
+        ids = [int(i) for i in meta['fii_id']]
+        if not ids:
+            return {}
+        em_ids = _marcadores(len(ids))
+        # barras semanais pré-agregadas (cotacoes_semanal), não o diário
+        precos = pd.read_sql(
+            f"""
+            SELECT fii_id, semana AS data, fechamento AS preco_fechamento
+            FROM cotacoes_semanal
+            WHERE fii_id IN ({em_ids}) AND semana >= ?
+            ORDER BY fii_id, semana
+            """,
+            conn,
+            params=[*ids, desde_cot],
+            parse_dates=['data'],
+        )
+        divs = pd.read_sql(
+            f"""
+            SELECT fii_id, mes, valor
+            FROM dividendos_mensais
+            WHERE fii_id IN ({em_ids}) AND mes >= ?
+            ORDER BY fii_id, mes
+            """,
+            conn,
+            params=[*ids, desde_div],
+            parse_dates=['mes'],
+        )
+        imoveis = pd.read_sql(
+            f"""
+            SELECT fii_id,
+                   COUNT(*)                  AS total_imoveis,
+                   SUM(num_unidades)         AS total_unidades,
+                   SUM(area_m2)              AS total_area,
+                   SUM(area_m2 * tx_ocupacao) / NULLIF(SUM(area_m2), 0) AS ocupacao
+            FROM fiis_imoveis
+            WHERE fii_id IN ({em_ids})
+            GROUP BY fii_id
+            """,
+            conn,
+            params=ids,
+        ).set_index('fii_id')
+
+    # uma única passada agrupada por fundo em cada tabela
+    precos_por_fii = {k: g.drop(columns='fii_id') for k, g in precos.groupby('fii_id')}
+    divs_por_fii = {k: g.drop(columns='fii_id') for k, g in divs.groupby('fii_id')}
+    soma_dy = (
+        divs[divs['mes'] >= pd.Timestamp(desde_dy)]
+        .groupby('fii_id')['valor'].sum()
+    )
+
+    def valor(v):
+        return None if pd.isna(v) else float(v)
+
+    vazio_precos = pd.DataFrame({'data': pd.Series(dtype='datetime64[ns]'),
+                                 'preco_fechamento': pd.Series(dtype=float)})
+    vazio_divs = pd.DataFrame({'mes': pd.Series(dtype='datetime64[ns]'),
+                               'valor': pd.Series(dtype=float)})
+    fundos = {}
+    for m in meta.itertuples(index=False):
+        preco = valor(m.preco_atual)
+        im = imoveis.loc[m.fii_id] if m.fii_id in imoveis.index else None
+        fundos[m.ticker] = {
+            'id':          int(m.fii_id),
+            'setor':       m.setor or 'N/A',
+            'preco':       preco,
+            'pl':          valor(m.pl),
+            'cotas':       valor(m.qt_cotas),
+            'vpa':         valor(m.vpa),
+            'pvp':         valor(m.pvp),
+            'cap_rate':    valor(m.cap_rate),
+            'qtd_imoveis': int(m.qtd_imoveis) if pd.notna(m.qtd_imoveis) else 0,
+            'dy':          float(soma_dy.get(m.fii_id, 0.0)) / preco * 100 if preco else 0.0,
+            'precos':      precos_por_fii.get(m.fii_id, vazio_precos),
+            'dividendos':  divs_por_fii.get(m.fii_id, vazio_divs),
+            'imoveis':     None if im is None else {
+                'total_imoveis':  int(im['total_imoveis']),
+                'total_unidades': int(im['total_unidades']) if pd.notna(im['total_unidades']) else 0,
+                'total_area':     float(im['total_area']),
+                'vacancia':       100 - float(im['ocupacao']),
+            },
+        }
+    return fundos
+
+
+# --- Telemetria do pipeline ---
+@st.cache_data(show_spinner=False)
+def _carregar_metricas_pipeline(versao):
+    if not TELEMETRIA_PATH.exists():
+        return pd.DataFrame()
+    with conectar(TELEMETRIA_PATH) as conn:
+        return pd.read_sql(
+            """
+            SELECT r.inicio AS inicio_execucao, r.modo,
+                   r.duracao_s AS duracao_execucao_s, m.*
+            FROM pipeline_stage_metrics m
+            JOIN pipeline_runs r ON r.id = m.run_id
+            ORDER BY r.id, m.inicio
+            """,
+            conn,
+            parse_dates=['inicio_execucao', 'inicio', 'fim'],
+        )
+
+
+# --- API pública usada pelas páginas ---
+def carregar_fiis():
+    """FIIs ativos com nome do setor e do tipo."""
+    return _carregar_fiis(versao_banco())
+
+
+def carregar_setores():
+    return _carregar_setores(versao_banco())
+
+
+def carregar_tipos():
+    return _carregar_tipos(versao_banco())
+
+
+def carregar_cotacoes():
+    """Fechamentos diários de todos os FIIs (fii_id, data, preco_fechamento)."""
+    return _carregar_cotacoes(versao_banco())
+
+
+def carregar_indicadores():
+    """Histórico de indicadores (fii_id, ticker, indicador, valor, data_referencia)."""
+    return _carregar_indicadores(versao_banco())
+
+
+def carregar_imoveis():
+    """Imóveis de todos os FIIs, para filtrar por fii_id na página."""
+    return _carregar_imoveis(versao_banco())
+
+
+def carregar_snapshot():
+    """Uma linha por FII com os valores mais recentes (tabela fii_snapshot)."""
+    return _carregar_snapshot(versao_banco())
+
+
+def carregar_cotacoes_fii(ticker, anos):
+    """Fechamentos de um FII nos últimos `anos` anos, do mais recente ao mais antigo."""
+    return _carregar_cotacoes_fii(ticker, anos, versao_banco())
+
+
+def carregar_semanal_fii(ticker, anos):
+    """Barras semanais (W-FRI) de um FII nos últimos `anos` anos, em ordem cronológica."""
+    return _carregar_semanal_fii(ticker, anos, versao_banco())
+
+
+def carregar_mensal_fii(ticker, anos):
+    """Barras mensais (dia 1 do mês) de um FII nos últimos `anos` anos, em ordem cronológica."""
+    return _carregar_mensal_fii(ticker, anos, versao_banco())
+
+
+def carregar_indicadores_fii(ticker, anos):
+    """Indicadores de um FII com data de referência nos últimos `anos` anos."""
+    return _carregar_indicadores_fii(ticker, anos, versao_banco())
+
+
+def carregar_dividendos_mensais_fii(ticker, anos):
+    """Totais mensais de dividendos de um FII (mes, valor, n_pagamentos) nos últimos `anos` anos."""
+    return _carregar_dividendos_mensais_fii(ticker, anos, versao_banco())
+
+
+def carregar_fundos(tickers, anos_cot, anos_div):
+    """
+    Métricas, cotações semanais, dividendos mensais e agregados de imóveis de vários FIIs,
+    com uma consulta por tabela independente da quantidade de fundos.
+    Retorna um dicionário ticker -> dados do fundo.
+    """
+    tickers = tuple(sorted(set(tickers)))
+    if not tickers:
+        return {}
+    return _carregar_fundos(tickers, anos_cot, anos_div, versao_banco())
+
+
+def carregar_metricas_pipeline():
+    """
+    Uma linha por execução do pipeline e etapa (tabelas pipeline_runs e
+    pipeline_stage_metrics de data/pipeline.db); vazio se ainda não houver.
+    """
+    return _carregar_metricas_pipeline(versao_banco(TELEMETRIA_PATH))
@@ -1,13 +1,13 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 import numpy as np
 import plotly.express as px
-from pathlib import Path
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import plotly.graph_objects as go  # no topo do arquivo
 
+import dados
+
 st.set_page_config(page_title="Comparador de FIIs - Iniciante", page_icon="⚖️", layout="wide")
 # CSS tooltips
 st.markdown(
@@ -60,63 +60,17 @@ st.sidebar.markdown(r"""
 
 st.markdown("<h1 style='text-align:center;'>📑 Comparador de Fundos Imobiliários</h1>", unsafe_allow_html=True)
 
-DB_PATH = Path(__file__).resolve().parents[1] / "data" / "fiis.db"
-with sqlite3.connect(DB_PATH) as conn:
-    # 1) carrega FIIs e demais tabelas
-    fiis    = pd.read_sql("SELECT id, ticker, nome, gestao, admin, setor_id, tipo_id FROM fiis WHERE ativo = 1", conn)
-    setores = pd.read_sql("SELECT id, nome FROM setor", conn)
-    cot    = pd.read_sql("SELECT fii_id, data, preco_fechamento FROM cotacoes", conn, parse_dates=['data'])
-    inds   = pd.read_sql(
-        """
-        SELECT fi.fii_id, i.nome AS indicador, fi.valor, fi.data_referencia
-        FROM fiis_indicadores fi
-        JOIN indicadores i ON fi.indicador_id = i.id
-        """, conn, parse_dates=['data_referencia']
-    )
+# 1) carrega FIIs e demais tabelas (em cache por versão do banco)
+fiis    = dados.carregar_fiis()[['id', 'ticker', 'nome', 'gestao', 'admin', 'setor_id', 'tipo_id']]
+setores = dados.carregar_setores()
 
-    # ───> aqui, carregue também a tabela de tipos:
-    tipos = pd.read_sql(
-        "SELECT id AS tipo_id, nome AS tipo, descricao AS tipo_desc FROM tipo_fii",
-        conn
-    )
+# ───> aqui, carregue também a tabela de tipos:
+tipos = dados.carregar_tipos().rename(
+    columns={'id': 'tipo_id', 'nome': 'tipo', 'descricao': 'tipo_desc'}
+)
 
 # 2) faça o merge de tipos com o DataFrame de FIIs
 fiis = fiis.merge(tipos, on="tipo_id", how="left")
-def prepare(ticker, years_div):
-    dy = 0.0
-    row = fiis[fiis['ticker']==ticker].iloc[0]
-    setor = setores.set_index('id').loc[row['setor_id'], 'nome'] \
-               if row['setor_id'] in setores['id'].values else 'N/A'
-    df_ind = inds[inds['fii_id']==row['id']].copy()
-    df_ind.set_index('data_referencia', inplace=True)
-    df_ind = inds[inds['fii_id']==row['id']].copy()
-    pl = None
-    if 'Patrimônio Líquido' in df_ind['indicador'].values:
-        pl = float(df_ind[df_ind['indicador']=='Patrimônio Líquido']['valor'].iloc[-1])
-    cotas = None
-    if 'Quantidade de Cotas' in df_ind['indicador'].values:
-        cotas = float(df_ind[df_ind['indicador']=='Quantidade de Cotas']['valor'].iloc[-1])
-    # --- Cap Rate ---
-    cap_rate = None
-    if 'Cap Rate' in df_ind['indicador'].values:
-        cap_rate = float(df_ind[df_ind['indicador']=='Cap Rate']['valor'].iloc[-1])
-    df_price = cot[cot['fii_id']==row['id']]
-    price = df_price.sort_values('data')['preco_fechamento'].iloc[-1] if not df_price.empty else None
-    vpa = pl/cotas if pl and cotas else None
-    pvp = price/vpa if price and vpa else None
-    one_period_ago = datetime.now() - relativedelta(years=years_div)
-
-    # filtra dividendos daquele ticker e período
-    divs_all = df_ind[
-        (df_ind['indicador'] == 'Dividendos') &
-        (df_ind['data_referencia'] >= one_period_ago)
-    ]
-
-    if price and not divs_all.empty:
-         dy = divs_all['valor'].sum() / price * 100
-
-    # Agora retorna cap_rate também
-    return row, setor, pl, cotas, price, vpa, pvp, dy, cap_rate, df_price, df_ind
 
 # lista de tipos e setores para cada coluna
 tipo_names = tipos['tipo'].tolist()
@@ -203,28 +157,9 @@ f2 = col2.selectbox(
     key='f2'
 )
 
-data1 = prepare(f1, years_div)
-data2 = prepare(f2, years_div)
-
-# --- após calcular price, pl, cotas, vpa, pvp e qtd_imoveis para C1 e C2 ---
-# desempacota os retornos para o Fundo 1
-row1, setor1, pl1, cotas1, price1, vpa1, pvp1, dy1, cap_rate1, df_price1, df_ind1 = data1
-row2, setor2, pl2, cotas2, price2, vpa2, pvp2, dy2, cap_rate2, df_price2, df_ind2 = data2
-
-with sqlite3.connect(DB_PATH) as conn_im:
-    df_qt1 = pd.read_sql(
-        "SELECT COUNT(*) AS qtd FROM fiis_imoveis WHERE fii_id = ?",
-        conn_im,
-        params=(int(row1["id"]),)
-    )
-    qtd_imoveis1 = int(df_qt1["qtd"].iloc[0]) if not df_qt1.empty else 0
-
-    df_qt2 = pd.read_sql(
-        "SELECT COUNT(*) AS qtd FROM fiis_imoveis WHERE fii_id = ?",
-        conn_im,
-        params=(int(row2["id"]),)
-    )
-    qtd_imoveis2 = int(df_qt2["qtd"].iloc[0]) if not df_qt2.empty else 0
+# métricas, séries e imóveis dos fundos selecionados num único lote
+fundos = dados.carregar_fundos([f1, f2], years_cot, years_div)
+fundo1, fundo2 = fundos[f1], fundos[f2]
 
 # funções de formatação genérica
 def human_format(num):
@@ -277,52 +212,36 @@ metrics = [
 ]
 
 # extraia os valores em dois dicionários
-values1 = {
-    "Preço Atual":            price1,
-    "Patrimônio Líquido (PL)": pl1,
-    "Quantidade Cotas":       cotas1,
-    "VPA":                    vpa1,
-    "P/VP":                   pvp1,
-    "Número de Imóveis":      qtd_imoveis1,
-    "Cap Rate":               cap_rate1,
-}
-values2 = {
-    "Preço Atual":            price2,
-    "Patrimônio Líquido (PL)": pl2,
-    "Quantidade Cotas":       cotas2,
-    "VPA":                    vpa2,
-    "P/VP":                   pvp2,
-    "Número de Imóveis":      qtd_imoveis2,
-    "Cap Rate":               cap_rate2,
-}
+def valores_fundo(fundo):
+    return {
+        "Preço Atual":             fundo['preco'],
+        "Patrimônio Líquido (PL)": fundo['pl'],
+        "Quantidade Cotas":        fundo['cotas'],
+        "VPA":                     fundo['vpa'],
+        "P/VP":                    fundo['pvp'],
+        "Número de Imóveis":       fundo['qtd_imoveis'],
+        "Cap Rate":                fundo['cap_rate'],
+    }
+
+values1 = valores_fundo(fundo1)
+values2 = valores_fundo(fundo2)
 
 
 # pré-calcule os troféus para não ter que rodar lambda dentro do loop de renderização
 trofeus1 = {lbl: " 🏆" if cmp(values1[lbl], values2[lbl]) else "" for lbl, cmp in metrics}
 trofeus2 = {lbl: " 🏆" if cmp(values2[lbl], values1[lbl]) else "" for lbl, cmp in metrics}
 
-rows      = [row1,        row2]
-values    = [values1,     values2]
-trofeus   = [trofeus1,    trofeus2]
-dfs_price = [df_price1,   df_price2]
-dfs_ind   = [df_ind1,     df_ind2]
+fundos_sel = [fundo1,      fundo2]
+values     = [values1,     values2]
+trofeus    = [trofeus1,    trofeus2]
 
 col_f1, col_f2 = st.columns(2)
 for idx, c in enumerate([col_f1, col_f2]):
-    row      = rows[idx]
+    fundo    = fundos_sel[idx]
     vals     = values[idx]
     trofs    = trofeus[idx]
-    df_price = dfs_price[idx]
-    df_ind   = dfs_ind[idx]
-
-    # agora, quando for buscar imóveis:
-    with sqlite3.connect(DB_PATH) as conn_im:
-        df_qt = pd.read_sql(
-            "SELECT COUNT(*) AS qtd FROM fiis_imoveis WHERE fii_id = ?",
-            conn_im,
-            params=(int(row["id"]),),  # <-- row está definido!
-        )
-        qtd_imoveis = int(df_qt["qtd"].iloc[0]) if not df_qt.empty else 0
+    df_price = fundo['precos']
+    df_div   = fundo['dividendos']
 
     # 1ª linha: Preço Atual / Patrimônio Líquido
     r1 = c.columns(2)
@@ -412,15 +331,8 @@ for idx, c in enumerate([col_f1, col_f2]):
         if df_filtered.empty:
             c.info("Sem dados de cotação para o período selecionado.")
         else:
-            # resample semanal genérico e descarta NaN
-            df_week = (
-                df_filtered
-                .set_index('data')
-                .resample('W')['preco_fechamento']
-                .last()
-                .dropna()
-                .reset_index()
-            )
+            # já vem em barras semanais (cotacoes_semanal)
+            df_week = df_filtered.dropna(subset=['preco_fechamento'])
 
             if df_week.empty:
                 c.info("Não há cotações semanais suficientes para plotar o gráfico.")
@@ -480,13 +392,10 @@ for idx, c in enumerate([col_f1, col_f2]):
                 )
                                 
     # Dividendos 12 Meses
-    if not df_ind[df_ind['indicador']=='Dividendos'].empty:
-        df_div = df_ind[df_ind['indicador']=='Dividendos'].copy()
-        # usa a coluna data_referencia para extrair mês
-        df_div['mes'] = pd.to_datetime(df_div['data_referencia']).dt.to_period('M').dt.to_timestamp()
-        mensal = df_div.groupby('mes')['valor'].sum().reset_index()
+    if not df_div.empty:
+        # já vem somado por mês (dividendos_mensais)
         fig2 = px.bar(
-            mensal.sort_values('mes').tail(12),
+            df_div.tail(12),
             x='mes',
             y='valor',
             title='Dividendos 12 Meses',
@@ -499,32 +408,17 @@ for idx, c in enumerate([col_f1, col_f2]):
             key=f"dividendos_12m_{idx}"
         )
 
-            # 1) Seção Imóveis
-    fii_id = int(row["id"])  # usa row, não 'f'
-
-    # 2) Consulta ao banco
-    with sqlite3.connect(DB_PATH) as conn_im:
-        df_imoveis = pd.read_sql(
-            """
-            SELECT area_m2,
-                num_unidades,
-                tx_ocupacao
-            FROM fiis_imoveis
-            WHERE fii_id = ?
-            """,
-            conn_im,
-            params=(fii_id,),
-        )
+    # Seção Imóveis: agregados já calculados no lote
+    im = fundo['imoveis']
 
     # Só exibe a seção se houver dados
-    if not df_imoveis.empty:
+    if im is not None:
         c.subheader("Imóveis")
 
-        total_imoveis  = len(df_imoveis)
-        total_unidades = df_imoveis["num_unidades"].sum()
-        total_area     = df_imoveis["area_m2"].sum()
-        weighted_ocup  = (df_imoveis["area_m2"] * df_imoveis["tx_ocupacao"]).sum() / total_area
-        vac_phys       = 100 - weighted_ocup
+        total_imoveis  = im["total_imoveis"]
+        total_unidades = im["total_unidades"]
+        total_area     = im["total_area"]
+        vac_phys       = im["vacancia"]
 
     # formata área
         area_str = (
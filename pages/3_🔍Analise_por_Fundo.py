@@ -1,31 +1,21 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import sqlite3
 import plotly.express as px
-from pathlib import Path
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
+import dados
+
 st.set_page_config(page_title="Análise de FII - Iniciante", page_icon="🔍", layout="wide")
 st.markdown("<h1 style='text-align:left;'>📊Análise por fundo</h1>", unsafe_allow_html=True)
 
-# Caminho para o banco
-db_path = Path(__file__).resolve().parent.parent / "data" / "fiis.db"
-# Conexão e leitura de tabelas
-conn = sqlite3.connect(db_path)
-fiis = pd.read_sql("SELECT * FROM fiis WHERE ativo = 1;", conn)
-cotacoes = pd.read_sql("SELECT * FROM cotacoes;", conn)
-hf_query = '''
-SELECT fi.fii_id, f.ticker, i.nome AS indicador, fi.valor, fi.data_referencia
-FROM fiis_indicadores fi
-JOIN indicadores i ON i.id = fi.indicador_id
-JOIN fiis f ON f.id = fi.fii_id
-'''
-inds = pd.read_sql(hf_query, conn)
-setores = pd.read_sql("SELECT id, nome FROM setor;", conn)
-tipos = pd.read_sql("SELECT id, nome FROM tipo_fii;", conn)
-conn.close()
+# Leitura das tabelas (em cache por versão do banco)
+fiis = dados.carregar_fiis()
+snapshot = dados.carregar_snapshot().set_index('fii_id')
+setores = dados.carregar_setores()
+tipos = dados.carregar_tipos()
+imoveis = dados.carregar_imoveis()
 
 # Mapeamentos auxiliares
 meses_pt = ['Jan','Fev','Mar','Abr','Mai','Jun','Jul','Ago','Set','Out','Nov','Dez']
@@ -74,20 +64,25 @@ else:
 # Prepara séries
 fiid = int(df_f["id"])
 
-# Cotação
-df_cot = cotacoes[cotacoes['fii_id']==fiid].copy()
-df_cot['data'] = pd.to_datetime(df_cot['data'])
-df_cot.sort_values('data',ascending=False,inplace=True)
+# Cotação diária: só o último ano (preço atual, 30 dias e DY);
+# o gráfico do período do slider usa as barras pré-agregadas: semanais
+# até 5 anos, mensais acima disso
+df_cot = dados.carregar_cotacoes_fii(ticker, 1)
+if years_cot > 5:
+    df_sem = dados.carregar_mensal_fii(ticker, years_cot)
+else:
+    df_sem = dados.carregar_semanal_fii(ticker, years_cot)
 price = df_cot.iloc[0]['preco_fechamento'] if not df_cot.empty else np.nan
 latest_date = df_cot.iloc[0]['data'].strftime('%d/%m/%Y') if not df_cot.empty else '-'
 
-# Histórico de indicadores
-hf = inds[inds['ticker']==ticker].copy()
-hf['data_referencia'] = pd.to_datetime(hf['data_referencia'])
+# Dividendos já somados por mês (dividendos_mensais) no período do slider
+# (mínimo de 1 ano, cobrindo o DY 12M)
+df_div_mensal = dados.carregar_dividendos_mensais_fii(ticker, years_div)
 
-# Cálculos financeiros básicos
-pl = hf[hf['indicador'].str.lower()=='patrimônio líquido']['valor'].iloc[-1] if not hf.empty else np.nan
-qt = hf[hf['indicador'].str.lower()=='quantidade de cotas']['valor'].iloc[-1] if not hf.empty else np.nan
+# Cálculos financeiros básicos: PL e cotas mais recentes vêm do snapshot
+snap = snapshot.loc[fiid] if fiid in snapshot.index else pd.Series(dtype=float)
+pl = snap.get('pl', np.nan)
+qt = snap.get('qt_cotas', np.nan)
 VPA = pl/qt if qt else np.nan
 PVP = price/VPA if VPA else np.nan
 mkt = price*qt if price and qt else np.nan
@@ -97,26 +92,13 @@ now = datetime.now()
 past30 = df_cot[df_cot['data'] <= now - timedelta(days=30)]
 delta30 = ((price - past30.iloc[0]['preco_fechamento'])/past30.iloc[0]['preco_fechamento']*100) if not past30.empty else np.nan
 
-d52 = df_cot[df_cot['data'] >= now - timedelta(weeks=52)]
-high52 = d52['preco_fechamento'].max() if not d52.empty else np.nan
-low52 = d52['preco_fechamento'].min() if not d52.empty else np.nan
+# faixa de 52 semanas do snapshot (máxima/mínima dos pregões)
+high52 = snap.get('max_52s', np.nan)
+low52 = snap.get('min_52s', np.nan)
 
 delta52 = ((price - low52) / low52 * 100) if pd.notna(low52) and low52 else np.nan
 
 # Dividend Yield
-# Filtra apenas os registros de dividendos
-# Filtra dividendos e converte datas
-divs = hf[hf['indicador'].str.lower() == 'dividendos'].copy()
-divs['data_referencia'] = pd.to_datetime(divs['data_referencia'])
-
-# Reagrupa por mês, somando cada mês só uma vez
-df_div_mensal = (
-    divs.assign(
-        mes = divs['data_referencia'].dt.to_period('M').dt.to_timestamp()
-    )
-    .groupby('mes', as_index=False)['valor']
-    .sum()
-)
 
 price_val = price or 1.0
 
@@ -127,15 +109,14 @@ def preco_em(data):
     return tmp.iloc[-1]['preco_fechamento']
 
 def DY_n_months(n):
-    first_this_month = now.replace(day=1)
+    first_this_month = datetime(now.year, now.month, 1)
     start_period = first_this_month - relativedelta(months=n)
-    last_day_prev_month = first_this_month - timedelta(days=1)
-    # O correto é considerar: datas maiores que start_period, até o último dia do mês anterior
+    # Meses cheios: de start_period até o mês anterior
     mask = (
-        (divs['data_referencia'] > start_period) &
-        (divs['data_referencia'] <= last_day_prev_month)
+        (df_div_mensal['mes'] >= start_period) &
+        (df_div_mensal['mes'] < first_this_month)
     )
-    total_divs = divs.loc[mask, 'valor'].sum()
+    total_divs = df_div_mensal.loc[mask, 'valor'].sum()
     return (total_divs / price) * 100 if price else 0
 
 DYS = {
@@ -155,10 +136,7 @@ st.markdown("""
 </style>
 """,unsafe_allow_html=True)
 
-with sqlite3.connect(db_path) as conn_im:
-    df_im = pd.read_sql(
-        "SELECT endereco FROM fiis_imoveis WHERE fii_id = ?", conn_im, params=(fiid,)
-    )
+df_im = imoveis[imoveis['fii_id'] == fiid]
 qtd_imoveis = len(df_im)
 
 # Dados do Fundo na tela
@@ -241,12 +219,7 @@ for col, period in zip(cols3, ['1M','3M','6M','12M']):
 
 st.columns(1)
 st.markdown("**Distribuições Mensais**")
-df_div = (divs.assign(
-    mes=divs['data_referencia']
-              .dt.to_period('M')
-              .dt.to_timestamp()
-)
-).groupby('mes')['valor'].sum().reset_index().tail(years_div*12)
+df_div = df_div_mensal[['mes', 'valor']].tail(years_div*12)
 
 if df_div.empty:
     st.info(f"Sem distribuição mensal nos últimos {years_div*12} meses.")
@@ -262,8 +235,6 @@ else:
 
 st.markdown("**Evolução da Cotação**")
 
-hc = df_cot[df_cot['data'] >= now - relativedelta(years=years_cot)]
-df_sem = (hc.set_index('data')['preco_fechamento'].resample('W-FRI').last().ffill().reset_index())
 fig_price = px.line(df_sem,x='data',y='preco_fechamento',labels={'data': 'Ano', 'preco_fechamento': 'R$'})
 fig_price.update_traces(hovertemplate='%{x|%d/%m/%Y}<br>R$ %{y:,.2f}<extra></extra>')
 x = df_sem['data'].map(pd.Timestamp.toordinal).values
@@ -276,18 +247,7 @@ fig_price.update_xaxes(range=[min_date, max_date], tickformat='%Y', dtick='M12')
 
 st.plotly_chart(fig_price, use_container_width=True)
 
-with sqlite3.connect(db_path) as conn_im:
-    df_imoveis = pd.read_sql(
-        """
-        SELECT area_m2,
-               num_unidades,
-               tx_ocupacao
-        FROM fiis_imoveis
-        WHERE fii_id = ?
-        """,
-        conn_im,
-        params=(fiid,)
-    )
+df_imoveis = imoveis[imoveis['fii_id'] == fiid]
 
 if not df_imoveis.empty:
     st.subheader("Imóveis")
@@ -1,35 +1,20 @@
 # 4_Ranking_dos_FIIs.py
 import streamlit as st
 import pandas as pd
-import sqlite3
-from pathlib import Path
 import plotly.graph_objects as go
 
+import dados
+import ranking
+
 st.set_page_config(page_title="Ranking dos FIIs" ,layout="wide", page_icon="🏆")
 st.title("🏅 Ranking: Top 10 FIIs por Métrica e por Tipo/Setor")
-DB_PATH = Path(__file__).parents[1] / "data" / "fiis.db"
-
-@st.cache_data
-def carregar_dados():
-    conn = sqlite3.connect(DB_PATH)
-    fiis = pd.read_sql("""
-        SELECT f.id, f.ticker, f.nome, s.nome AS setor, t.nome AS tipo
-        FROM fiis f
-        JOIN setor s ON f.setor_id = s.id
-        JOIN tipo_fii t ON f.tipo_id = t.id
-        WHERE f.ativo = 1
-    """, conn)
-    indicadores = pd.read_sql("""
-        SELECT fi.fii_id, f.ticker AS ticker_fii, i.nome AS indicador, fi.valor
-        FROM fiis_indicadores fi
-        JOIN indicadores i ON i.id = fi.indicador_id
-        JOIN fiis f ON f.id = fi.fii_id
-        WHERE fi.valor IS NOT NULL
-    """, conn)
-    conn.close()
-    return fiis, indicadores
-
-fiis, indicadores = carregar_dados()
+
+fiis = dados.carregar_fiis().dropna(subset=['setor', 'tipo'])
+# top 10 de cada (tipo, setor, métrica), calculado uma vez por versão do banco
+rankings = ranking.carregar_rankings()
+
+# nomes curtos nos títulos dos gráficos
+ABREVIACOES = {"Valor Patrimonial por Cota": "VPA"}
 
 # ── Sidebar de filtros ─────────────────────────────────────────
 st.sidebar.subheader("🔍 Filtros")
@@ -42,7 +27,7 @@ else:
     setores_op = sorted(fiis['setor'].unique())
 filtro_setor = st.sidebar.multiselect("Setores:", setores_op, default=[])
 
-metricas_disponiveis = sorted(indicadores['indicador'].unique())
+metricas_disponiveis = sorted(rankings['indicador'].unique())
 # exclui indicadores de dividendos e vacância
 metricas_disponiveis = [m for m in metricas_disponiveis
                         if 'Dividend' not in m and 'Vacância' not in m]
@@ -60,51 +45,88 @@ if filtro_tipo:
     fiis_filtrados = fiis_filtrados[fiis_filtrados['tipo'].isin(filtro_tipo)]
 if filtro_setor:
     fiis_filtrados = fiis_filtrados[fiis_filtrados['setor'].isin(filtro_setor)]
-ids_filtrados = fiis_filtrados['id'].tolist()
-
-df_validos = indicadores[indicadores['fii_id'].isin(ids_filtrados)].copy()
-# substitui nomes longos
-df_validos['indicador'] = df_validos['indicador'].replace({
-    "Valor Patrimonial por Cota": "VPA",
-})
 selected_mets = filtro_metrica or metricas_disponiveis
 
-def plot_top10(metrica, df_source, container, key):
-    df_i = df_source[df_source['indicador']==metrica].nlargest(10, 'valor')
+# Limites de renderização por rerun
+ORCAMENTO_GRAFICOS = 30   # figuras enviadas ao navegador, no máximo
+GRUPOS_POR_PAGINA  = 5    # grupos tipo × setor listados por página
+
+@st.cache_data(show_spinner=False)
+def figura_top10(metrica, tipos, setores, versao):
+    """Spec Plotly do top 10 (None se não houver dados), em cache por grupo, métrica e versão."""
+    df_i = ranking.top_n(rankings, metrica, list(tipos), list(setores))
     if df_i.empty:
-        container.info(f"Sem dados para {metrica}.")
-        return
+        return None
     fig = go.Figure(go.Bar(
         x=df_i['valor'],
-        y=df_i['ticker_fii'],
+        y=df_i['ticker'],
         orientation='h',
         hovertemplate="<b>%{y}</b><br>Valor: %{x:,.2f}<extra></extra>"
     ))
-    fig.update_layout(title={'text': metrica, 'x':0.5},
+    fig.update_layout(title={'text': ABREVIACOES.get(metrica, metrica), 'x':0.5},
                       xaxis_title="Valor",
                       yaxis_title="FII",
                       height=300,
                       yaxis=dict(autorange='reversed'))
-    container.plotly_chart(fig, use_container_width=True, key=key)
+    return fig.to_dict()
+
+graficos_enviados = 0
+
+def plot_top10(metrica, tipos, setores, container, key):
+    global graficos_enviados
+    if graficos_enviados >= ORCAMENTO_GRAFICOS:
+        return False
+    spec = figura_top10(metrica, tuple(tipos), tuple(setores), versao)
+    if spec is None:
+        container.info(f"Sem dados para {ABREVIACOES.get(metrica, metrica)}.")
+        return True
+    container.plotly_chart(spec, use_container_width=True, key=key)
+    graficos_enviados += 1
+    return True
+
+aviso_exibido = False
+
+def aviso_orcamento():
+    # uma vez por atualização, no primeiro ponto em que o orçamento acabou
+    global aviso_exibido
+    if aviso_exibido:
+        return
+    aviso_exibido = True
+    st.info(f"Limite de {ORCAMENTO_GRAFICOS} gráficos por atualização atingido. "
+            "Refine os filtros ou feche grupos abertos para ver os demais.")
+
+versao = dados.versao_banco()
 
 # ── Top 10 por Métrica ──────────────────────────────────────────
 st.subheader("📈 Top 10 por Métrica")
 cols_m = st.columns(2)
 for idx, metr in enumerate(selected_mets):
-    plot_top10(metr, df_validos, cols_m[idx%2], key=f"met-{metr}-{idx}")
+    if not plot_top10(metr, filtro_tipo, filtro_setor, cols_m[idx%2], key=f"met-{metr}-{idx}"):
+        aviso_orcamento()
+        break
 
 # ── Top 10 por Tipo e Setor ────────────────────────────────────
+# Gráficos montados só para os grupos abertos da página atual
 st.subheader("🏆 Top 10 por Tipo e Setor")
+grupos = []
 for tipo in (filtro_tipo or tipos):
-    st.markdown(f"### Tipo: {tipo}")
     setores_disp = sorted(fiis_filtrados[fiis_filtrados['tipo']==tipo]['setor'].unique())
-    for setor in (filtro_setor or setores_disp):
-        st.markdown(f"#### Setor: {setor}")
-        ids_grp = fiis_filtrados[(fiis_filtrados['tipo']==tipo)&(fiis_filtrados['setor']==setor)]['id']
-        df_grp = df_validos[df_validos['fii_id'].isin(ids_grp)]
-        if df_grp.empty:
-            st.write("Sem dados para este grupo.")
-            continue
-        cols_g = st.columns(2)
-        for idx, metr in enumerate(selected_mets):
-            plot_top10(metr, df_grp, cols_g[idx%2], key=f"grp-{tipo}-{setor}-{metr}")
+    grupos += [(tipo, setor) for setor in (filtro_setor or setores_disp)]
+
+n_paginas = max(1, -(-len(grupos) // GRUPOS_POR_PAGINA))
+pagina = st.number_input(f"Página de grupos (1–{n_paginas})", 1, n_paginas, 1) if n_paginas > 1 else 1
+inicio = (pagina - 1) * GRUPOS_POR_PAGINA
+
+for tipo, setor in grupos[inicio:inicio + GRUPOS_POR_PAGINA]:
+    st.markdown(f"#### {tipo} · {setor}")
+    tem_dados = ((rankings['tipo']==tipo) & (rankings['setor']==setor)).any()
+    if not tem_dados:
+        st.write("Sem dados para este grupo.")
+        continue
+    if not st.toggle("Mostrar gráficos", value=len(grupos) == 1, key=f"abrir-{tipo}-{setor}"):
+        continue
+    cols_g = st.columns(2)
+    for idx, metr in enumerate(selected_mets):
+        if not plot_top10(metr, [tipo], [setor], cols_g[idx%2], key=f"grp-{tipo}-{setor}-{metr}"):
+            aviso_orcamento()
+            break
@@ -0,0 +1,89 @@
+# 6_Pipeline.py
+import json
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+import dados
+
+st.set_page_config(page_title="Pipeline de Dados", page_icon="📈", layout="wide")
+st.title("📈 Pipeline de Dados: Execuções e Desempenho")
+
+# uma linha por (execução, etapa), gravada por scripts/setup.py em data/pipeline.db
+metricas = dados.carregar_metricas_pipeline()
+if metricas.empty:
+    st.info("Nenhuma execução registrada ainda. Rode `python scripts/setup.py` para popular a telemetria.")
+    st.stop()
+
+# ── Sidebar de filtros ─────────────────────────────────────────
+st.sidebar.subheader("🔍 Filtros")
+etapas = list(dict.fromkeys(metricas['etapa']))
+filtro_etapa = st.sidebar.multiselect("Etapas:", etapas, default=[])
+n_execucoes = st.sidebar.slider("Últimas execuções:", 5, 200, 30)
+
+ultimas = sorted(metricas['run_id'].unique())[-n_execucoes:]
+df = metricas[metricas['run_id'].isin(ultimas)]
+if filtro_etapa:
+    df = df[df['etapa'].isin(filtro_etapa)]
+rodadas = df[df['status'].isin(['ok', 'erro'])]
+
+# ── Última execução ────────────────────────────────────────────
+ultima = metricas[metricas['run_id'] == metricas['run_id'].max()]
+info = ultima.iloc[0]
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Última execução", info['inicio_execucao'].strftime("%d/%m/%Y %H:%M"), info['modo'])
+c2.metric("Duração total", f"{info['duracao_execucao_s']:.0f}s")
+c3.metric("Etapas com erro", int((ultima['status'] == 'erro').sum()))
+c4.metric("Falhas por ticker", int(ultima['falhas'].fillna(0).sum()))
+
+# ── Duração das etapas ao longo do tempo ───────────────────────
+st.subheader("⏱️ Duração por etapa")
+fig = px.line(
+    rodadas, x='inicio_execucao', y='duracao_s', color='etapa', markers=True,
+    labels={'inicio_execucao': 'Execução', 'duracao_s': 'Duração (s)', 'etapa': 'Etapa'},
+)
+fig.update_layout(hovermode='x unified')
+st.plotly_chart(fig, use_container_width=True)
+
+# ── Vazão e latência ───────────────────────────────────────────
+col_a, col_b = st.columns(2)
+with col_a:
+    st.subheader("🚚 Linhas inseridas por segundo")
+    vazao = rodadas.assign(
+        linhas_s=rodadas['linhas_inseridas'] / rodadas['duracao_s'].where(rodadas['duracao_s'] > 0)
+    ).dropna(subset=['linhas_s'])
+    st.plotly_chart(
+        px.line(vazao, x='inicio_execucao', y='linhas_s', color='etapa', markers=True,
+                labels={'inicio_execucao': 'Execução', 'linhas_s': 'Linhas/s', 'etapa': 'Etapa'}),
+        use_container_width=True,
+    )
+with col_b:
+    st.subheader("🌐 Latência HTTP p95")
+    http = rodadas.dropna(subset=['latencia_p95_ms'])
+    st.plotly_chart(
+        px.line(http, x='inicio_execucao', y='latencia_p95_ms', color='etapa', markers=True,
+                labels={'inicio_execucao': 'Execução', 'latencia_p95_ms': 'p95 (ms)', 'etapa': 'Etapa'}),
+        use_container_width=True,
+    )
+
+# ── Detalhe da última execução ─────────────────────────────────
+st.subheader("📋 Etapas da última execução")
+colunas = {
+    'etapa': 'Etapa', 'status': 'Status', 'duracao_s': 'Duração (s)',
+    'http_requisicoes': 'Requisições', 'http_bytes': 'Bytes',
+    'latencia_p50_ms': 'p50 (ms)', 'latencia_p95_ms': 'p95 (ms)', 'latencia_p99_ms': 'p99 (ms)',
+    'linhas_buscadas': 'Buscadas', 'linhas_inseridas': 'Inseridas', 'linhas_puladas': 'Puladas',
+    'falhas': 'Falhas',
+}
+st.dataframe(ultima[list(colunas)].rename(columns=colunas), hide_index=True, use_container_width=True)
+
+com_falhas = ultima.dropna(subset=['falhas_detalhe'])
+if not com_falhas.empty:
+    with st.expander("❌ Falhas por ticker"):
+        linhas = [
+            {'Etapa': row.etapa, 'Ticker': ticker, 'Erro': erro}
+            for row in com_falhas.itertuples()
+            for ticker, erro in json.loads(row.falhas_detalhe).items()
+        ]
+        st.dataframe(pd.DataFrame(linhas), hide_index=True, use_container_width=True)
@@ -0,0 +1,81 @@
+"""
+Rankings top-N pré-calculados para a página Ranking dos FIIs.
+
+Todas as listas (tipo, setor, indicador) são calculadas de uma vez, numa
+única ordenação + groupby sobre o fii_snapshot em formato longo, e ficam em
+cache por versão do banco (ver dados.versao_banco). Como o top-N de uma
+união de grupos está sempre contido na união dos top-N de cada grupo, os
+rankings filtrados por vários tipos/setores saem dessas listas, sem voltar
+à base inteira.
+"""
+import pandas as pd
+import streamlit as st
+
+import dados
+
+# coluna do fii_snapshot -> (nome exibido, ascendente: menor é melhor)
+METRICAS = {
+    'preco_atual': ('Preço Atual',                False),
+    'pl':          ('Patrimônio Líquido',         False),
+    'qt_cotas':    ('Quantidade de Cotas',        False),
+    'qt_cotistas': ('Quantidade de Cotistas',     False),
+    'vpa':         ('Valor Patrimonial por Cota', False),
+    'pvp':         ('P/VP',                       True),
+    'dy_12m':      ('DY 12M',                     False),
+    'cap_rate':    ('Cap Rate',                   False),
+    'qtd_imoveis': ('Número de Imóveis',          False),
+}
+
+TOP_N = 10
+
+
+@st.cache_data(show_spinner=False)
+def _calcular_rankings(n, versao):
+    fiis = dados.carregar_fiis().dropna(subset=['setor', 'tipo'])
+    nomes = {col: nome for col, (nome, _) in METRICAS.items()}
+    ascendentes = [nome for nome, asc in METRICAS.values() if asc]
+
+    longo = (
+        dados.carregar_snapshot()
+        .merge(fiis[['id', 'ticker', 'tipo', 'setor']], left_on='fii_id', right_on='id')
+        .rename(columns=nomes)
+        .melt(id_vars=['fii_id', 'ticker', 'tipo', 'setor'],
+              value_vars=list(nomes.values()),
+              var_name='indicador', value_name='valor')
+        .dropna(subset=['valor'])
+    )
+    asc = longo['indicador'].isin(ascendentes)
+    # nas métricas "menor é melhor", valores <= 0 são dado ausente/inválido
+    longo = longo[~asc | (longo['valor'] > 0)]
+    asc = longo['indicador'].isin(ascendentes)
+    # chave única de ordenação: sempre crescente, invertendo as descendentes
+    longo = longo.assign(ordem=longo['valor'].where(asc, -longo['valor']))
+
+    top = (
+        longo.sort_values(['indicador', 'ordem', 'ticker'], kind='stable')
+        .groupby(['tipo', 'setor', 'indicador'], sort=False)
+        .head(n)
+    )
+    top = top.assign(posicao=top.groupby(['tipo', 'setor', 'indicador']).cumcount() + 1)
+    return top.reset_index(drop=True)
+
+
+def carregar_rankings(n=TOP_N):
+    """
+    Top-N de cada (tipo, setor, indicador): colunas tipo, setor, indicador,
+    fii_id, ticker, valor, ordem e posicao, já na ordem do ranking.
+    """
+    return _calcular_rankings(n, dados.versao_banco())
+
+
+def top_n(rankings, indicador, tipos=None, setores=None, n=TOP_N):
+    """
+    Top-N de um indicador entre os grupos escolhidos (todos, se vazio),
+    combinando as listas pré-calculadas de cada grupo.
+    """
+    mask = rankings['indicador'] == indicador
+    if tipos:
+        mask &= rankings['tipo'].isin(tipos)
+    if setores:
+        mask &= rankings['setor'].isin(setores)
+    return rankings[mask].sort_values(['ordem', 'ticker'], kind='stable').head(n)
@@ -4,6 +4,9 @@ from pathlib import Path
 from datetime import datetime
 import time
 
+from migrar import marcar_alteracao
+from telemetria import METRICAS
+
 JSON_PATH = Path(__file__).resolve().parent.parent / "database" / "dados_fundos.json"
 DB_PATH = Path(__file__).resolve().parent.parent / "data" / "fiis.db"
 
@@ -25,7 +28,7 @@ def calcular_indicadores():
     with open(JSON_PATH, "r", encoding="utf-8") as f:
         dados = json.load(f).get("data", [])
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     cur = conn.cursor()
 
     for nome, desc in INDICADORES_RELEVANTES:
@@ -56,7 +59,7 @@ def calcular_indicadores():
                 # valor_formatado removido (não necessário para banco)
                 data_ref = datetime.strptime("01/" + data_cotas, "%d/%m/%Y").date().isoformat()
                 cur.execute("""
-                    INSERT INTO fiis_indicadores (fii_id, indicador_id, data_referencia, valor)
+                    INSERT OR REPLACE INTO fiis_indicadores (fii_id, indicador_id, data_referencia, valor)
                     VALUES (?, ?, ?, ?)
                 """, (fii_id, id_indicadores["Quantidade de Cotas"], data_ref, qtd_cotas))
                 inseridos += 1
@@ -68,7 +71,7 @@ def calcular_indicadores():
                 patrimonio = float(patrimonio)
                 data_ref = datetime.strptime("01/" + data_patr, "%d/%m/%Y").date().isoformat()
                 cur.execute("""
-                    INSERT INTO fiis_indicadores (fii_id, indicador_id, data_referencia, valor)
+                    INSERT OR REPLACE INTO fiis_indicadores (fii_id, indicador_id, data_referencia, valor)
                     VALUES (?, ?, ?, ?)
                 """, (fii_id, id_indicadores["Patrimônio Líquido"], data_ref, patrimonio))
                 inseridos += 1
@@ -81,16 +84,20 @@ def calcular_indicadores():
                 # valor_formatado removido (não necessário para banco)
                 data_ref = datetime.strptime("01/" + data_cotistas, "%d/%m/%Y").date().isoformat()
                 cur.execute("""
-                    INSERT INTO fiis_indicadores (fii_id, indicador_id, data_referencia, valor)
+                    INSERT OR REPLACE INTO fiis_indicadores (fii_id, indicador_id, data_referencia, valor)
                     VALUES (?, ?, ?, ?)
                 """, (fii_id, id_indicadores["Quantidade de Cotistas"], data_ref, cotistas))
                 inseridos += 1
 
         except Exception as e:
             print(f"Erro ao processar {ticker}: {e}")
+            METRICAS.falha(ticker, e)
 
+    if inseridos:
+        marcar_alteracao(conn, "fiis_indicadores")
     conn.commit()
     conn.close()
+    METRICAS.linhas(buscadas=len(dados), inseridas=inseridos)
     print(f"Indicadores formatados e inseridos: {inseridos}")
 
 if __name__ == '__main__':
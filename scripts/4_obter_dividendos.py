@@ -1,200 +1,230 @@
-import os
+import argparse
+import asyncio
 import time
-import requests
 import sqlite3
 from datetime import datetime, date, timedelta
 from pathlib import Path
 from calendar import monthrange
-from dotenv import load_dotenv
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
-load_dotenv()
-EMAIL = os.getenv("PLEXA_EMAIL")
-SENHA = os.getenv("PLEXA_SENHA")
-TOKEN = os.getenv("PLEXA_TOKEN")
+from agregados import atualizar_dividendos_mensais
+from falhas import limpar_falha, registrar_falha, tickers_descartados, tickers_pendentes
+from limitador import buscar_concorrente
+from migrar import aplicar_migracoes, marcar_alteracao
+from plexa_client import ClientePlexa
+from telemetria import METRICAS
 
-LOGIN_ENDPOINT     = 'https://api.plexa.com.br/site/login'
-DIVIDENDO_ENDPOINT = 'https://api.plexa.com.br/json/dividendo/{ticker}/{meses}'
+DIVIDENDO_ENDPOINT = '/json/dividendo/{ticker}/{meses}'
+ETAPA = 'dividendos'   # nome da etapa em ingest_failures (o mesmo do setup.py)
 
 ROOT_DIR      = Path(__file__).resolve().parent.parent
 DB_PATH       = ROOT_DIR / "data" / "fiis.db"
 
-PAUSA         = 1        # segundos entre chamadas
-MESES_BUSCA   = 5000     # quantidade de meses para buscar
-TIMEOUT       = 15       # timeout HTTP
-MAX_RETRIES   = 3
-BACKOFF_FACTOR= 0.3
+PAUSA         = 1        # segundos entre chamadas (modo sequencial)
+CONCORRENCIA  = 8        # requisições simultâneas (modo concorrente)
+RPS           = 5        # requisições por segundo (modo concorrente)
+MESES_BUSCA   = 5000     # histórico completo, só para fundos sem dividendo gravado
+SOBREPOSICAO_MESES = 2   # meses já gravados que são pedidos de novo (correções)
 
 
-def create_session():
-    session = requests.Session()
-    retry = Retry(
-        total=MAX_RETRIES,
-        backoff_factor=BACKOFF_FACTOR,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET", "POST"]
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
-
 def abrir_conexao_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     conn.execute("PRAGMA journal_mode=WAL;")
     return conn
 
-def autenticar(session):
-    """Reautentica e atualiza TOKEN no .env"""
-    global TOKEN
-    resp = session.post(
-        LOGIN_ENDPOINT,
-        json={"usuEmail": EMAIL, "usuSenha": SENHA},
-        headers={"Content-Type": "application/json"},
-        timeout=TIMEOUT
-    )
-    resp.raise_for_status()
-    data = resp.json()
-    if 'accessToken' not in data:
-        raise RuntimeError(f"Falha na autenticação: {data}")
-    TOKEN = data['accessToken']
-    # Atualiza .env
-    env_path = ROOT_DIR / ".env"
-    lines = env_path.read_text(encoding='utf-8').splitlines()
-    with open(env_path, 'w', encoding='utf-8') as f:
-        for l in lines:
-            if l.startswith('PLEXA_TOKEN='):
-                f.write(f"PLEXA_TOKEN={TOKEN}\n")
-            else:
-                f.write(l + "\n")
-
-def obter_dividendos(session, ticker, meses=MESES_BUSCA):
-    """Chama o endpoint e trata 401 para reautenticar automaticamente."""
-    url = DIVIDENDO_ENDPOINT.format(ticker=ticker, meses=meses)
-    headers = {"Authorization": f"Bearer {TOKEN}"}
-    resp = session.get(url, headers=headers, timeout=TIMEOUT)
-    if resp.status_code == 401:
-        autenticar(session)
-        headers["Authorization"] = f"Bearer {TOKEN}"
-        resp = session.get(url, headers=headers, timeout=TIMEOUT)
-    resp.raise_for_status()
-    payload = resp.json()
+def obter_dividendos(cliente, ticker, meses=MESES_BUSCA):
+    """Chama o endpoint; retries, token e 401 ficam a cargo do ClientePlexa."""
+    payload = cliente.get_json('dividendo', DIVIDENDO_ENDPOINT.format(ticker=ticker, meses=meses))
     return payload.get('data', []) if payload.get('ok') else []
 
-def salvar_dividendos(pausa=PAUSA):
-    conn = abrir_conexao_db()
-    cur  = conn.cursor()
-    session = create_session()
+def meses_janela(ultima, hoje=None):
+    """Meses a pedir: desde o último mês gravado, com sobreposição; histórico completo se não houver."""
+    if not ultima:
+        return MESES_BUSCA
+    hoje = hoje or date.today()
+    ult = date.fromisoformat(ultima)
+    meses = (hoje.year - ult.year) * 12 + (hoje.month - ult.month) + SOBREPOSICAO_MESES
+    return max(1, min(meses, MESES_BUSCA))
+
+def inicio_sobreposicao(ultima):
+    """Primeiro dia do mês a partir do qual os dividendos recebidos são regravados."""
+    if not ultima:
+        return None
+    ult = date.fromisoformat(ultima)
+    total = ult.year * 12 + (ult.month - 1) - SOBREPOSICAO_MESES + 1
+    return date(total // 12, total % 12 + 1, 1).isoformat()
+
+def montar_registros(fii_id, ind_id, entries, desde):
+    """Filtra RENDIMENTO e converte os itens da API em registros (a partir de `desde`, se informado)."""
+    hoje       = date.today()
+    ultimo_mes = (hoje.replace(day=1) - timedelta(days=1))
+    registros = []
+    for item in entries:
+        # filtra apenas RENDIMENTO
+        tipo_key = next((k for k in item if k.strip().lower()=='tipo'), None)
+        tipo = item.get(tipo_key,'') if tipo_key else ''
+        if 'RENDIMENTO' not in tipo.upper():
+            continue
+
+        # data_referencia
+        mes_ref = item.get('mesReferencia','')
+        try:
+            m, y = mes_ref.split('/')
+            ultimo_dia = monthrange(int(y), int(m))[1]
+            dt = date(int(y), int(m), ultimo_dia)
+        except:
+            try:
+                dt = datetime.strptime(item.get('dataCom',''), '%d/%m/%Y').date()
+            except:
+                continue
 
-    # Garante índice de unicidade
-    cur.execute("""
-        CREATE UNIQUE INDEX IF NOT EXISTS ux_divs_unicidade
-        ON fiis_indicadores(fii_id, indicador_id, data_referencia)
-    """)
+        # não grava meses futuros
+        if dt > ultimo_mes:
+            continue
 
-    # Carrega FIIs
-    cur.execute("SELECT id, ticker FROM fiis")
-    fiis = cur.fetchall()
+        date_ref = dt.isoformat()
+        # pula o que já está gravado fora da sobreposição
+        if desde and date_ref < desde:
+            continue
 
+        # valor numérico
+        try:
+            valor = float(item.get('valor','').replace('.','').replace(',','.'))
+        except:
+            continue
+
+        registros.append((fii_id, ind_id, date_ref, valor))
+    return registros
+
+def gravar_dividendos(conn, fii_id, ticker, ind_id, entries, ultima):
+    """Grava os dividendos de um fundo e atualiza dividendos_mensais; retorna quantos foram gravados."""
+    cur = conn.cursor()
+    print(f"   → {len(entries)} registros na API")
+
+    registros = montar_registros(fii_id, ind_id, entries, inicio_sobreposicao(ultima))
+    print(f"   → {len(registros)} para gravar")
+    METRICAS.linhas(buscadas=len(entries), puladas=len(entries) - len(registros))
+    if not registros:
+        # nada a gravar: o ticker sai da fila de falhas numa transação própria
+        with conn:
+            limpar_falha(conn, ETAPA, ticker)
+        return 0
+    try:
+        cur.executemany(
+            # meses da sobreposição já gravados são atualizados (correções)
+            "INSERT INTO fiis_indicadores(fii_id, indicador_id, data_referencia, valor) VALUES (?,?,?,?) "
+            "ON CONFLICT (fii_id, indicador_id, data_referencia) DO UPDATE SET valor = excluded.valor",
+            registros
+        )
+        gravados = cur.rowcount
+        # recalcula só os meses recebidos agora
+        atualizar_dividendos_mensais(cur, fii_id, [r[2] for r in registros])
+        marcar_alteracao(conn, "fiis_indicadores")
+        # sai da fila de falhas no mesmo commit da gravação
+        limpar_falha(conn, ETAPA, ticker)
+        conn.commit()
+        METRICAS.linhas(inseridas=gravados)
+        print(f"   + {gravados} gravados")
+        return gravados
+    except Exception as e:
+        conn.rollback()
+        print(f"   ⚠ Erro ao inserir no banco: {e}")
+        registrar_falha(conn, ETAPA, ticker, e)
+        conn.commit()
+        return 0
+
+def obter_indicador_dividendos(conn):
     # Busca ou cria indicador 'Dividendos'
+    cur = conn.cursor()
     cur.execute("SELECT id FROM indicadores WHERE LOWER(nome)='dividendos'")
     row = cur.fetchone()
     if row:
-        ind_id = row[0]
-    else:
-        cur.execute(
-            "INSERT INTO indicadores(nome,descricao) VALUES(?,?)",
-            ("Dividendos", "Rendimentos distribuídos mensalmente")
-        )
-        ind_id = cur.lastrowid
-
-    total_api      = 0
-    total_inserted = 0
+        return row[0]
+    cur.execute(
+        "INSERT INTO indicadores(nome,descricao) VALUES(?,?)",
+        ("Dividendos", "Rendimentos distribuídos mensalmente")
+    )
+    conn.commit()
+    return cur.lastrowid
 
-    for fii_id, ticker in fiis:
+def salvar_sequencial(conn, cliente, fiis, ind_id, pausa):
+    """Um fundo por vez, com pausa fixa entre chamadas. Retorna (analisados, inseridos)."""
+    total_api = total_inserted = 0
+    for fii_id, ticker, ultima in fiis:
         print(f"\n🔎 Processando {ticker}…")
         try:
-            entries = obter_dividendos(session, ticker, meses=MESES_BUSCA)
+            entries = obter_dividendos(cliente, ticker, meses=meses_janela(ultima))
         except Exception as e:
             print(f"   ⚠ Erro ao obter {ticker}: {e}")
+            registrar_falha(conn, ETAPA, ticker, e)
+            conn.commit()
             time.sleep(pausa)
             continue
-
         total_api += len(entries)
-        print(f"   → {len(entries)} registros na API")
-
-        # data de referência máximo já gravado
-        cur.execute(
-            "SELECT MAX(data_referencia) FROM fiis_indicadores WHERE fii_id=? AND indicador_id=?",
-            (fii_id, ind_id)
-        )
-        ultima = cur.fetchone()[0]
-
-        registros = []
-        for item in entries:
-            # filtra apenas RENDIMENTO
-            tipo_key = next((k for k in item if k.strip().lower()=='tipo'), None)
-            tipo = item.get(tipo_key,'') if tipo_key else ''
-            if 'RENDIMENTO' not in tipo.upper():
-                continue
-
-            # data_referencia
-            mes_ref = item.get('mesReferencia','')
-            try:
-                m, y = mes_ref.split('/')
-                ultimo_dia = monthrange(int(y), int(m))[1]
-                dt = date(int(y), int(m), ultimo_dia)
-            except:
-                try:
-                    dt = datetime.strptime(item.get('dataCom',''), '%d/%m/%Y').date()
-                except:
-                    continue
-
-            # não grava meses futuros
-            hoje      = date.today()
-            ultimo_mes= (hoje.replace(day=1) - timedelta(days=1))
-            if dt > ultimo_mes:
-                continue
-
-            date_ref = dt.isoformat()
-            # pula duplicatas e já gravados
-            if ultima and date_ref <= ultima:
-                continue
-
-            # valor numérico
-            try:
-                valor = float(item.get('valor','').replace('.','').replace(',','.'))
-            except:
-                continue
-
-            registros.append((fii_id, ind_id, date_ref, valor))
-
-        print(f"   → {len(registros)} novos para inserir")
-        if registros:
-            try:
-                cur.executemany(
-                    # ignora duplicatas pelo índice único
-                    "INSERT OR IGNORE INTO fiis_indicadores(fii_id, indicador_id, data_referencia, valor) VALUES (?,?,?,?)",
-                    registros
-                )
-                conn.commit()
-                inseridos = cur.rowcount
-                total_inserted += inseridos
-                print(f"   + {inseridos} inseridos")
-            except Exception as e:
-                print(f"   ⚠ Erro ao inserir no banco: {e}")
-
+        total_inserted += gravar_dividendos(conn, fii_id, ticker, ind_id, entries, ultima)
         if pausa:
             time.sleep(pausa)
+    return total_api, total_inserted
+
+async def salvar_concorrente(conn, cliente, fiis, ind_id, concorrencia, rps):
+    """Requisições em paralelo sob token bucket; grava cada fundo assim que sua resposta chega."""
+    total_api = total_inserted = 0
+    buscar = lambda fii: obter_dividendos(cliente, fii[1], meses=meses_janela(fii[2]))
+    async for (fii_id, ticker, ultima), entries, erro in buscar_concorrente(fiis, buscar, concorrencia, rps):
+        print(f"\n🔎 {ticker}")
+        if erro:
+            print(f"   ⚠ Erro ao obter {ticker}: {erro}")
+            registrar_falha(conn, ETAPA, ticker, erro)
+            conn.commit()
+            continue
+        total_api += len(entries)
+        total_inserted += gravar_dividendos(conn, fii_id, ticker, ind_id, entries, ultima)
+    return total_api, total_inserted
+
+def salvar_dividendos(cliente, pausa=PAUSA, sequencial=False, concorrencia=CONCORRENCIA, rps=RPS,
+                      so_falhas=False):
+    conn = abrir_conexao_db()
+    aplicar_migracoes(conn)
+
+    # Carrega FIIs com a última data de dividendo já gravada (define a janela pedida)
+    ind_id = obter_indicador_dividendos(conn)
+    fiis = conn.execute("""
+        SELECT f.id, f.ticker,
+               (SELECT MAX(fi.data_referencia) FROM fiis_indicadores fi
+                WHERE fi.fii_id = f.id AND fi.indicador_id = ?)
+        FROM fiis f
+    """, (ind_id,)).fetchall()
+
+    if so_falhas:
+        pendentes = tickers_pendentes(conn, ETAPA)
+        fiis = [f for f in fiis if f[1] in pendentes]
+        print(f"Reprocessando só as falhas pendentes: {len(fiis)} fundos")
+    else:
+        descartados = tickers_descartados(conn, ETAPA)
+        fiis = [f for f in fiis if f[1] not in descartados]
+        if descartados:
+            print(f"{len(descartados)} fundos descartados por falhas seguidas (falhas.py --reativar)")
+
+    if sequencial:
+        total_api, total_inserted = salvar_sequencial(conn, cliente, fiis, ind_id, pausa)
+    else:
+        print(f"Modo concorrente: {concorrencia} em paralelo, até {rps} req/s")
+        total_api, total_inserted = asyncio.run(
+            salvar_concorrente(conn, cliente, fiis, ind_id, concorrencia, rps)
+        )
 
     conn.close()
     print(f"\n✅ Total analisados: {total_api}")
-    print(f"✅ Total inseridos: {total_inserted}")
+    print(f"✅ Total gravados: {total_inserted}")
 
 if __name__ == '__main__':
-    # autentica antes, se necessário
-    session = create_session()
-    if not TOKEN:
-        autenticar(session)
-    salvar_dividendos()
+    ap = argparse.ArgumentParser(description="Importa dividendos da Plexa.")
+    ap.add_argument("--sequencial", action="store_true", help="um fundo por vez, com pausa fixa")
+    ap.add_argument("--concorrencia", type=int, default=CONCORRENCIA)
+    ap.add_argument("--rps", type=float, default=RPS)
+    ap.add_argument("--so-falhas", action="store_true",
+                    help="busca só os fundos que falharam antes e já podem ser retentados")
+    args = ap.parse_args()
+    cliente = ClientePlexa(pool=args.concorrencia)
+    salvar_dividendos(cliente, sequencial=args.sequencial, concorrencia=args.concorrencia, rps=args.rps,
+                      so_falhas=args.so_falhas)
+    cliente.imprimir_metricas()
@@ -1,159 +1,280 @@
-import os
+import argparse
+import asyncio
+import re
 import time
-import requests
 import sqlite3
-from datetime import datetime
+from datetime import date, timedelta
+from itertools import compress, repeat
+from operator import itemgetter
 from pathlib import Path
-from dotenv import load_dotenv
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
-# Carrega variáveis de ambiente
-load_dotenv()
-EMAIL = os.getenv("PLEXA_EMAIL")
-SENHA = os.getenv("PLEXA_SENHA")
-TOKEN = os.getenv("PLEXA_TOKEN")
+import numpy as np
+
+from agregados import atualizar_barras
+from falhas import limpar_falha, registrar_falha, tickers_descartados, tickers_pendentes
+from limitador import buscar_concorrente
+from migrar import aplicar_migracoes, marcar_alteracao
+from plexa_client import ClientePlexa
+from pregoes import pregao_anterior, ultimo_pregao
+from telemetria import METRICAS
 
 # Endpoints
-LOGIN_ENDPOINT = 'https://api.plexa.com.br/site/login'
-COTACAO_ENDPOINT = 'https://api.plexa.com.br/json/historico/{ticker}/{dias}'
+COTACAO_ENDPOINT = '/json/historico/{ticker}/{dias}'
+ETAPA = 'cotacoes'   # nome da etapa em ingest_failures (o mesmo do setup.py)
 
 # Configurações
 ROOT_DIR = Path(__file__).resolve().parent.parent
 DB_PATH = ROOT_DIR / "data" / "fiis.db"
-PAUSA = 1           # segundos entre chamadas
-DIAS_BUSCA = 5000     # últimos dias
-TIMEOUT = 15        # segundos para requisição
-MAX_RETRIES = 3     # tentativas de retry
-BACKOFF_FACTOR = 0.3
-
-# Cria sessão com retries
-def create_session():
-    session = requests.Session()
-    retry = Retry(
-        total=MAX_RETRIES,
-        backoff_factor=BACKOFF_FACTOR,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["GET", "POST"]
-    )
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
-
-# Autentica e atualiza token no .env
-def autenticar(session):
-    global TOKEN
-    resp = session.post(
-        LOGIN_ENDPOINT,
-        json={"usuEmail": EMAIL, "usuSenha": SENHA},
-        headers={"Content-Type": "application/json"},
-        timeout=TIMEOUT
-    )
-    resp.raise_for_status()
-    data = resp.json()
-    if 'accessToken' in data:
-        TOKEN = data['accessToken']
-        env_path = ROOT_DIR / ".env"
-        lines = env_path.read_text(encoding='utf-8').splitlines()
-        with open(env_path, 'w', encoding='utf-8') as f:
-            for line in lines:
-                if line.startswith('PLEXA_TOKEN='):
-                    f.write(f"PLEXA_TOKEN={TOKEN}\n")
-                else:
-                    f.write(line + "\n")
-        print("✔ Token atualizado no .env")
-    else:
-        raise RuntimeError(f"Falha na autenticação: {data}")
+PAUSA = 1           # segundos entre chamadas (modo sequencial)
+CONCORRENCIA = 8    # requisições simultâneas (modo concorrente)
+RPS = 5             # requisições por segundo (modo concorrente)
+DIAS_BUSCA = 5000     # histórico completo, só para fundos sem cotação gravada
+SOBREPOSICAO_DIAS = 7 # dias já gravados que são pedidos de novo (correções)
 
 # Abre conexão SQLite com WAL
 def abrir_conexao_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     conn.execute("PRAGMA journal_mode=WAL;")
     return conn
 
-# Obtém cotações com retries e tratamento de erros
-def obter_cotacoes(session, ticker, dias=DIAS_BUSCA):
-    url = COTACAO_ENDPOINT.format(ticker=ticker, dias=dias)
-    headers = {"Authorization": f"Bearer {TOKEN}"}
-    resp = session.get(url, headers=headers, timeout=TIMEOUT)
-    if resp.status_code == 401:
-        autenticar(session)
-        headers["Authorization"] = f"Bearer {TOKEN}"
-        resp = session.get(url, headers=headers, timeout=TIMEOUT)
-    resp.raise_for_status()
-    payload = resp.json()
+# Obtém cotações (retries, token e 401 tratados pelo ClientePlexa)
+def obter_cotacoes(cliente, ticker, dias=DIAS_BUSCA):
+    payload = cliente.get_json('historico', COTACAO_ENDPOINT.format(ticker=ticker, dias=dias))
     return payload.get('data', []) if payload.get('ok') else []
 
-# Salva cotações incrementalmente
-def salvar_cotacoes():
-    print(f"🚀 Iniciando importação de cotações em {DB_PATH}")
-    conn = abrir_conexao_db()
+# Janela a pedir: desde a última cotação gravada, com sobreposição;
+# histórico completo para fundos novos. Quando só falta o último pregão
+# (a atualização diária), pede só os dias desde a última cotação gravada,
+# sem sobreposição; as correções entram na próxima janela com lacuna ou
+# com --completo
+def dias_janela(ultima, hoje=None, pregao=None):
+    if not ultima:
+        return DIAS_BUSCA
+    hoje = hoje or date.today()
+    ult = date.fromisoformat(ultima)
+    if ult == pregao_anterior(pregao or ultimo_pregao()):
+        return max(1, (hoje - ult).days + 1)
+    dias = (hoje - ult).days + SOBREPOSICAO_DIAS
+    return max(1, min(dias, DIAS_BUSCA))
+
+# Início da sobreposição: pregões a partir daqui são regravados
+def inicio_sobreposicao(ultima):
+    if not ultima:
+        return None
+    return (date.fromisoformat(ultima) - timedelta(days=SOBREPOSICAO_DIAS)).isoformat()
+
+# Campos do payload, na ordem das colunas gravadas em cotacoes
+CAMPOS = ['data', 'fechamento', 'abertura', 'maxima', 'minima', 'totNegocios', 'qtdNegociada', 'volume']
+TIPOS  = [float, float, float, float, int, int, float]
+TRADUCAO_BR = str.maketrans({'.': None, ',': '.'})   # '1.234,56' -> '1234.56'
+RE_DATA = re.compile(r'\d{2}/\d{2}/\d{4}')
+RE_DATAS = re.compile(r'\d{2}/\d{2}/\d{4}(?: \d{2}/\d{2}/\d{4})*')
+ORDEM_ISO = [6, 7, 8, 9, 2, 3, 4, 2, 0, 1, 10]   # 'DD/MM/AAAA ' -> 'AAAA/MM/DD '
+DIAS_MES = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+def valor_br(texto, tipo):
+    try:
+        return tipo(texto.translate(TRADUCAO_BR))
+    except (AttributeError, ValueError):
+        return None
+
+def coluna_br(valores, tipo):
+    """
+    Converte uma coluna inteira de números no formato brasileiro de uma vez
+    (join + translate + split + map, tudo em C). Se a coluna tiver valores
+    vazios ou inválidos, converte item a item, com None nos inválidos.
+    """
+    try:
+        convertidos = list(map(tipo, ' '.join(valores).translate(TRADUCAO_BR).split()))
+        if len(convertidos) == len(valores):
+            return convertidos
+    except (TypeError, ValueError):
+        pass
+    return [valor_br(v, tipo) for v in valores]
+
+def data_iso(d):
+    """DD/MM/AAAA -> AAAA-MM-DD; '' se fora do formato ou impossível (31/02, 00/13)."""
+    if not RE_DATA.fullmatch(d):
+        return ''
+    iso = d[6:10] + '-' + d[3:5] + '-' + d[:2]
+    try:
+        date.fromisoformat(iso)
+    except ValueError:
+        return ''
+    return iso
+
+def datas_validas(matriz):
+    """Máscara das linhas da matriz n × 11 de dígitos 'DD/MM/AAAA ' com dia e mês possíveis."""
+    d = matriz.astype(np.int16) - ord('0')
+    dia = d[:, 0] * 10 + d[:, 1]
+    mes = d[:, 3] * 10 + d[:, 4]
+    ano = d[:, 6] * 1000 + d[:, 7] * 100 + d[:, 8] * 10 + d[:, 9]
+    bissexto = (ano % 4 == 0) & ((ano % 100 != 0) | (ano % 400 == 0))
+    ultimo_dia = DIAS_MES[np.clip(mes, 0, 12)] + (bissexto & (mes == 2))
+    return (mes >= 1) & (mes <= 12) & (dia >= 1) & (dia <= ultimo_dia)
+
+def coluna_datas(datas):
+    """
+    DD/MM/AAAA -> AAAA-MM-DD para a coluna inteira. Quando todas as datas
+    estão no formato, reordena os bytes como uma matriz n × 11 no numpy e
+    confere dia/mês na mesma matriz; senão, converte item a item. Datas
+    inválidas ou impossíveis viram ''.
+    """
+    texto = ' '.join(datas) + ' '
+    if RE_DATAS.fullmatch(texto, 0, len(texto) - 1) and texto.isascii():
+        matriz = np.frombuffer(texto.encode('ascii'), np.uint8).reshape(-1, 11)
+        iso = matriz[:, ORDEM_ISO].tobytes().decode('ascii').replace('/', '-').split()
+        validas = datas_validas(matriz)
+        if validas.all():
+            return iso
+        return [d if ok else '' for d, ok in zip(iso, validas.tolist())]
+    return [data_iso(d) for d in datas]
+
+# Converte o payload em colunas numa única passada (a partir de `desde`, se informado).
+# Retorna (quantidade, data mais antiga, gerador de registros para o executemany)
+def montar_registros(fii_id, dados, desde):
+    if not dados:
+        return 0, None, iter(())
+    datas, *numericas = zip(*map(itemgetter(*CAMPOS), dados))
+
+    # datas inválidas e anteriores a `desde` ficam de fora
+    iso = coluna_datas(datas)
+    manter = [d >= desde for d in iso] if desde else [d != '' for d in iso]
+    n = sum(manter)
+    if not n:
+        return 0, None, iter(())
+
+    colunas = [coluna_br(col, tipo) for col, tipo in zip(numericas, TIPOS)]
+    iso = list(compress(iso, manter))
+    registros = zip(repeat(fii_id), iso, *(compress(col, manter) for col in colunas))
+    return n, min(iso), registros
+
+# Grava as cotações de um fundo e atualiza as barras; retorna quantas foram gravadas
+def gravar_cotacoes(conn, fii_id, ticker, dados, ultima):
     cur = conn.cursor()
-    session = create_session()
+    print(f"   → {len(dados)} itens brutos para {ticker}")
 
-    cur.execute("SELECT id, ticker FROM fiis")
-    fiis = cur.fetchall()
-    print(f"Total FIIs: {len(fiis)}")
+    n, primeira, registros = montar_registros(fii_id, dados, inicio_sobreposicao(ultima))
+    print(f"   → {n} registros para gravar")
+    METRICAS.linhas(buscadas=len(dados), puladas=len(dados) - n)
+    if not n:
+        # nada a gravar: o ticker sai da fila de falhas numa transação própria
+        with conn:
+            limpar_falha(conn, ETAPA, ticker)
+        return 0
+    try:
+        cur.executemany(
+            # pregões da sobreposição já gravados são atualizados (correções)
+            "INSERT INTO cotacoes (fii_id, data, preco_fechamento, abertura, maxima, minima, totNegocios, qtdNegociada, volume) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (fii_id, data) DO UPDATE SET "
+            "preco_fechamento = excluded.preco_fechamento, abertura = excluded.abertura, "
+            "maxima = excluded.maxima, minima = excluded.minima, totNegocios = excluded.totNegocios, "
+            "qtdNegociada = excluded.qtdNegociada, volume = excluded.volume",
+            registros
+        )
+        gravados = cur.rowcount
+        # recalcula só as barras semanais/mensais a partir do pregão mais antigo recebido
+        atualizar_barras(cur, fii_id, primeira)
+        marcar_alteracao(conn, "cotacoes")
+        # sai da fila de falhas no mesmo commit da gravação
+        limpar_falha(conn, ETAPA, ticker)
+        conn.commit()
+        METRICAS.linhas(inseridas=gravados)
+        print(f"   + {gravados} gravados e commit realizado")
+        return gravados
+    except Exception as e:
+        conn.rollback()
+        print(f"   ⚠ Erro ao inserir no banco: {e}")
+        registrar_falha(conn, ETAPA, ticker, e)
+        conn.commit()
+        return 0
 
+# Modo sequencial: um fundo por vez, com pausa fixa entre chamadas
+def salvar_sequencial(conn, cliente, fiis):
     total_inserted = 0
-    for fii_id, ticker in fiis:
+    for fii_id, ticker, ultima in fiis:
         print(f"\n🔎 Processando {ticker}...")
         try:
-            dados = obter_cotacoes(session, ticker)
+            dados = obter_cotacoes(cliente, ticker, dias_janela(ultima))
         except Exception as e:
             print(f"   ⚠ Erro ao obter {ticker}: {e}")
+            registrar_falha(conn, ETAPA, ticker, e)
+            conn.commit()
             time.sleep(PAUSA)
             continue
+        total_inserted += gravar_cotacoes(conn, fii_id, ticker, dados, ultima)
+        time.sleep(PAUSA)
+    return total_inserted
 
-        print(f"   → {len(dados)} itens brutos para {ticker}")
-        cur.execute("SELECT MAX(data) FROM cotacoes WHERE fii_id = ?", (fii_id,))
-        ultima = cur.fetchone()[0]
-
-        registros = []
-        for item in dados:
-            try:
-                dt = datetime.strptime(item['data'], "%d/%m/%Y").date().isoformat()
-            except ValueError:
-                continue
-            if ultima and dt <= ultima:
-                continue
-
-            fechamento = float(item['fechamento'].replace('.', '').replace(',', '.'))
-            abertura   = float(item['abertura'].replace('.', '').replace(',', '.'))
-            maxima     = float(item['maxima'].replace('.', '').replace(',', '.'))
-            minima     = float(item['minima'].replace('.', '').replace(',', '.'))
-            totNeg     = int(item['totNegocios'].replace('.', ''))
-            qtdNeg     = int(item['qtdNegociada'].replace('.', ''))
-            volume     = float(item['volume'].replace('.', '').replace(',', '.'))
-
-            registros.append((
-                fii_id, dt, fechamento,
-                abertura, maxima, minima,
-                totNeg, qtdNeg, volume
-            ))
-
-        print(f"   → {len(registros)} registros novos para inserir")
-        if registros:
-            try:
-                cur.executemany(
-                    "INSERT INTO cotacoes (fii_id, data, preco_fechamento, abertura, maxima, minima, totNegocios, qtdNegociada, volume) "
-                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                    registros
-                )
-                conn.commit()
-                total_inserted += len(registros)
-                print(f"   + {len(registros)} inseridos e commit realizado")
-            except Exception as e:
-                print(f"   ⚠ Erro ao inserir no banco: {e}")
+# Modo concorrente: requisições em paralelo sob token bucket; grava cada
+# fundo assim que sua resposta chega
+async def salvar_concorrente(conn, cliente, fiis, concorrencia, rps):
+    total_inserted = 0
+    buscar = lambda fii: obter_cotacoes(cliente, fii[1], dias_janela(fii[2]))
+    async for (fii_id, ticker, ultima), dados, erro in buscar_concorrente(fiis, buscar, concorrencia, rps):
+        print(f"\n🔎 {ticker}")
+        if erro:
+            print(f"   ⚠ Erro ao obter {ticker}: {erro}")
+            registrar_falha(conn, ETAPA, ticker, erro)
+            conn.commit()
+            continue
+        total_inserted += gravar_cotacoes(conn, fii_id, ticker, dados, ultima)
+    return total_inserted
 
-        time.sleep(PAUSA)
+# Salva cotações incrementalmente
+def salvar_cotacoes(cliente, sequencial=False, concorrencia=CONCORRENCIA, rps=RPS, completo=False,
+                    so_falhas=False):
+    print(f"🚀 Iniciando importação de cotações em {DB_PATH}")
+    conn = abrir_conexao_db()
+    aplicar_migracoes(conn)
+
+    # última cotação de cada fundo, lida uma vez (índice (fii_id, data))
+    fiis = conn.execute("""
+        SELECT f.id, f.ticker, (SELECT MAX(c.data) FROM cotacoes c WHERE c.fii_id = f.id)
+        FROM fiis f
+    """).fetchall()
+    print(f"Total FIIs: {len(fiis)}")
+
+    if so_falhas:
+        pendentes = tickers_pendentes(conn, ETAPA)
+        fiis = [f for f in fiis if f[1] in pendentes]
+        print(f"   reprocessando só as falhas pendentes: {len(fiis)} fundos")
+    else:
+        descartados = tickers_descartados(conn, ETAPA)
+        fiis = [f for f in fiis if f[1] not in descartados]
+        if descartados:
+            print(f"   {len(descartados)} fundos descartados por falhas seguidas (falhas.py --reativar)")
+    # fundos que já têm o último pregão (ex.: segunda execução no mesmo dia)
+    # não precisam da chamada histórica
+    if not so_falhas and not completo:
+        pregao = ultimo_pregao().isoformat()
+        atrasados = [f for f in fiis if not f[2] or f[2] < pregao]
+        anterior = pregao_anterior(date.fromisoformat(pregao)).isoformat()
+        so_ultimo = sum(f[2] == anterior for f in atrasados)
+        print(f"   {len(fiis) - len(atrasados)} já atualizados até {pregao}; buscando {len(atrasados)} "
+              f"({so_ultimo} só com o último pregão)")
+        fiis = atrasados
+
+    if sequencial:
+        total_inserted = salvar_sequencial(conn, cliente, fiis)
+    else:
+        print(f"Modo concorrente: {concorrencia} em paralelo, até {rps} req/s")
+        total_inserted = asyncio.run(salvar_concorrente(conn, cliente, fiis, concorrencia, rps))
 
     conn.close()
-    print(f"\n✅ Total inseridos: {total_inserted}")
+    print(f"\n✅ Total gravados: {total_inserted}")
 
 if __name__ == '__main__':
-    if not TOKEN:
-        session = create_session()
-        autenticar(session)
-    salvar_cotacoes()
+    ap = argparse.ArgumentParser(description="Importa cotações diárias da Plexa.")
+    ap.add_argument("--sequencial", action="store_true", help="um fundo por vez, com pausa fixa")
+    ap.add_argument("--concorrencia", type=int, default=CONCORRENCIA)
+    ap.add_argument("--rps", type=float, default=RPS)
+    ap.add_argument("--completo", action="store_true",
+                    help="busca também os fundos já atualizados até o último pregão")
+    ap.add_argument("--so-falhas", action="store_true",
+                    help="busca só os fundos que falharam antes e já podem ser retentados")
+    args = ap.parse_args()
+    cliente = ClientePlexa(pool=args.concorrencia)
+    salvar_cotacoes(cliente, args.sequencial, args.concorrencia, args.rps, args.completo, args.so_falhas)
+    cliente.imprimir_metricas()
@@ -1,14 +1,38 @@
+import argparse
+import hashlib
+import json
+import queue
+import threading
 import time
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+
+import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from falhas import limpar_falha, registrar_falha, tickers_descartados, tickers_pendentes
+from migrar import aplicar_migracoes
+from telemetria import METRICAS, instrumentar
 
-# 1) Configurações de caminho
+# 1) Configurações
 ROOT_DIR = Path(__file__).resolve().parent.parent
 DB_PATH = ROOT_DIR / "data" / "fiis.db"
 
+URL_IMOVEIS = (
+    "https://fundamentus.com.br/"
+    "fii_imoveis_detalhes.php?papel={ticker}"
+    "&interface=mobile&interface=classic"
+)
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+WORKERS = 4           # buscas simultâneas (e tamanho máximo do pool de navegadores)
+TIMEOUT = 15          # segundos por requisição HTTP
+ESPERA_TABELA = 10    # espera máxima pela tabela no navegador
+ETAPA = "imoveis"     # nome da etapa em ingest_failures (o mesmo do setup.py)
+
 # 2) Funções de parsing
 def parse_area(area_str: str) -> float | None:
     """Converte '132.353' em 132353.0"""
@@ -34,84 +58,251 @@ def parse_percent(p: str) -> float | None:
     except ValueError:
         return None
 
-# 3) Script principal
-def main():
-    # Conecta ao banco
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("PRAGMA foreign_keys = ON;")
+# 3) Extração da tabela de imóveis
+def extrair_imoveis(html: str) -> list[tuple] | None:
+    """Linhas (nome, endereço, área, unidades, ocupação, inadimplência, receitas); None se não houver tabela."""
+    soup = BeautifulSoup(html, "html.parser")
+    # a tabela de imóveis é a que tem a coluna "Imóvel" (página de bloqueio
+    # ou casca JS sem ela conta como "sem tabela")
+    for table in soup.find_all("table"):
+        headers = [th.get_text(strip=True) for th in table.find_all("th")]
+        if "Imóvel" in headers:
+            break
+    else:
+        return None
+    idx = {h: i for i, h in enumerate(headers)}
 
-    # Busca todos os FIIs (id + ticker)
-    cur.execute("SELECT id, ticker FROM fiis;")
-    fiis = cur.fetchall()
+    imoveis = []
+    for tr in table.find_all("tr")[1:]:
+        cols = [td.get_text(strip=True) for td in tr.find_all("td")]
+        if not cols:
+            continue
+        imoveis.append((
+            cols[idx["Imóvel"]],
+            cols[idx["Endereço"]],
+            parse_area(cols[idx["Área"]]),
+            parse_int(cols[idx["Num Unidades"]]),
+            parse_percent(cols[idx["% tx ocupação"]]),
+            parse_percent(cols[idx["% inadimplência"]]),
+            parse_percent(cols[idx["% das receitas do fii"]]),
+        ))
+    return imoveis
 
-    for fii_id, ticker in fiis:
-        driver = None
+# 4) Pool de navegadores headless (só para páginas que não vêm por HTTP simples)
+class PoolNavegadores:
+    """Até `tamanho` drivers Chrome headless, criados sob demanda e reutilizados entre tickers."""
+
+    def __init__(self, tamanho: int):
+        self.tamanho = tamanho
+        self._vagas = threading.BoundedSemaphore(tamanho)
+        self._livres = queue.Queue()
+        self._todos = []
+        self._trava = threading.Lock()
+
+    def _novo_driver(self):
+        # importado só aqui: o caminho HTTP não depende do Selenium
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--disable-gpu")
+        options.add_argument(f"user-agent={USER_AGENT}")
+        return webdriver.Chrome(options=options)
+
+    @contextmanager
+    def driver(self):
+        with self._vagas:
+            try:
+                driver = self._livres.get_nowait()
+            except queue.Empty:
+                driver = self._novo_driver()
+                with self._trava:
+                    self._todos.append(driver)
+            try:
+                yield driver
+            except Exception:
+                # driver em estado desconhecido (caiu, travou): não volta ao pool;
+                # a vaga liberada cria um novo no próximo uso
+                self._descartar(driver)
+                raise
+            self._livres.put(driver)
+
+    def _descartar(self, driver):
+        with self._trava:
+            self._todos.remove(driver)
         try:
-            # Configura WebDriver headless
-            options = Options()
-            options.add_argument("--headless")
-            options.add_argument("--disable-gpu")
-            options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64)")
-            driver = webdriver.Chrome(options=options)
-
-            url = (
-                f"https://fundamentus.com.br/"
-                f"fii_imoveis_detalhes.php?papel={ticker}"
-                f"&interface=mobile&interface=classic"
-            )
-            print(f"Processando imóveis de {ticker}...")
+            driver.quit()
+        except Exception:
+            pass
+
+    def html(self, url: str) -> str:
+        """Abre a página e espera explicitamente pela tabela (ou pelo timeout, se não houver)."""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        with self.driver() as driver:
             driver.get(url)
-            time.sleep(3)  # espera o conteúdo carregar
-
-            soup = BeautifulSoup(driver.page_source, "html.parser")
-            table = soup.find("table")
-            if not table:
-                print(f"[{ticker}] Tabela não encontrada em {url}")
-                continue
-
-            # Cabeçalhos e índice de colunas
-            headers = [th.get_text(strip=True) for th in table.find_all("th")]
-            idx = {h: i for i, h in enumerate(headers)}
-
-            # Para cada linha da tabela
-            for tr in table.find_all("tr")[1:]:
-                cols = [td.get_text(strip=True) for td in tr.find_all("td")]
-                if not cols:
-                    continue
+            try:
+                WebDriverWait(driver, ESPERA_TABELA).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "table"))
+                )
+            except TimeoutException:
+                pass
+            return driver.page_source
 
-                nome_imovel = cols[idx["Imóvel"]]
-                endereco    = cols[idx["Endereço"]]
-                area_m2     = parse_area(cols[idx["Área"]])
-                num_unidades= parse_int(cols[idx["Num Unidades"]])
-                tx_ocup     = parse_percent(cols[idx["% tx ocupação"]])
-                tx_inad     = parse_percent(cols[idx["% inadimplência"]])
-                pct_rec     = parse_percent(cols[idx["% das receitas do fii"]])
-
-                # Insere no banco
-                cur.execute("""
-                    INSERT INTO fiis_imoveis (
-                        fii_id, nome_imovel, endereco,
-                        area_m2, num_unidades,
-                        tx_ocupacao, tx_inadimplencia, pct_receitas
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
+    def fechar(self):
+        for driver in self._todos:
+            driver.quit()
+
+# 5) Busca de um ticker: HTTP simples primeiro, navegador como fallback
+def buscar_imoveis(session, pool, ticker: str, usar_navegador: bool = False):
+    url = URL_IMOVEIS.format(ticker=ticker)
+    if not usar_navegador:
+        try:
+            resp = session.get(url, timeout=TIMEOUT)
+            resp.raise_for_status()
+            imoveis = extrair_imoveis(resp.text)
+            if imoveis is not None:
+                return "http", imoveis
+            # sem a tabela não dá para distinguir "fundo sem imóveis" de página
+            # de bloqueio ou montada por JS: o navegador decide
+        except requests.RequestException as e:
+            print(f"[{ticker}] HTTP falhou ({e}); usando navegador")
+    return "navegador", extrair_imoveis(pool.html(url))
+
+# 6) Gravação idempotente: substitui os imóveis do fundo só quando a tabela mudou
+def hash_imoveis(imoveis: list[tuple]) -> str:
+    return hashlib.sha256(
+        json.dumps(imoveis, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+def gravar_imoveis(conn, fii_id: int, imoveis: list[tuple] | None, hash_anterior: str | None) -> bool:
+    """
+    Registra a coleta do fundo numa transação: scraped_at sempre; imóveis,
+    content_hash e changed_at só quando o conteúdo mudou (devolve True).
+    `imoveis` None (página sem a tabela) conta como lista vazia: os imóveis
+    anteriores são removidos e a coleta fica marcada com sem_tabela.
+    """
+    conteudo = hash_imoveis(imoveis or [])
+    mudou = conteudo != hash_anterior
+    agora = datetime.now().isoformat(timespec="seconds")
+    with conn:
+        if mudou:
+            conn.execute("DELETE FROM fiis_imoveis WHERE fii_id = ?", (fii_id,))
+            conn.executemany("""
+                INSERT INTO fiis_imoveis (
                     fii_id, nome_imovel, endereco,
                     area_m2, num_unidades,
-                    tx_ocup, tx_inad, pct_rec
-                ))
+                    tx_ocupacao, tx_inadimplencia, pct_receitas
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(fii_id, *imovel) for imovel in imoveis or []])
+            conn.execute("""
+                INSERT INTO fiis_imoveis_coleta (fii_id, content_hash, changed_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(fii_id) DO UPDATE SET
+                    content_hash = excluded.content_hash,
+                    changed_at   = excluded.changed_at
+            """, (fii_id, conteudo, agora))
+        conn.execute("""
+            INSERT INTO fiis_imoveis_coleta (fii_id, scraped_at, sem_tabela)
+            VALUES (?, ?, ?)
+            ON CONFLICT(fii_id) DO UPDATE SET
+                scraped_at = excluded.scraped_at,
+                sem_tabela = excluded.sem_tabela
+        """, (fii_id, agora, int(imoveis is None)))
+    return mudou
+
+def criar_sessao(workers: int):
+    session = instrumentar(requests.Session())
+    session.headers["User-Agent"] = USER_AGENT
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    return session
+
+# 7) Script principal
+def main(workers: int = WORKERS, usar_navegador: bool = False, so_falhas: bool = False):
+    # Conecta ao banco
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    cur = conn.cursor()
+    cur.execute("PRAGMA foreign_keys = ON;")
+
+    # bancos anteriores à tabela de controle
+    aplicar_migracoes(conn)
 
-            # confirma para cada ticker
-            conn.commit()
+    # Busca todos os FIIs (id + ticker) e o hash da última coleta
+    cur.execute("""
+        SELECT f.id, f.ticker, c.content_hash
+        FROM fiis f
+        LEFT JOIN fiis_imoveis_coleta c ON c.fii_id = f.id;
+    """)
+    fiis = cur.fetchall()
+    hashes = {fii_id: h for fii_id, _, h in fiis}
+    if so_falhas:
+        pendentes = tickers_pendentes(conn, ETAPA)
+        fiis = [f for f in fiis if f[1] in pendentes]
+        print(f"Reprocessando só as falhas pendentes: {len(fiis)} FIIs")
+    else:
+        descartados = tickers_descartados(conn, ETAPA)
+        fiis = [f for f in fiis if f[1] not in descartados]
+        if descartados:
+            print(f"{len(descartados)} FIIs descartados por falhas seguidas (falhas.py --reativar)")
+
+    session = criar_sessao(workers)
+    pool = PoolNavegadores(workers)
+    inicio = time.perf_counter()
+    caminhos = {"http": 0, "navegador": 0}
+    gravados = inalterados = sem_tabela = 0
+    try:
+        # workers buscam e extraem em paralelo; só esta thread grava no banco
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futuros = {
+                executor.submit(buscar_imoveis, session, pool, ticker, usar_navegador): (fii_id, ticker)
+                for fii_id, ticker, _ in fiis
+            }
+            for futuro in as_completed(futuros):
+                fii_id, ticker = futuros[futuro]
+                try:
+                    caminho, imoveis = futuro.result()
+                except Exception as e:
+                    print(f"Erro ao processar {ticker}: {e}")
+                    with conn:
+                        registrar_falha(conn, ETAPA, ticker, e)
+                    continue
+                caminhos[caminho] += 1
+                with conn:
+                    limpar_falha(conn, ETAPA, ticker)
 
-        except Exception as e:
-            print(f"Erro ao processar {ticker}: {e}")
-        finally:
-            if driver:
-                driver.quit()
+                # cada ticker é gravado (ou só tem a coleta registrada) na sua própria transação
+                mudou = gravar_imoveis(conn, fii_id, imoveis, hashes[fii_id])
+                if imoveis is None:
+                    sem_tabela += 1
+                    print(f"[{ticker}] Tabela não encontrada"
+                          + ("; imóveis anteriores removidos" if mudou and hashes[fii_id] else ""))
+                elif mudou:
+                    gravados += 1
+                    METRICAS.linhas(buscadas=len(imoveis), inseridas=len(imoveis))
+                    print(f"Processando imóveis de {ticker}... {len(imoveis)} ({caminho})")
+                else:
+                    inalterados += 1
+                    METRICAS.linhas(buscadas=len(imoveis), puladas=len(imoveis))
+    finally:
+        pool.fechar()
+        conn.close()
 
-    conn.close()
-    print("✅ Scraping de imóveis concluído.")
+    decorrido = time.perf_counter() - inicio
+    print(f"✅ Scraping de imóveis concluído: {len(fiis)} FIIs em {decorrido:.1f}s "
+          f"({decorrido / max(len(fiis), 1):.2f}s por FII; "
+          f"{caminhos['http']} via HTTP, {caminhos['navegador']} via navegador; "
+          f"{gravados} atualizados, {inalterados} sem mudança, {sem_tabela} sem tabela).")
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Coleta os imóveis dos FIIs no Fundamentus.")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--navegador", action="store_true", help="sempre usa o navegador headless")
+    ap.add_argument("--so-falhas", action="store_true",
+                    help="busca só os FIIs que falharam antes e já podem ser retentados")
+    args = ap.parse_args()
+    main(args.workers, args.navegador, args.so_falhas)
@@ -1,16 +1,88 @@
+import argparse
 import time
 import sqlite3
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from bs4 import BeautifulSoup
+
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from falhas import limpar_falha, registrar_falha, tickers_descartados, tickers_pendentes
+from migrar import aplicar_migracoes, marcar_alteracao
+from telemetria import METRICAS, instrumentar
 
 # —————————————————————————————————————————
-# CONFIGURAÇÕES DE CAMINHO
+# CONFIGURAÇÕES
 # —————————————————————————————————————————
 # Ajuste este caminho se seu banco estiver em outro diretório
 ROOT_DIR = Path(__file__).resolve().parent.parent
 DB_PATH  = ROOT_DIR / "data" / "fiis.db"
 
+URL_DETALHES = "https://fundamentus.com.br/detalhes.php?papel={ticker}"
+URL_LISTAGEM = "https://fundamentus.com.br/fii_resultado.php"
+USER_AGENT   = "Mozilla/5.0"
+WORKERS      = 8      # páginas buscadas em paralelo
+TIMEOUT      = 15     # segundos por requisição
+LOTE_COMMIT  = 50     # FIIs gravados por transação
+ETAPA        = "cap_rate"   # nome da etapa em ingest_failures (o mesmo do setup.py)
+
+# lxml é bem mais rápido; html.parser fica como alternativa sem dependência
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+# só as tabelas de indicadores da página (class="w728") são montadas pelo parser
+SO_INDICADORES = SoupStrainer("table", class_="w728")
+
+# rótulo na página -> nome do indicador em `indicadores`.
+# Rótulos que aparecem nas colunas "Últimos 12 meses" e "Últimos 3 meses"
+# chegam como "<rótulo> 12M" / "<rótulo> 3M". Nro. Cotas e Patrim Líquido
+# ficam de fora: já vêm da API Plexa (Quantidade de Cotas / Patrimônio Líquido).
+INDICADORES_DETALHES = {
+    "Cap Rate":              "Cap Rate",
+    "Vacância Média":        "Vacância Média",
+    "FFO Yield":             "FFO Yield",
+    "Div. Yield":            "Dividend Yield",
+    "P/VP":                  "P/VP",
+    "FFO/Cota":              "FFO/Cota",
+    "Dividendo/cota":        "Dividendo/Cota",
+    "VP/Cota":               "VP/Cota",
+    "Valor de mercado":      "Valor de Mercado",
+    "Vol $ méd (2m)":        "Volume Médio 2M",
+    "Ativos":                "Ativos",
+    "Imóveis":               "Imóveis",
+    "Área (m2)":             "Área (m2)",
+    "Aluguel/m2":            "Aluguel/m2",
+    "Preço do m2":           "Preço do m2",
+    "Receita 12M":           "Receita 12M",
+    "Receita 3M":            "Receita 3M",
+    "Venda de ativos 12M":   "Venda de Ativos 12M",
+    "Venda de ativos 3M":    "Venda de Ativos 3M",
+    "FFO 12M":               "FFO 12M",
+    "FFO 3M":                "FFO 3M",
+    "Rend. Distribuído 12M": "Rendimento Distribuído 12M",
+    "Rend. Distribuído 3M":  "Rendimento Distribuído 3M",
+}
+
+# coluna da listagem de todos os FIIs (fii_resultado.php) -> nome do indicador
+INDICADORES_LISTAGEM = {
+    "FFO Yield":         "FFO Yield",
+    "Dividend Yield":    "Dividend Yield",
+    "P/VP":              "P/VP",
+    "Valor de Mercado":  "Valor de Mercado",
+    "Liquidez":          "Liquidez",
+    "Qtd de imóveis":    "Imóveis",
+    "Preço do m2":       "Preço do m2",
+    "Aluguel por m2":    "Aluguel/m2",
+    "Cap Rate":          "Cap Rate",
+    "Vacância Média":    "Vacância Média",
+}
+SO_LISTAGEM = SoupStrainer("table", id="tabelaResultado")
+
 # —————————————————————————————————————————
 # FUNÇÕES AUXILIARES
 # —————————————————————————————————————————
@@ -25,74 +97,225 @@ def parse_percent(p: str) -> float | None:
     except ValueError:
         return None
 
-def get_cap_rate(ticker: str) -> float | None:
+def criar_sessao(workers: int = WORKERS) -> requests.Session:
+    """Sessão compartilhada pelas threads, com keep-alive e retries."""
+    session = instrumentar(requests.Session())
+    session.headers["User-Agent"] = USER_AGENT
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+def extrair_detalhes(html: str) -> dict[str, str]:
     """
-    Faz scraping na página de detalhes do Fundamentus e retorna
-    o Cap Rate (float). Se não encontrar, retorna None.
+    Todos os pares rótulo/valor das tabelas de indicadores de detalhes.php.
+    Rótulos repetidos (12 meses / 3 meses) recebem o sufixo 12M / 3M.
     """
-    url = f"https://fundamentus.com.br/detalhes.php?papel={ticker}"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    resp = requests.get(url, headers=headers)
+    soup = BeautifulSoup(html, PARSER, parse_only=SO_INDICADORES)
+    pares = []
+    for td_label in soup.find_all("td", class_="label"):
+        td_value = td_label.find_next_sibling("td")
+        if td_value is None:
+            continue
+        # o rótulo fica no <span class="txt">; o outro span é o "?" de ajuda
+        span = td_label.find("span", class_="txt")
+        rotulo = (span or td_label).get_text(strip=True)
+        pares.append((rotulo, td_value.get_text(strip=True)))
+
+    vistos = {}
+    for rotulo, _ in pares:
+        vistos[rotulo] = vistos.get(rotulo, 0) + 1
+    repetidos = {r for r, n in vistos.items() if n > 1}
+
+    campos, ocorrencia = {}, {}
+    for rotulo, valor in pares:
+        if rotulo in repetidos:
+            ocorrencia[rotulo] = ocorrencia.get(rotulo, 0) + 1
+            rotulo = f"{rotulo} {'12M' if ocorrencia[rotulo] == 1 else '3M'}"
+        campos[rotulo] = valor
+    return campos
+
+def get_detalhes(session: requests.Session, ticker: str) -> dict[str, float]:
+    """
+    Faz scraping na página de detalhes do Fundamentus e retorna os
+    indicadores numéricos de INDICADORES_DETALHES encontrados (Cap Rate incluso).
+    """
+    resp = session.get(URL_DETALHES.format(ticker=ticker), timeout=TIMEOUT)
     resp.raise_for_status()
 
-    soup = BeautifulSoup(resp.text, "html.parser")
-    span_cr = soup.find("span", class_="txt", string="Cap Rate")
-    if not span_cr:
-        return None
+    valores = {}
+    for rotulo, texto in extrair_detalhes(resp.text).items():
+        nome = INDICADORES_DETALHES.get(rotulo)
+        if nome is None:
+            continue
+        valor = parse_percent(texto)
+        if valor is not None:
+            valores[nome] = valor
+    return valores
 
-    td_label = span_cr.find_parent("td")
-    td_value = td_label.find_next_sibling("td") if td_label else None
-    if not td_value:
-        return None
+def get_cap_rate(ticker: str, session: requests.Session | None = None) -> float | None:
+    """Cap Rate (float) de um único FII, ou None se não encontrar."""
+    return get_detalhes(session or criar_sessao(1), ticker).get("Cap Rate")
+
+def get_listagem(session: requests.Session) -> dict[str, dict[str, float]]:
+    """
+    Uma única requisição à tabela de resultados de todos os FIIs:
+    {ticker: {indicador: valor}} com as colunas de INDICADORES_LISTAGEM.
+    """
+    resp = session.get(URL_LISTAGEM, timeout=TIMEOUT)
+    resp.raise_for_status()
 
-    return parse_percent(td_value.get_text(strip=True))
+    soup = BeautifulSoup(resp.text, PARSER, parse_only=SO_LISTAGEM)
+    cabecalho = [th.get_text(strip=True) for th in soup.find_all("th")]
+    colunas = [(i, INDICADORES_LISTAGEM[c]) for i, c in enumerate(cabecalho) if c in INDICADORES_LISTAGEM]
+
+    listagem = {}
+    for tr in soup.find_all("tr"):
+        tds = [td.get_text(strip=True) for td in tr.find_all("td")]
+        if len(tds) != len(cabecalho):
+            continue
+        valores = {}
+        for i, nome in colunas:
+            valor = parse_percent(tds[i])
+            if valor is not None:
+                valores[nome] = valor
+        listagem[tds[0].upper()] = valores
+    return listagem
+
+def obter_indicadores(cur, nomes) -> dict[str, int]:
+    """Ids dos indicadores, criando os que ainda não existem."""
+    cur.executemany(
+        "INSERT OR IGNORE INTO indicadores (nome, descricao) VALUES (?, ?)",
+        [(nome, "Fundamentus") for nome in nomes]
+    )
+    cur.execute("SELECT nome, id FROM indicadores")
+    return dict(cur.fetchall())
+
+def gravar_valores(cur, ids, fii_id, valores, data_ref):
+    cur.executemany("""
+        INSERT INTO fiis_indicadores
+            (fii_id, indicador_id, valor, data_referencia)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (fii_id, indicador_id, data_referencia) DO UPDATE SET valor = excluded.valor
+    """, [(fii_id, ids[nome], valor, data_ref) for nome, valor in valores.items()])
+
+def gravar_listagem(conn, ids, fiis, listagem, data_ref) -> list[tuple]:
+    """
+    Grava numa transação os indicadores de todos os FIIs presentes na
+    listagem e devolve os (fii_id, ticker) que ficaram de fora.
+    """
+    faltantes = []
+    with conn:
+        cur = conn.cursor()
+        for fii_id, ticker in fiis:
+            valores = listagem.get(ticker.upper())
+            if valores:
+                gravar_valores(cur, ids, fii_id, valores, data_ref)
+                limpar_falha(conn, ETAPA, ticker)
+                METRICAS.linhas(buscadas=len(valores), inseridas=len(valores))
+            else:
+                faltantes.append((fii_id, ticker))
+        if len(faltantes) < len(fiis):
+            marcar_alteracao(conn, "fiis_indicadores")
+    return faltantes
+
+def gravar_detalhes(conn, ids, fiis, data_ref, workers):
+    """Busca detalhes.php em paralelo; só a thread chamadora grava, em lotes."""
+    cur = conn.cursor()
+    session = criar_sessao(workers)
+    pendentes = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = {executor.submit(get_detalhes, session, ticker): (fii_id, ticker)
+                   for fii_id, ticker in fiis}
+        for futuro in as_completed(futuros):
+            fii_id, ticker = futuros[futuro]
+            try:
+                valores = futuro.result()
+            except Exception as e:
+                print(f"❌ Erro ao processar {ticker}: {e}")
+                registrar_falha(conn, ETAPA, ticker, e)
+                continue
+            limpar_falha(conn, ETAPA, ticker)
+
+            cap = valores.get("Cap Rate")
+            if cap is None:
+                print(f"⚠️  Cap Rate não encontrado para {ticker}.")
+            if not valores:
+                continue
+
+            gravar_valores(cur, ids, fii_id, valores, data_ref)
+            METRICAS.linhas(buscadas=len(valores), inseridas=len(valores))
+            pendentes += 1
+            if cap is not None:
+                print(f"✅ {ticker}: Cap Rate {cap:.2f}% + {len(valores) - 1} indicadores (ref. {data_ref}).")
+
+            if pendentes >= LOTE_COMMIT:
+                marcar_alteracao(conn, "fiis_indicadores")
+                conn.commit()
+                pendentes = 0
+    if pendentes:
+        marcar_alteracao(conn, "fiis_indicadores")
+    conn.commit()
 
 # —————————————————————————————————————————
 # SCRIPT PRINCIPAL
 # —————————————————————————————————————————
-def main():
+def main(workers: int = WORKERS, so_detalhes: bool = False, so_falhas: bool = False):
     # 1) Abre conexão com SQLite
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     cur  = conn.cursor()
     cur.execute("PRAGMA foreign_keys = ON;")
+    aplicar_migracoes(conn)
 
     # 2) Carrega todos os FIIs (id + ticker)
     cur.execute("SELECT id, ticker FROM fiis;")
     fiis = cur.fetchall()
+    if so_falhas:
+        # poucas páginas de detalhes custam menos que a listagem inteira
+        pendentes = tickers_pendentes(conn, ETAPA)
+        fiis = [f for f in fiis if f[1] in pendentes]
+        so_detalhes = True
+        print(f"🔁 Reprocessando só as falhas pendentes: {len(fiis)} FIIs")
 
-    # 3) Garante existência do indicador “Cap Rate”
-    cur.execute("SELECT id FROM indicadores WHERE nome = ?", ("Cap Rate",))
-    row = cur.fetchone()
-    if row:
-        cap_rate_id = row[0]
-    else:
-        cur.execute("INSERT INTO indicadores (nome) VALUES (?)", ("Cap Rate",))
-        cap_rate_id = cur.lastrowid
-        conn.commit()  # salva o novo indicador
-
-    # 4) Para cada FII, busca e salva o Cap Rate
-    for fii_id, ticker in fiis:
-        try:
-            cap = get_cap_rate(ticker)
-            if cap is None:
-                print(f"⚠️  Cap Rate não encontrado para {ticker}.")
-                continue
+    # 3) Garante existência do “Cap Rate” e dos demais indicadores coletados
+    nomes = set(INDICADORES_DETALHES.values()) | set(INDICADORES_LISTAGEM.values())
+    ids = obter_indicadores(cur, sorted(nomes))
+    conn.commit()
 
-            data_ref = time.strftime("%Y-%m-%d")
-            cur.execute("""
-                INSERT OR REPLACE INTO fiis_indicadores
-                    (fii_id, indicador_id, valor, data_referencia)
-                VALUES (?, ?, ?, ?)
-            """, (fii_id, cap_rate_id, cap, data_ref))
-            conn.commit()
-            print(f"✅ {ticker}: Cap Rate {cap:.2f}% salvo (ref. {data_ref}).")
+    data_ref = time.strftime("%Y-%m-%d")
+    inicio = time.perf_counter()
 
+    # 4) Listagem de todos os FIIs numa requisição só
+    faltantes = fiis
+    if not so_detalhes:
+        try:
+            listagem = get_listagem(criar_sessao(1))
+            faltantes = gravar_listagem(conn, ids, fiis, listagem, data_ref)
+            print(f"✅ Listagem: {len(fiis) - len(faltantes)} FIIs gravados em uma requisição.")
         except Exception as e:
-            print(f"❌ Erro ao processar {ticker}: {e}")
+            print(f"❌ Erro na listagem ({e}); usando as páginas de detalhes.")
+            METRICAS.falha(URL_LISTAGEM, e)
+
+    # 5) Páginas de detalhes só para quem não veio na listagem (menos os descartados
+    #    por falhas seguidas; a listagem continua gravando-os se voltarem a aparecer)
+    if not so_falhas:
+        descartados = tickers_descartados(conn, ETAPA)
+        faltantes = [f for f in faltantes if f[1] not in descartados]
+    if faltantes:
+        print(f"🔎 Buscando detalhes de {len(faltantes)} FIIs fora da listagem...")
+        gravar_detalhes(conn, ids, faltantes, data_ref, workers)
 
-    # 5) Fecha conexão
+    # 6) Fecha conexão
     conn.close()
-    print("🔚 Processamento concluído.")
+    decorrido = time.perf_counter() - inicio
+    print(f"🔚 Processamento concluído: {len(fiis)} FIIs em {decorrido:.1f}s.")
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser(description="Coleta Cap Rate e demais indicadores do Fundamentus.")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--detalhes", action="store_true",
+                    help="ignora a listagem e busca a página de detalhes de cada FII")
+    ap.add_argument("--so-falhas", action="store_true",
+                    help="busca só os FIIs que falharam antes e já podem ser retentados")
+    args = ap.parse_args()
+    main(args.workers, args.detalhes, args.so_falhas)
@@ -2,6 +2,9 @@ import sqlite3
 import pandas as pd
 from pathlib import Path
 
+from agregados import atualizar_dividendos_mensais
+from migrar import marcar_alteracao
+
 # --- Caminhos ---
 SCRIPT_DIR = Path(__file__).resolve().parent
 ROOT_DIR   = SCRIPT_DIR.parent
@@ -85,6 +88,17 @@ if inserts:
     )
     print(f"Inseridos {len(inserts)} registros de dividendos.")
 
+    # totais mensais: só os meses tocados de cada fundo
+    datas_por_fii = {}
+    for fii_id, _, data_ref, _ in inserts:
+        datas_por_fii.setdefault(fii_id, []).append(data_ref)
+    meses = sum(
+        atualizar_dividendos_mensais(cur, fii_id, datas)
+        for fii_id, datas in datas_por_fii.items()
+    )
+    print(f"Atualizados {meses} meses em dividendos_mensais.")
+    marcar_alteracao(conn, "fiis_indicadores")
+
 conn.commit()
 conn.close()
 print("✅ Finalizado!")
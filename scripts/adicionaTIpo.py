@@ -3,6 +3,8 @@ import json
 import sqlite3
 import requests
 
+from migrar import aplicar_migracoes
+
 # Caminhos
 BASE_DIR = os.path.dirname(__file__)
 ROOT_DIR = os.path.abspath(os.path.join(BASE_DIR, '..'))
@@ -39,20 +41,13 @@ mapeamento_tipo = {
 }
 
 def atualiza_tipos_de_fiis(db_path: str = DB_PATH):
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, timeout=30)
+    # tipo_fii e fiis.tipo_id fazem parte do schema versionado
+    aplicar_migracoes(conn)
     cur = conn.cursor()
 
     cur.execute("UPDATE fiis SET tipo_id = NULL;")
 
-    # Cria tabela tipo_fii se não existir
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS tipo_fii (
-        id        INTEGER PRIMARY KEY AUTOINCREMENT,
-        nome      TEXT NOT NULL UNIQUE,
-        descricao TEXT
-    );
-    """)
-
     # Insere categorias padrão
     categorias = [
         ('Papel',            'Fundos de Papel (CRI, LCI, LIG etc.)'),
@@ -66,12 +61,6 @@ def atualiza_tipos_de_fiis(db_path: str = DB_PATH):
         categorias
     )
 
-    # Garante coluna tipo_id
-    try:
-        cur.execute("ALTER TABLE fiis ADD COLUMN tipo_id INTEGER;")
-    except sqlite3.OperationalError:
-        pass
-
     # Atualiza cada FII sem tipo
     cur.execute("SELECT id, ticker FROM fiis WHERE tipo_id IS NULL;")
     for fii_id, ticker in cur.fetchall():
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Tabelas agregadas mantidas de forma incremental a partir das tabelas brutas.
+
+- cotacoes_semanal / cotacoes_mensal: barras OHLC + volume por fundo, usadas
+  pelos gráficos de cotação no lugar do resample das cotações diárias.
+  A semana fecha na sexta-feira (W-FRI) e é identificada por essa data;
+  o mês é identificado pelo seu primeiro dia.
+- dividendos_mensais: soma e quantidade de pagamentos de dividendos por fundo
+  e mês (identificado pelo primeiro dia), base do DY e dos gráficos mensais.
+
+Os scripts de coleta chamam as funções daqui depois de gravar dados novos,
+recalculando só os períodos afetados. Executado diretamente, reconstrói
+todas as tabelas agregadas de todos os fundos.
+"""
+import sqlite3
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DB_PATH = ROOT_DIR / "data" / "fiis.db"
+
+# Chave do período e data a partir da qual recalcular, para cada tabela de barras
+PERIODOS_BARRAS = {
+    "cotacoes_semanal": ("semana", "date(data, 'weekday 5')",   "date(?, 'weekday 5', '-6 days')"),
+    "cotacoes_mensal":  ("mes",    "strftime('%Y-%m-01', data)", "strftime('%Y-%m-01', ?)"),
+}
+
+SQL_BARRAS = """
+INSERT OR REPLACE INTO {tabela} (
+    fii_id, {coluna}, abertura, maxima, minima, fechamento, volume, pregoes
+)
+SELECT g.fii_id, g.periodo,
+       (SELECT c.abertura FROM cotacoes c
+         WHERE c.fii_id = g.fii_id AND c.data = g.primeiro),
+       g.maxima, g.minima,
+       (SELECT c.preco_fechamento FROM cotacoes c
+         WHERE c.fii_id = g.fii_id AND c.data = g.ultimo),
+       g.volume, g.pregoes
+FROM (
+    SELECT fii_id,
+           {chave}                AS periodo,
+           MIN(data)              AS primeiro,
+           MAX(data)              AS ultimo,
+           MAX(maxima)            AS maxima,
+           MIN(minima)            AS minima,
+           SUM(volume)            AS volume,
+           COUNT(*)               AS pregoes
+    FROM cotacoes
+    WHERE fii_id = ? AND data >= {inicio}
+    GROUP BY fii_id, periodo
+) g
+"""
+
+
+def atualizar_barras(cur, fii_id, desde):
+    """
+    Recalcula as barras semanais e mensais de um fundo a partir do período
+    que contém `desde` (data ISO do pregão mais antigo gravado agora).
+    """
+    for tabela, (coluna, chave, inicio) in PERIODOS_BARRAS.items():
+        cur.execute(
+            f"DELETE FROM {tabela} WHERE fii_id = ? AND {coluna} >= {inicio}",
+            (fii_id, desde),
+        )
+        cur.execute(
+            SQL_BARRAS.format(tabela=tabela, coluna=coluna, chave=chave, inicio=inicio),
+            (fii_id, desde),
+        )
+
+
+SQL_DIVIDENDOS_MENSAIS = """
+INSERT OR REPLACE INTO dividendos_mensais (fii_id, mes, valor, n_pagamentos)
+SELECT fii_id, strftime('%Y-%m-01', data_referencia) AS mes, SUM(valor), COUNT(*)
+FROM fiis_indicadores
+WHERE fii_id = ?
+  AND indicador_id = (SELECT id FROM indicadores WHERE nome = 'Dividendos')
+  AND data_referencia >= ? AND data_referencia < date(?, '+1 month')
+GROUP BY fii_id, mes
+"""
+
+
+def atualizar_dividendos_mensais(cur, fii_id, datas):
+    """
+    Recalcula os totais mensais de dividendos de um fundo apenas nos meses
+    que contêm as `datas` (ISO) gravadas agora.
+    """
+    meses = sorted({d[:7] + "-01" for d in datas})
+    for mes in meses:
+        cur.execute(
+            "DELETE FROM dividendos_mensais WHERE fii_id = ? AND mes = ?",
+            (fii_id, mes),
+        )
+        cur.execute(SQL_DIVIDENDOS_MENSAIS, (fii_id, mes, mes))
+    return len(meses)
+
+
+def reconstruir_barras(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT fii_id, MIN(data) FROM cotacoes GROUP BY fii_id")
+    fundos = cur.fetchall()
+    for fii_id, desde in fundos:
+        atualizar_barras(cur, fii_id, desde)
+    conn.commit()
+    return len(fundos)
+
+
+def reconstruir_dividendos_mensais(conn):
+    with conn:
+        conn.execute("DELETE FROM dividendos_mensais")
+        conn.execute("""
+            INSERT INTO dividendos_mensais (fii_id, mes, valor, n_pagamentos)
+            SELECT fii_id, strftime('%Y-%m-01', data_referencia) AS mes, SUM(valor), COUNT(*)
+            FROM fiis_indicadores
+            WHERE indicador_id = (SELECT id FROM indicadores WHERE nome = 'Dividendos')
+            GROUP BY fii_id, mes
+        """)
+    return conn.execute("SELECT COUNT(DISTINCT fii_id) FROM dividendos_mensais").fetchone()[0]
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(DB_PATH)
+    total = reconstruir_barras(conn)
+    total_divs = reconstruir_dividendos_mensais(conn)
+    conn.close()
+    print(f"✅ Barras semanais e mensais reconstruídas para {total} FIIs.")
+    print(f"✅ Dividendos mensais reconstruídos para {total_divs} FIIs.")
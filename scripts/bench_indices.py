@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Benchmark dos índices de cotacoes/fiis_indicadores.
+
+Cria um banco sintético temporário com o schema das migrações,
+remove os índices, mede as consultas mais frequentes do pipeline e das
+páginas (scan), recria os índices e mede de novo (seek). Também mostra o
+EXPLAIN QUERY PLAN de cada consulta nos dois cenários.
+
+Uso:
+    python scripts/bench_indices.py [--fundos 600] [--dias 1250] [--meses 120]
+"""
+import argparse
+import importlib
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+banco = importlib.import_module("1_criar_banco")
+from migrar import migracao
+schema = migracao(2)   # INDICES e criar_indices
+
+HOJE = date.today()
+
+
+def primeiro_dia_mes(n):
+    """Primeiro dia do mês n meses antes do mês atual (ISO)."""
+    total = HOJE.year * 12 + (HOJE.month - 1) - n
+    return date(total // 12, total % 12 + 1, 1).isoformat()
+
+
+def popular(conn, n_fundos, n_dias, n_meses):
+    cur = conn.cursor()
+    cur.executemany(
+        "INSERT INTO fiis (ticker, nome) VALUES (?, ?)",
+        ((f"BENC{i:03d}11", f"Fundo {i}") for i in range(n_fundos)),
+    )
+    dias = [(HOJE - timedelta(days=d)).isoformat() for d in range(n_dias)]
+    cur.executemany(
+        "INSERT INTO cotacoes (fii_id, data, preco_fechamento) VALUES (?, ?, ?)",
+        ((f, d, random.uniform(50, 150)) for f in range(1, n_fundos + 1) for d in dias),
+    )
+    ind_ids = [r[0] for r in cur.execute("SELECT id FROM indicadores")]
+    meses = [primeiro_dia_mes(n) for n in range(n_meses)]
+    cur.executemany(
+        "INSERT INTO fiis_indicadores (fii_id, indicador_id, data_referencia, valor) VALUES (?, ?, ?, ?)",
+        ((f, i, m, random.uniform(0, 2)) for f in range(1, n_fundos + 1) for i in ind_ids for m in meses),
+    )
+    conn.commit()
+
+
+def consultas(n_fundos):
+    """Consultas quentes: (descrição, sql, lista de parâmetros)."""
+    fundos = range(1, n_fundos + 1)
+    desde_1a = (HOJE - timedelta(days=365)).isoformat()
+    inicio_12m = (HOJE.replace(day=1) - timedelta(days=365)).isoformat()
+    return [
+        ("MAX(data) por fundo (5_obter_cotacoes)",
+         "SELECT MAX(data) FROM cotacoes WHERE fii_id = ?",
+         [(f,) for f in fundos]),
+        ("MAX(data_referencia) por fundo/indicador (4_obter_dividendos)",
+         "SELECT MAX(data_referencia) FROM fiis_indicadores WHERE fii_id = ? AND indicador_id = 1",
+         [(f,) for f in fundos]),
+        ("Cotações de 1 ano de um fundo (Análise por Fundo)",
+         "SELECT data, preco_fechamento FROM cotacoes WHERE fii_id = ? AND data >= ?",
+         [(f, desde_1a) for f in fundos]),
+        ("Última data por fundo (fiis_ativos)",
+         "SELECT fii_id, MAX(data) FROM cotacoes GROUP BY fii_id",
+         [()]),
+        ("Último valor por fundo/indicador (vw_indicadores_atuais)",
+         "SELECT * FROM vw_indicadores_atuais",
+         [()]),
+        ("Dividendos 12M de todos os fundos (gerar_snapshot)",
+         "SELECT fii_id, SUM(valor) FROM fiis_indicadores "
+         "WHERE indicador_id = 1 AND data_referencia > ? GROUP BY fii_id",
+         [(inicio_12m,)]),
+    ]
+
+
+def medir(conn, sql, lista_params):
+    inicio = time.perf_counter()
+    for params in lista_params:
+        conn.execute(sql, params).fetchall()
+    return time.perf_counter() - inicio
+
+
+def plano(conn, sql, params):
+    linhas = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return "; ".join(l[-1] for l in linhas)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--fundos", type=int, default=600)
+    ap.add_argument("--dias", type=int, default=1250)
+    ap.add_argument("--meses", type=int, default=120)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "bench.db"
+        banco.criar_banco(db)
+        conn = sqlite3.connect(db)
+        for nome, *_ in schema.INDICES:
+            conn.execute(f"DROP INDEX IF EXISTS {nome}")
+
+        print(f"Populando {args.fundos} fundos × {args.dias} dias de cotação...")
+        popular(conn, args.fundos, args.dias, args.meses)
+
+        casos = consultas(args.fundos)
+        sem = {}
+        for desc, sql, params in casos:
+            sem[desc] = (medir(conn, sql, params), plano(conn, sql, params[0]))
+
+        inicio = time.perf_counter()
+        schema.criar_indices(conn.cursor())
+        conn.commit()
+        conn.execute("ANALYZE")
+        print(f"Índices criados em {time.perf_counter() - inicio:.2f}s\n")
+
+        for desc, sql, params in casos:
+            t_com = medir(conn, sql, params)
+            t_sem, plano_sem = sem[desc]
+            print(f"• {desc}  ({len(params)} execuções)")
+            print(f"    sem índice: {t_sem * 1000:9.1f} ms  | {plano_sem}")
+            print(f"    com índice: {t_com * 1000:9.1f} ms  | {plano(conn, sql, params[0])}")
+            print(f"    ganho:      {t_sem / t_com if t_com else float('inf'):9.1f}x")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Benchmark da conversão dos payloads de /json/historico em registros.
+
+Compara o laço original (strptime + replace item a item) com o caminho
+colunar de 5_obter_cotacoes.montar_registros, sobre payloads sintéticos no
+formato da API, e confere que os dois produzem os mesmos registros. Os
+payloads trazem também datas impossíveis (31/02, 29/02 fora de ano bissexto,
+00/13), que os dois caminhos devem descartar; a saída é 1 se diferirem.
+
+Uso:
+    python scripts/bench_parse_cotacoes.py [--fundos 50] [--dias 3500]
+"""
+import argparse
+import importlib
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+cotacoes = importlib.import_module("5_obter_cotacoes")
+
+
+def numero_br(v, casas=2):
+    return f"{v:,.{casas}f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+DATAS_IMPOSSIVEIS = ["31/02/2024", "29/02/2023", "00/13/2024", "31/04/2024", "00/01/2024"]
+
+
+def payload(n_dias):
+    hoje = date.today()
+    itens = [
+        {
+            "data": (hoje - timedelta(days=d)).strftime("%d/%m/%Y"),
+            "fechamento": numero_br(random.uniform(50, 150)),
+            "abertura": numero_br(random.uniform(50, 150)),
+            "maxima": numero_br(random.uniform(50, 150)),
+            "minima": numero_br(random.uniform(50, 150)),
+            "totNegocios": numero_br(random.randint(1, 5000), 0),
+            "qtdNegociada": numero_br(random.randint(1, 500000), 0),
+            "volume": numero_br(random.uniform(1e3, 1e8)),
+        }
+        for d in range(n_dias)
+    ]
+    for item, data in zip(random.sample(itens, min(len(itens), len(DATAS_IMPOSSIVEIS))), DATAS_IMPOSSIVEIS):
+        item["data"] = data
+    return itens
+
+
+def montar_registros_laco(fii_id, dados, desde):
+    """Laço original, item a item."""
+    registros = []
+    for item in dados:
+        try:
+            dt = datetime.strptime(item['data'], "%d/%m/%Y").date().isoformat()
+        except ValueError:
+            continue
+        if desde and dt < desde:
+            continue
+
+        fechamento = float(item['fechamento'].replace('.', '').replace(',', '.'))
+        abertura   = float(item['abertura'].replace('.', '').replace(',', '.'))
+        maxima     = float(item['maxima'].replace('.', '').replace(',', '.'))
+        minima     = float(item['minima'].replace('.', '').replace(',', '.'))
+        totNeg     = int(item['totNegocios'].replace('.', ''))
+        qtdNeg     = int(item['qtdNegociada'].replace('.', ''))
+        volume     = float(item['volume'].replace('.', '').replace(',', '.'))
+
+        registros.append((
+            fii_id, dt, fechamento,
+            abertura, maxima, minima,
+            totNeg, qtdNeg, volume
+        ))
+    return registros
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--fundos", type=int, default=50)
+    ap.add_argument("--dias", type=int, default=3500)
+    args = ap.parse_args()
+
+    payloads = [payload(args.dias) for _ in range(args.fundos)]
+    total = args.fundos * args.dias
+    print(f"{args.fundos} payloads × {args.dias} dias = {total} itens\n")
+
+    inicio = time.perf_counter()
+    laco = [montar_registros_laco(i, p, None) for i, p in enumerate(payloads)]
+    t_laco = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    # consome o gerador, como o executemany faria
+    colunar = [list(cotacoes.montar_registros(i, p, None)[2]) for i, p in enumerate(payloads)]
+    t_col = time.perf_counter() - inicio
+
+    print(f"laço item a item: {t_laco:7.2f} s  ({total / t_laco:,.0f} itens/s)")
+    print(f"colunar:          {t_col:7.2f} s  ({total / t_col:,.0f} itens/s)")
+    print(f"ganho:            {t_laco / t_col:7.1f}x")
+    print(f"registros iguais: {laco == colunar}")
+
+    # coluna fora do formato (data vazia): caminho item a item
+    irregular = payload(20) + [{**payload(1)[0], "data": ""}]
+    iguais = montar_registros_laco(0, irregular, None) == list(cotacoes.montar_registros(0, irregular, None)[2])
+    print(f"item a item:      {iguais}")
+    if laco != colunar or not iguais:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Fila persistente de falhas por ticker (tabela ingest_failures).
+
+Cada etapa de coleta registra aqui o ticker que falhou, com o erro, o número
+de tentativas e quando tentar de novo (backoff exponencial: BACKOFF_BASE,
+dobrando a cada falha, até BACKOFF_MAX). Um sucesso remove o ticker da fila.
+Com --so-falhas, as etapas buscam só os tickers cuja próxima tentativa já
+venceu, em vez de percorrer todos os fundos. As falhas também entram na
+telemetria da etapa (telemetria.METRICAS).
+
+Depois de MAX_TENTATIVAS falhas seguidas o ticker é descartado (ex.: fundo
+deslistado): sai das retentativas e as etapas deixam de buscá-lo até ser
+reativado com `python scripts/falhas.py --reativar [ETAPA ...]`.
+
+As funções não fazem commit: a gravação acompanha a transação do chamador.
+"""
+import argparse
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from telemetria import METRICAS
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DB_PATH  = ROOT_DIR / "data" / "fiis.db"
+
+BACKOFF_BASE  = timedelta(minutes=15)
+BACKOFF_MAX   = timedelta(hours=24)
+MAX_TENTATIVAS = 8   # falhas seguidas até o descarte (retentativas e coletas normais somadas)
+
+
+def proxima_tentativa(tentativas, agora):
+    atraso = min(BACKOFF_BASE * 2 ** (tentativas - 1), BACKOFF_MAX)
+    return agora + atraso
+
+
+def registrar_falha(conn, etapa, ticker, erro, agora=None):
+    """Registra (ou incrementa) a falha do ticker na etapa; devolve o total de tentativas."""
+    agora = agora or datetime.now()
+    METRICAS.falha(ticker, erro)
+    row = conn.execute(
+        "SELECT attempts FROM ingest_failures WHERE stage = ? AND ticker = ?", (etapa, ticker)
+    ).fetchone()
+    tentativas = (row[0] if row else 0) + 1
+    conn.execute(
+        """
+        INSERT INTO ingest_failures
+            (stage, ticker, error, attempts, first_failed_at, last_failed_at, next_retry_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(stage, ticker) DO UPDATE SET
+            error          = excluded.error,
+            attempts       = excluded.attempts,
+            last_failed_at = excluded.last_failed_at,
+            next_retry_at  = excluded.next_retry_at
+        """,
+        (etapa, ticker, str(erro)[:500], tentativas,
+         agora.isoformat(timespec="seconds"), agora.isoformat(timespec="seconds"),
+         proxima_tentativa(tentativas, agora).isoformat(timespec="seconds"))
+    )
+    if tentativas == MAX_TENTATIVAS:
+        print(f"   ✖ {ticker}: {tentativas} falhas seguidas em {etapa}; descartado até ser reativado")
+    return tentativas
+
+
+def limpar_falha(conn, etapa, ticker):
+    conn.execute("DELETE FROM ingest_failures WHERE stage = ? AND ticker = ?", (etapa, ticker))
+
+
+def tickers_pendentes(conn, etapa, agora=None):
+    """Tickers da etapa cuja próxima tentativa já venceu (os descartados ficam de fora)."""
+    agora = (agora or datetime.now()).isoformat(timespec="seconds")
+    return {t for (t,) in conn.execute(
+        "SELECT ticker FROM ingest_failures WHERE stage = ? AND next_retry_at <= ? AND attempts < ?",
+        (etapa, agora, MAX_TENTATIVAS)
+    )}
+
+
+def tickers_descartados(conn, etapa):
+    """Tickers da etapa que atingiram MAX_TENTATIVAS: as etapas não os buscam mais."""
+    return {t for (t,) in conn.execute(
+        "SELECT ticker FROM ingest_failures WHERE stage = ? AND attempts >= ?", (etapa, MAX_TENTATIVAS)
+    )}
+
+
+def reativar(conn, etapas=None):
+    """Devolve os descartados (das etapas indicadas, ou de todas) às coletas; retorna quantos."""
+    filtro, params = "", [MAX_TENTATIVAS]
+    if etapas:
+        filtro = f" AND stage IN ({', '.join('?' * len(etapas))})"
+        params += etapas
+    return conn.execute(f"DELETE FROM ingest_failures WHERE attempts >= ?{filtro}", params).rowcount
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Lista (ou reativa) os tickers descartados por falhas seguidas.")
+    ap.add_argument("--reativar", nargs="*", metavar="ETAPA",
+                    help="devolve às coletas os descartados das etapas indicadas (ou de todas)")
+    args = ap.parse_args()
+    with sqlite3.connect(DB_PATH, timeout=30) as conn:
+        if args.reativar is not None:
+            print(f"{reativar(conn, args.reativar)} tickers reativados")
+        else:
+            for etapa, ticker, tentativas, erro in conn.execute(
+                "SELECT stage, ticker, attempts, error FROM ingest_failures "
+                "WHERE attempts >= ? ORDER BY stage, ticker", (MAX_TENTATIVAS,)
+            ):
+                print(f"{etapa:<12} {ticker:<8} {tentativas:>3}  {erro}")
@@ -3,19 +3,18 @@ from pathlib import Path
 import sqlite3
 import pandas as pd
 
+from migrar import aplicar_migracoes
+from telemetria import METRICAS
+
 # 1) Ajuste o caminho para o seu banco
 BASE_DIR = Path(__file__).resolve().parent.parent
 db_path  = BASE_DIR / "data" / "fiis.db"
 
 # 2) Conecta
-conn = sqlite3.connect(str(db_path))
+conn = sqlite3.connect(str(db_path), timeout=30)
 
-# 3) Cria a coluna 'ativo' se ainda não existir
-try:
-    conn.execute("ALTER TABLE fiis ADD COLUMN ativo INTEGER DEFAULT 0;")
-except sqlite3.OperationalError:
-    # coluna já existe
-    pass
+# 3) Garante o schema atual (coluna 'ativo' vem da migração 0003)
+aplicar_migracoes(conn)
 
 # 4) Lê a última data de cotação de cada FII
 df_ult = pd.read_sql("""
@@ -39,4 +38,5 @@ for _, row in df_ult.iterrows():
 
 conn.commit()
 conn.close()
+METRICAS.linhas(inseridas=len(df_ult))
 print(f"Processo concluído: atualizado 'ativo' para {len(df_ult)} FIIs.")
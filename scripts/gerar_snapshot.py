@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Materializa a tabela fii_snapshot: uma linha por FII com os valores mais
+recentes usados pelas páginas (preço, PL, cotas, VPA, P/VP, DY 1/3/6/12M,
+Cap Rate, número de imóveis e faixa de 52 semanas).
+
+Roda no fim do pipeline, depois de fiis_ativos.py, e reconstrói a tabela
+inteira numa única transação. Os dividendos vêm de dividendos_mensais.
+"""
+import sqlite3
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from telemetria import METRICAS
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DB_PATH = ROOT_DIR / "data" / "fiis.db"
+
+JANELAS_DY = (1, 3, 6, 12)   # meses
+
+SQL_SNAPSHOT = """
+WITH ult_data AS (
+    SELECT fii_id, MAX(data) AS data
+    FROM cotacoes
+    GROUP BY fii_id
+),
+preco AS (
+    SELECT c.fii_id, c.data, MAX(c.preco_fechamento) AS preco
+    FROM cotacoes c
+    JOIN ult_data u ON u.fii_id = c.fii_id AND u.data = c.data
+    GROUP BY c.fii_id, c.data
+),
+faixa_52s AS (
+    SELECT fii_id,
+           -- máxima/mínima do pregão; o fechamento cobre dias sem OHLC
+           MAX(COALESCE(maxima, preco_fechamento)) AS max_52s,
+           MIN(COALESCE(minima, preco_fechamento)) AS min_52s
+    FROM cotacoes
+    WHERE data >= :inicio_52s
+    GROUP BY fii_id
+),
+ult_ind AS (
+    SELECT v.fii_id, i.nome, v.valor
+    FROM vw_indicadores_atuais v
+    JOIN indicadores i ON i.id = v.indicador_id
+),
+ind AS (
+    SELECT fii_id,
+           MAX(CASE WHEN nome = 'Patrimônio Líquido'     THEN valor END) AS pl,
+           MAX(CASE WHEN nome = 'Quantidade de Cotas'    THEN valor END) AS qt_cotas,
+           MAX(CASE WHEN nome = 'Quantidade de Cotistas' THEN valor END) AS qt_cotistas,
+           MAX(CASE WHEN nome = 'Cap Rate'               THEN valor END) AS cap_rate
+    FROM ult_ind
+    GROUP BY fii_id
+),
+divs AS (
+    SELECT fii_id,
+           SUM(CASE WHEN mes >= :inicio_1m THEN valor ELSE 0 END) AS div_1m,
+           SUM(CASE WHEN mes >= :inicio_3m THEN valor ELSE 0 END) AS div_3m,
+           SUM(CASE WHEN mes >= :inicio_6m THEN valor ELSE 0 END) AS div_6m,
+           SUM(valor)                                              AS div_12m
+    FROM dividendos_mensais
+    WHERE mes >= :inicio_12m
+      AND mes <= :fim_divs
+    GROUP BY fii_id
+),
+imoveis AS (
+    SELECT fii_id, COUNT(*) AS qtd_imoveis
+    FROM fiis_imoveis
+    GROUP BY fii_id
+),
+base AS (
+    SELECT f.id AS fii_id,
+           p.data AS data_cotacao,
+           p.preco AS preco_atual,
+           ind.pl, ind.qt_cotas, ind.qt_cotistas, ind.cap_rate,
+           ind.pl / NULLIF(ind.qt_cotas, 0) AS vpa,
+           divs.div_1m, divs.div_3m, divs.div_6m, divs.div_12m,
+           COALESCE(imoveis.qtd_imoveis, 0) AS qtd_imoveis,
+           faixa_52s.max_52s, faixa_52s.min_52s
+    FROM fiis f
+    LEFT JOIN preco     p         ON p.fii_id = f.id
+    LEFT JOIN ind                 ON ind.fii_id = f.id
+    LEFT JOIN divs                ON divs.fii_id = f.id
+    LEFT JOIN imoveis             ON imoveis.fii_id = f.id
+    LEFT JOIN faixa_52s           ON faixa_52s.fii_id = f.id
+)
+INSERT INTO fii_snapshot (
+    fii_id, data_cotacao, preco_atual,
+    pl, qt_cotas, qt_cotistas, vpa, pvp,
+    div_12m, dy_1m, dy_3m, dy_6m, dy_12m,
+    cap_rate, qtd_imoveis, max_52s, min_52s, atualizado_em
+)
+SELECT fii_id, data_cotacao, preco_atual,
+       pl, qt_cotas, qt_cotistas, vpa,
+       preco_atual / NULLIF(vpa, 0),
+       div_12m,
+       COALESCE(div_1m,  0) * 100.0 / NULLIF(preco_atual, 0),
+       COALESCE(div_3m,  0) * 100.0 / NULLIF(preco_atual, 0),
+       COALESCE(div_6m,  0) * 100.0 / NULLIF(preco_atual, 0),
+       COALESCE(div_12m, 0) * 100.0 / NULLIF(preco_atual, 0),
+       cap_rate, qtd_imoveis, max_52s, min_52s, :agora
+FROM base
+"""
+
+
+def meses_atras(d: date, n: int) -> date:
+    """Primeiro dia do mês n meses antes de d."""
+    total = d.year * 12 + (d.month - 1) - n
+    return date(total // 12, total % 12 + 1, 1)
+
+
+def parametros(hoje: date) -> dict:
+    """
+    Janelas de DY: meses cheios até o fim do mês anterior (mesma regra da
+    página Análise por Fundo); 52 semanas contadas a partir de hoje.
+    """
+    primeiro_mes = hoje.replace(day=1)
+    params = {
+        f"inicio_{n}m": meses_atras(primeiro_mes, n).isoformat()
+        for n in JANELAS_DY
+    }
+    params["fim_divs"] = (primeiro_mes - timedelta(days=1)).isoformat()
+    params["inicio_52s"] = (hoje - timedelta(weeks=52)).isoformat()
+    params["agora"] = datetime.now().isoformat()
+    return params
+
+
+def gerar_snapshot(conn, hoje=None):
+    params = parametros(hoje or date.today())
+    with conn:
+        conn.execute("DELETE FROM fii_snapshot")
+        conn.execute(SQL_SNAPSHOT, params)
+    return conn.execute("SELECT COUNT(*) FROM fii_snapshot").fetchone()[0]
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    total = gerar_snapshot(conn)
+    conn.close()
+    METRICAS.linhas(inseridas=total)
+    print(f"✅ Snapshot gerado para {total} FIIs.")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Busca concorrente com limite de taxa para os scripts de coleta.
+
+- LimitadorTaxa: token bucket com `rps` requisições por segundo e rajada de
+  até `rajada` requisições, no lugar do time.sleep fixo entre chamadas.
+- buscar_concorrente: executa uma função bloqueante (ex.: requests) para
+  cada item em threads (asyncio.to_thread), com no máximo `concorrencia`
+  chamadas em andamento, e entrega (item, resultado, erro) à medida que
+  cada chamada termina, para o gravador no banco ir consumindo.
+"""
+import asyncio
+import time
+
+
+class LimitadorTaxa:
+    def __init__(self, rps, rajada=None):
+        self.rps = float(rps)
+        self.capacidade = float(rajada or max(1, rps))
+        self.fichas = self.capacidade
+        self.ultimo = time.monotonic()
+        self._trava = asyncio.Lock()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.fichas = min(self.capacidade, self.fichas + (agora - self.ultimo) * self.rps)
+        self.ultimo = agora
+
+    async def aguardar(self):
+        """Consome uma ficha, esperando o tempo necessário para repô-la."""
+        async with self._trava:
+            self._repor()
+            if self.fichas < 1:
+                await asyncio.sleep((1 - self.fichas) / self.rps)
+                self._repor()
+            self.fichas -= 1
+
+
+async def buscar_concorrente(itens, buscar, concorrencia=8, rps=5):
+    """
+    Gerador assíncrono: chama buscar(item) para cada item e produz
+    (item, resultado, erro) na ordem em que as chamadas terminam.
+    """
+    limitador = LimitadorTaxa(rps)
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def tarefa(item):
+        async with semaforo:
+            await limitador.aguardar()
+            try:
+                return item, await asyncio.to_thread(buscar, item), None
+            except Exception as e:
+                return item, None, e
+
+    pendentes = [asyncio.create_task(tarefa(item)) for item in itens]
+    try:
+        for proxima in asyncio.as_completed(pendentes):
+            yield await proxima
+    finally:
+        for t in pendentes:
+            t.cancel()
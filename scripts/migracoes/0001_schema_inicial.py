@@ -0,0 +1,191 @@
+"""
+Schema inicial: o mesmo que 1_criar_banco.py criava do zero (tabelas e
+cadastros padrão). Tudo com IF NOT EXISTS / OR IGNORE, então também serve
+de linha de base para bancos criados antes das migrações.
+"""
+
+
+def migrar(conn):
+    # Setores
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS setor (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome VARCHAR UNIQUE
+        );
+    """)
+
+    # Inserir setores padrão já formatados com iniciais maiúsculas
+    setores_padrao = [
+    "Agencias Bancarias", "Agronegocio", "Educacional", "Fundo De Fundos", "Hospital",
+    "Hoteis", "Hibrido", "Incorporacao", "Incorporacao Residencial", "Infra",
+    "Lajes Comerciais", "Lajes Corporativas", "Logisticos", "Outros",
+    "Recebiveis Imobiliarios", "Residencial", "Shopping/Varejo"]
+
+    for setor in setores_padrao:
+        conn.execute("INSERT OR IGNORE INTO setor (nome) VALUES (?)", (setor,))
+
+    # Tabela de Tipos de FII
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tipo_fii (
+            id        INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome      VARCHAR UNIQUE,
+            descricao VARCHAR
+        );
+    """)
+
+    # Tipos básicos
+    tipos_padrao = [
+        ("Papel",           "Fundos de Papel (CRI, LCI etc.)"),
+        ("Tijolo",          "Fundos de Tijolo (imóveis físicos)"),
+        ("Fundo de Fundos", "FOFs"),
+        ("Multiestratégia","Fundos Multiestratégia/Híbridos"),
+        ("Outros",         "Segmentos diversos não categorizados")
+   ]
+    for nome, desc in tipos_padrao:
+        conn.execute("INSERT OR IGNORE INTO tipo_fii(nome, descricao) VALUES (?, ?)", (nome, desc))
+
+    # FIIs
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fiis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticker VARCHAR NOT NULL UNIQUE,
+            nome VARCHAR,
+            gestao VARCHAR,
+            admin VARCHAR,
+            setor_id INTEGER,
+            tipo_id INTEGER,
+            created_at TIMESTAMP,
+            FOREIGN KEY (setor_id) REFERENCES setor(id),
+            FOREIGN KEY (tipo_id)  REFERENCES tipo_fii(id)
+        );
+    """)
+
+    # Cotações históricas
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cotacoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fii_id INTEGER,
+        data DATE,
+        preco_fechamento FLOAT,
+        abertura FLOAT,
+        maxima FLOAT,
+        minima FLOAT,
+        totNegocios FLOAT,
+        qtdNegociada FLOAT,
+        volume FLOAT,
+        created_at TIMESTAMP,
+        FOREIGN KEY (fii_id) REFERENCES fiis(id)
+    );
+    """)
+
+    # Indicadores
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS indicadores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome VARCHAR UNIQUE,
+            descricao VARCHAR
+        );
+    """)
+
+    # Indicadores padrão
+    indicadores_padrao = [
+        ('Dividendos', 'Rendimentos distribuídos mensalmente'),
+        ("Quantidade de Cotas", "Número de cotas emitidas"),
+        ("Patrimônio Líquido", "Valor total do patrimônio do fundo"),
+        ("Quantidade de Cotistas", "Número de cotistas cadastrados")]
+
+    for nome, descricao in indicadores_padrao:
+        conn.execute("INSERT OR IGNORE INTO indicadores (nome, descricao) VALUES (?, ?)", (nome, descricao))
+        
+    # Indicadores por FII
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fiis_indicadores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fii_id INTEGER,
+            indicador_id INTEGER,
+            data_referencia DATE,
+            valor FLOAT,
+            FOREIGN KEY (fii_id) REFERENCES fiis(id),
+            FOREIGN KEY (indicador_id) REFERENCES indicadores(id)
+        );
+    """)
+
+    # Imoveis
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fiis_imoveis (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fii_id INTEGER NOT NULL,
+        nome_imovel TEXT    NOT NULL,
+        endereco    TEXT    NOT NULL,
+        area_m2     REAL,
+        num_unidades INTEGER,
+        tx_ocupacao    REAL,    -- ex: 94.05 (para 94,05%)
+        tx_inadimplencia REAL,  -- ex:  0.00 (para  0,00%)
+        pct_receitas   REAL,    -- ex:  9.57 (para  9,57%)
+        FOREIGN KEY (fii_id) REFERENCES fiis(id)
+        );
+    """)
+
+    # Última coleta de imóveis por FII (hash da tabela extraída, usado por 6_Imoveis_fundamentus.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fiis_imoveis_coleta (
+        fii_id       INTEGER PRIMARY KEY,
+        scraped_at   TIMESTAMP,
+        content_hash TEXT,
+        FOREIGN KEY (fii_id) REFERENCES fiis(id)
+    );
+    """)
+
+    # Snapshot materializado (uma linha por FII, gerado por gerar_snapshot.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fii_snapshot (
+        fii_id       INTEGER PRIMARY KEY,
+        data_cotacao DATE,
+        preco_atual  FLOAT,
+        pl           FLOAT,
+        qt_cotas     FLOAT,
+        qt_cotistas  FLOAT,
+        vpa          FLOAT,
+        pvp          FLOAT,
+        div_12m      FLOAT,
+        dy_1m        FLOAT,
+        dy_3m        FLOAT,
+        dy_6m        FLOAT,
+        dy_12m       FLOAT,
+        cap_rate     FLOAT,
+        qtd_imoveis  INTEGER,
+        max_52s      FLOAT,
+        min_52s      FLOAT,
+        atualizado_em TIMESTAMP,
+        FOREIGN KEY (fii_id) REFERENCES fiis(id)
+    );
+    """)
+
+    # Barras de cotação pré-agregadas (mantidas por 5_obter_cotacoes.py via agregados.py)
+    for tabela, periodo in (("cotacoes_semanal", "semana"), ("cotacoes_mensal", "mes")):
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {tabela} (
+            fii_id     INTEGER NOT NULL,
+            {periodo}  DATE    NOT NULL,   -- semana: sexta-feira de fechamento; mês: dia 1
+            abertura   FLOAT,
+            maxima     FLOAT,
+            minima     FLOAT,
+            fechamento FLOAT,
+            volume     FLOAT,
+            pregoes    INTEGER,
+            PRIMARY KEY (fii_id, {periodo}),
+            FOREIGN KEY (fii_id) REFERENCES fiis(id)
+        );
+        """)
+
+    # Dividendos somados por mês (mantida por 4_obter_dividendos.py e InserirDiv.py via agregados.py)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS dividendos_mensais (
+        fii_id       INTEGER NOT NULL,
+        mes          DATE    NOT NULL,   -- primeiro dia do mês de referência
+        valor        FLOAT,
+        n_pagamentos INTEGER,
+        PRIMARY KEY (fii_id, mes),
+        FOREIGN KEY (fii_id) REFERENCES fiis(id)
+    );
+    """)
@@ -0,0 +1,67 @@
+"""
+Índices (únicos e de cobertura) e a view vw_indicadores_atuais.
+
+Bancos antigos, gravados com INSERT OR REPLACE sem índice único, podem ter
+linhas repetidas em cotacoes e fiis_indicadores; essas tabelas são
+reconstruídas mantendo a linha mais recente (maior rowid) de cada chave
+antes de criar os índices únicos.
+"""
+from migrar import reconstruir_tabela
+
+# (nome, tabela, colunas, único)
+INDICES = [
+    # JOINs/filtros de imóveis por fundo
+    ("idx_fiis_imoveis_fii_id",       "fiis_imoveis",     "fii_id",                                False),
+    # uma cotação por fundo e pregão; atende MAX(data) WHERE fii_id=? e faixas de data
+    ("ux_cotacoes_fii_data",          "cotacoes",         "fii_id, data",                          True),
+    # um valor por fundo, indicador e data; atende MAX(data_referencia) por fundo/indicador
+    ("ux_fiis_indicadores_unicidade", "fiis_indicadores", "fii_id, indicador_id, data_referencia", True),
+    # cobre as somas por indicador e período (ex.: dividendos dos últimos 12 meses)
+    ("idx_fiis_indicadores_ind_data", "fiis_indicadores", "indicador_id, data_referencia, fii_id, valor", False),
+]
+
+SQL_INDICADORES_ATUAIS = """
+SELECT fi.fii_id, fi.indicador_id, fi.data_referencia, fi.valor
+FROM fiis f
+CROSS JOIN indicadores i
+JOIN fiis_indicadores fi ON fi.rowid = (
+    SELECT x.rowid FROM fiis_indicadores x
+    WHERE x.fii_id = f.id AND x.indicador_id = i.id
+    ORDER BY x.data_referencia DESC
+    LIMIT 1
+)
+"""
+
+
+def criar_indices(cur):
+    for nome, tabela, colunas, unico in INDICES:
+        cur.execute(
+            f"CREATE {'UNIQUE ' if unico else ''}INDEX IF NOT EXISTS {nome} "
+            f"ON {tabela}({colunas});"
+        )
+
+
+def deduplicar(conn, tabela, chave):
+    repetida = conn.execute(
+        f"SELECT 1 FROM {tabela} GROUP BY {chave} HAVING COUNT(*) > 1 LIMIT 1"
+    ).fetchone()
+    if not repetida:
+        return
+    ddl = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,)
+    ).fetchone()[0]
+    ddl = ddl.replace(tabela, "{tabela}", 1)
+    reconstruir_tabela(
+        conn, tabela, ddl,
+        f"SELECT * FROM {tabela} WHERE rowid IN (SELECT MAX(rowid) FROM {tabela} GROUP BY {chave})"
+    )
+
+
+def migrar(conn):
+    deduplicar(conn, "cotacoes", "fii_id, data")
+    deduplicar(conn, "fiis_indicadores", "fii_id, indicador_id, data_referencia")
+    criar_indices(conn)
+
+    # Valor mais recente de cada fundo e indicador: uma busca no índice
+    # ux_fiis_indicadores_unicidade por par (fii_id, indicador_id)
+    conn.execute(f"CREATE VIEW IF NOT EXISTS vw_indicadores_atuais AS {SQL_INDICADORES_ATUAIS}")
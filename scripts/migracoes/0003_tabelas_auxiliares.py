@@ -0,0 +1,45 @@
+"""
+Colunas e tabelas que os scripts criavam por conta própria (ALTER TABLE em
+try/except, PRAGMA table_info, CREATE TABLE IF NOT EXISTS no meio da coleta).
+"""
+from migrar import adicionar_coluna
+
+
+def migrar(conn):
+    # fiis.ativo (antes em fiis_ativos.py)
+    adicionar_coluna(conn, "fiis", "ativo", "INTEGER DEFAULT 0")
+
+    # Desdobramentos, gestão e taxas do StatusInvest (scrap_statusinvest.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS capital_fiis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fii_id INTEGER UNIQUE,
+            type TEXT,
+            announcement_date TEXT,
+            com_date TEXT,
+            fator_antigo REAL,
+            fator_novo REAL,
+            tipo_gestao TEXT,
+            taxas_administracao TEXT,
+            FOREIGN KEY(fii_id) REFERENCES fiis(id)
+        )
+    """)
+    adicionar_coluna(conn, "capital_fiis", "taxas_administracao", "TEXT")
+
+    # Cursor de retomada das coletas longas (scrap_statusinvest.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS progresso_coleta (
+            etapa TEXT PRIMARY KEY,
+            ultimo_ticker TEXT,
+            atualizado_em TIMESTAMP
+        )
+    """)
+
+    # Impressões das entradas de cada etapa do pipeline (setup.py --refresh)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_impressoes (
+            etapa         TEXT PRIMARY KEY,
+            impressao     TEXT,
+            atualizado_em TIMESTAMP
+        )
+    """)
@@ -0,0 +1,25 @@
+"""
+Fila de falhas por ticker compartilhada pelas etapas de coleta (falhas.py):
+o que falhou fica registrado com o número de tentativas e a próxima
+tentativa (backoff exponencial), para o modo --so-falhas reprocessar só isso.
+"""
+
+
+def migrar(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_failures (
+            stage            TEXT    NOT NULL,   -- etapa do pipeline (ex.: cotacoes)
+            ticker           TEXT    NOT NULL,
+            error            TEXT,
+            attempts         INTEGER NOT NULL DEFAULT 1,
+            first_failed_at  TIMESTAMP,
+            last_failed_at   TIMESTAMP,
+            next_retry_at    TIMESTAMP,
+            PRIMARY KEY (stage, ticker)
+        )
+    """)
+    # "o que já pode ser reprocessado" em cada etapa
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_ingest_failures_retry
+        ON ingest_failures(stage, next_retry_at)
+    """)
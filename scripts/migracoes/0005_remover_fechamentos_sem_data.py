@@ -0,0 +1,34 @@
+"""
+Remove as cotações gravadas pela antiga atualização rápida de
+2_coletar_dados.py: o /json/fundo não informa o pregão do ultimoFechamento,
+que era gravado na data do relógio (ultimo_pregao). Em feriados, fundos sem
+negócio ou com a API ainda sem o pregão, isso criava linhas com o fechamento
+anterior numa data sem negociação.
+
+Essas linhas são as que têm created_at (só a atualização rápida o preenchia
+em cotacoes) e nenhum campo de abertura/máxima/mínima/negócios/volume;
+linhas históricas sem OHLC, gravadas pela busca histórica, ficam. Sem elas,
+5_obter_cotacoes.py volta a buscar esses fundos a partir do último pregão
+real; as barras semanais e mensais são recalculadas a partir da data
+removida mais antiga.
+"""
+from agregados import atualizar_barras
+
+DA_ATUALIZACAO_RAPIDA = """
+    created_at IS NOT NULL
+    AND abertura IS NULL AND maxima IS NULL AND minima IS NULL
+    AND totNegocios IS NULL AND qtdNegociada IS NULL AND volume IS NULL
+"""
+
+
+def migrar(conn):
+    afetados = conn.execute(
+        f"SELECT fii_id, MIN(data) FROM cotacoes WHERE {DA_ATUALIZACAO_RAPIDA} GROUP BY fii_id"
+    ).fetchall()
+    if not afetados:
+        return
+    conn.execute(f"DELETE FROM cotacoes WHERE {DA_ATUALIZACAO_RAPIDA}")
+    cur = conn.cursor()
+    for fii_id, desde in afetados:
+        atualizar_barras(cur, fii_id, desde)
+    print(f"     {len(afetados)} fundos com fechamentos sem pregão confirmado removidos")
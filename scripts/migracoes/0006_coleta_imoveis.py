@@ -0,0 +1,14 @@
+"""
+fiis_imoveis_coleta passa a distinguir a última coleta da última mudança:
+scraped_at é gravado a cada coleta bem-sucedida, changed_at só quando o
+conteúdo (content_hash) muda, e sem_tabela marca os fundos cuja página
+carregou sem a tabela de imóveis (os imóveis anteriores são removidos).
+"""
+from migrar import adicionar_coluna
+
+
+def migrar(conn):
+    if adicionar_coluna(conn, "fiis_imoveis_coleta", "changed_at", "TIMESTAMP"):
+        # até aqui scraped_at só era gravado quando o conteúdo mudava
+        conn.execute("UPDATE fiis_imoveis_coleta SET changed_at = scraped_at")
+    adicionar_coluna(conn, "fiis_imoveis_coleta", "sem_tabela", "INTEGER DEFAULT 0")
@@ -0,0 +1,13 @@
+"""
+Contadores de alteração das tabelas lidas pelas impressões do setup.py
+--refresh (ativos, snapshot). COUNT(*) e MAX(rowid) não mudam quando uma
+linha é atualizada no lugar, e a maior parte das gravações é upsert
+(janelas de sobreposição, indicadores).
+"""
+from migrar import criar_contadores
+
+TABELAS = ("fiis", "cotacoes", "fiis_indicadores", "dividendos_mensais", "fiis_imoveis")
+
+
+def migrar(conn):
+    criar_contadores(conn, *TABELAS)
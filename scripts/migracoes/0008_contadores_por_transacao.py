@@ -0,0 +1,15 @@
+"""
+Remove os triggers por linha de cotacoes e fiis_indicadores (migração 0007):
+numa carga de histórico eles somavam um UPDATE em contadores_alteracao a cada
+linha gravada (~46% mais lenta em 200 mil cotações). O contador dessas duas
+tabelas continua em contadores_alteracao, incrementado uma vez por transação
+por quem as grava (migrar.marcar_alteracao); as demais tabelas mantêm os
+triggers.
+"""
+TABELAS = ("cotacoes", "fiis_indicadores")
+
+
+def migrar(conn):
+    for tabela in TABELAS:
+        for operacao in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{tabela}_{operacao}_contador")
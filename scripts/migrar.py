@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+Migrações versionadas do schema do fiis.db.
+
+Cada arquivo scripts/migracoes/NNNN_descricao.py define migrar(conn) e é
+aplicado uma única vez, em ordem, dentro de uma transação; a versão aplicada
+fica em schema_version. Assim um banco existente é atualizado no lugar, sem
+apagar e recoletar tudo. Em WAL, leitores (o dashboard) continuam vendo o
+schema anterior até o COMMIT de cada migração.
+
+Auxiliares para as migrações:
+- adicionar_coluna: ALTER TABLE ... ADD COLUMN idempotente.
+- reconstruir_tabela: para o que o ALTER do SQLite não faz (mudar tipo,
+  restrição, deduplicar): cria a tabela nova, copia, troca e recria índices,
+  triggers e views.
+- criar_contadores: contador de alterações por tabela, mantido por triggers
+  (usado pelas impressões do setup.py --refresh); nas tabelas de carga em
+  massa (cotacoes, fiis_indicadores) quem grava chama marcar_alteracao uma
+  vez por transação.
+
+Uso: python scripts/migrar.py [--status]
+"""
+import argparse
+import importlib.util
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+DB_PATH = ROOT_DIR / "data" / "fiis.db"
+PASTA_MIGRACOES = Path(__file__).resolve().parent / "migracoes"
+RE_ARQUIVO = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+
+def migracoes():
+    """Lista ordenada de (versão, nome, caminho) dos arquivos de migração."""
+    encontradas = []
+    for arq in PASTA_MIGRACOES.glob("*.py"):
+        m = RE_ARQUIVO.match(arq.name)
+        if m:
+            encontradas.append((int(m.group(1)), m.group(2), arq))
+    encontradas.sort()
+    versoes = [v for v, _, _ in encontradas]
+    if len(set(versoes)) != len(versoes):
+        raise RuntimeError(f"Versões de migração repetidas em {PASTA_MIGRACOES}")
+    return encontradas
+
+
+def migracao(versao):
+    """Módulo da migração `versao` (ex.: para reutilizar o INDICES da 0002)."""
+    for v, nome, arq in migracoes():
+        if v == versao:
+            spec = importlib.util.spec_from_file_location(f"migracao_{v:04d}_{nome}", arq)
+            modulo = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(modulo)
+            return modulo
+    raise KeyError(versao)
+
+
+def versao_atual(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versao     INTEGER PRIMARY KEY,
+            nome       TEXT,
+            aplicada_em TIMESTAMP
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_version").fetchone()[0]
+
+
+def aplicar_migracoes(conn, ate=None):
+    """Aplica, em ordem, as migrações ainda não aplicadas; devolve as versões aplicadas."""
+    nivel_anterior = conn.isolation_level
+    fks_anterior = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    conn.isolation_level = None   # BEGIN/COMMIT explícitos: DDL também fica na transação
+    conn.execute("PRAGMA journal_mode=WAL")
+    aplicadas = []
+    try:
+        atual = versao_atual(conn)
+        pendentes = [(v, n) for v, n, _ in migracoes() if v > atual and (ate is None or v <= ate)]
+        if not pendentes:
+            return aplicadas
+        # reconstruir tabelas exige FKs desligadas (só muda fora de transação)
+        conn.execute("PRAGMA foreign_keys=OFF")
+        for versao, nome in pendentes:
+            modulo = migracao(versao)
+            _RECONSTRUIDAS.clear()
+            conn.execute("BEGIN IMMEDIATE")
+            # outra etapa pode ter aplicado a versão entre a leitura de
+            # `pendentes` e a trava: relida aqui, já com a escrita exclusiva
+            if conn.execute("SELECT 1 FROM schema_version WHERE versao = ?", (versao,)).fetchone():
+                conn.execute("ROLLBACK")
+                continue
+            try:
+                modulo.migrar(conn)
+                verificar_chaves(conn, _RECONSTRUIDAS)
+                conn.execute(
+                    "INSERT INTO schema_version (versao, nome, aplicada_em) VALUES (?, ?, ?)",
+                    (versao, nome, datetime.now().isoformat(timespec="seconds"))
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            aplicadas.append(versao)
+            print(f"   ✔ migração {versao:04d}_{nome}")
+        return aplicadas
+    finally:
+        conn.execute(f"PRAGMA foreign_keys={'ON' if fks_anterior else 'OFF'}")
+        conn.isolation_level = nivel_anterior
+
+
+def verificar_chaves(conn, reconstruidas):
+    """
+    Confere as chaves estrangeiras só das tabelas reconstruídas pela migração:
+    violações novas abortam; as que já existiam antes (bancos antigos nunca
+    tiveram FKs ativas) são apenas relatadas.
+    """
+    for tabela, antes in reconstruidas.items():
+        depois = conn.execute(f"PRAGMA foreign_key_check({tabela})").fetchall()
+        if len(depois) > antes:
+            raise RuntimeError(f"chaves estrangeiras inválidas em {tabela}: {depois[:5]}")
+        if depois:
+            print(f"   ⚠ {len(depois)} linhas de {tabela} com chave estrangeira inválida "
+                  f"(já existiam; mantidas)")
+
+
+# --- Auxiliares usados pelas migrações ---
+# tabelas reconstruídas na migração em andamento -> violações de FK que já tinham
+_RECONSTRUIDAS = {}
+
+
+def colunas(conn, tabela):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({tabela})")]
+
+
+def adicionar_coluna(conn, tabela, coluna, definicao):
+    """ADD COLUMN só se a coluna ainda não existir; devolve True se adicionou."""
+    if coluna in colunas(conn, tabela):
+        return False
+    conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}")
+    return True
+
+
+def reconstruir_tabela(conn, tabela, ddl, selecao):
+    """
+    Recria `tabela` a partir de `ddl` (um CREATE TABLE com {tabela} no lugar
+    do nome), preenchida por `selecao` (um SELECT sobre a tabela atual).
+    Índices e triggers da tabela e todas as views são recriados em seguida
+    (se a reconstrução mudar colunas de uma tabela com contador, chame
+    criar_contadores depois).
+    """
+    _RECONSTRUIDAS.setdefault(
+        tabela, len(conn.execute(f"PRAGMA foreign_key_check({tabela})").fetchall()))
+    indices = [sql for (sql,) in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND tbl_name = ? "
+        "AND sql IS NOT NULL ORDER BY type",
+        (tabela,))]
+    # views que citam a tabela impedem o RENAME enquanto ela não existe
+    views = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view'").fetchall()
+    for nome, _ in views:
+        conn.execute(f"DROP VIEW {nome}")
+
+    nova = f"{tabela}__nova"
+    conn.execute(ddl.format(tabela=nova))
+    conn.execute(f"INSERT INTO {nova} {selecao}")
+    conn.execute(f"DROP TABLE {tabela}")
+    conn.execute(f"ALTER TABLE {nova} RENAME TO {tabela}")
+
+    for sql in indices:
+        conn.execute(sql)
+    for _, sql in views:
+        conn.execute(sql)
+
+
+def criar_contadores(conn, *tabelas):
+    """
+    Mantém em contadores_alteracao um contador por tabela, incrementado por
+    triggers a cada INSERT, DELETE e UPDATE que mude algum valor (upserts que
+    regravam o mesmo valor não contam). Os triggers são recriados a partir
+    das colunas atuais de cada tabela.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS contadores_alteracao (
+            tabela TEXT PRIMARY KEY,
+            versao INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for tabela in tabelas:
+        conn.execute("INSERT OR IGNORE INTO contadores_alteracao (tabela) VALUES (?)", (tabela,))
+        mudou = " OR ".join(f'OLD."{c}" IS NOT NEW."{c}"' for c in colunas(conn, tabela))
+        incrementa = f"UPDATE contadores_alteracao SET versao = versao + 1 WHERE tabela = '{tabela}';"
+        for operacao, condicao in (("INSERT", ""), ("UPDATE", f"WHEN {mudou}"), ("DELETE", "")):
+            nome = f"trg_{tabela}_{operacao.lower()}_contador"
+            conn.execute(f"DROP TRIGGER IF EXISTS {nome}")
+            conn.execute(f"CREATE TRIGGER {nome} AFTER {operacao} ON {tabela} {condicao} "
+                         f"BEGIN {incrementa} END")
+
+
+def marcar_alteracao(conn, *tabelas):
+    """
+    Incrementa o contador das tabelas sem triggers (cotacoes, fiis_indicadores;
+    migração 0008): uma vez na transação que as gravou, não uma por linha.
+    """
+    conn.executemany("UPDATE contadores_alteracao SET versao = versao + 1 WHERE tabela = ?",
+                     [(t,) for t in tabelas])
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Aplica as migrações pendentes do fiis.db.")
+    ap.add_argument("--status", action="store_true", help="só mostra a versão atual e as pendentes")
+    args = ap.parse_args()
+
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    atual = versao_atual(conn)
+    pendentes = [f"{v:04d}_{n}" for v, n, _ in migracoes() if v > atual]
+    print(f"Schema na versão {atual}; pendentes: {', '.join(pendentes) or 'nenhuma'}")
+    if not args.status and pendentes:
+        aplicar_migracoes(conn)
+        print(f"✅ Schema atualizado para a versão {versao_atual(conn)}")
+    conn.close()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+"""
+Cliente compartilhado da API Plexa, usado por todos os scripts de coleta.
+
+- Uma única requests.Session com pool de conexões keep-alive e retries
+  (429/5xx) para todas as chamadas do processo.
+- Token em memória com validade: lida do `exp` do JWT quando houver, senão
+  TOKEN_TTL. O login só acontece quando o token expira ou a API responde 401,
+  e só então o .env é regravado.
+- Reautenticação single-flight: se várias threads recebem 401 ao mesmo tempo,
+  só a primeira faz login; as demais reutilizam o token novo.
+- Métricas por endpoint (chamadas, erros, 401, retries, latência p50/p95/máx),
+  exibidas com imprimir_metricas() no fim de cada script.
+"""
+import base64
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from telemetria import instrumentar, percentil
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+ENV_PATH = ROOT_DIR / ".env"
+
+BASE_URL       = 'https://api.plexa.com.br'
+LOGIN_ENDPOINT = BASE_URL + '/site/login'
+
+TIMEOUT        = 15      # segundos por requisição
+MAX_RETRIES    = 3
+BACKOFF_FACTOR = 0.3
+POOL           = 16      # conexões keep-alive mantidas abertas
+TOKEN_TTL      = 50 * 60 # validade assumida quando o token não traz `exp`
+MARGEM_TOKEN   = 60      # renova o token este tanto de segundos antes de expirar
+
+load_dotenv(ENV_PATH)
+
+
+def expiracao_jwt(token):
+    """Timestamp `exp` de um JWT, ou None se não for possível ler."""
+    try:
+        carga = token.split('.')[1]
+        carga += '=' * (-len(carga) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(carga))['exp'])
+    except Exception:
+        return None
+
+
+def salvar_token_no_env(token):
+    if not ENV_PATH.exists():
+        return
+    linhas = ENV_PATH.read_text(encoding='utf-8').splitlines()
+    with open(ENV_PATH, 'w', encoding='utf-8') as f:
+        for linha in linhas:
+            if linha.startswith('PLEXA_TOKEN='):
+                f.write(f"PLEXA_TOKEN={token}\n")
+            else:
+                f.write(linha + "\n")
+
+
+class ClientePlexa:
+    def __init__(self, email=None, senha=None, token=None, pool=POOL, timeout=TIMEOUT):
+        self.email = email or os.getenv("PLEXA_EMAIL")
+        self.senha = senha or os.getenv("PLEXA_SENHA")
+        self.timeout = timeout
+
+        self.session = instrumentar(requests.Session())
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=BACKOFF_FACTOR,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "POST"]
+        )
+        adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._trava = threading.Lock()          # login single-flight
+        self._trava_metricas = threading.Lock()
+        self._geracao = 0   # incrementa a cada login
+        self._token = None
+        self._expira_em = 0.0
+        self._definir_token(token or os.getenv("PLEXA_TOKEN"))
+
+        self.metricas = defaultdict(lambda: {
+            'chamadas': 0, 'erros': 0, 'nao_autorizado': 0,
+            'retries': 0, 'latencias': [],
+        })
+
+    # --- Token ---
+    def _definir_token(self, token):
+        self._token = token
+        if token:
+            self._expira_em = expiracao_jwt(token) or time.time() + TOKEN_TTL
+
+    def _token_valido(self):
+        return bool(self._token) and time.time() < self._expira_em - MARGEM_TOKEN
+
+    def autenticar(self, geracao_vista=None):
+        """
+        Faz login, a menos que outra thread já tenha renovado o token depois
+        de `geracao_vista` (a geração do token usado na chamada que falhou).
+        """
+        with self._trava:
+            if geracao_vista is not None and self._geracao != geracao_vista and self._token_valido():
+                return self._token
+            inicio = time.perf_counter()
+            resp = self.session.post(
+                LOGIN_ENDPOINT,
+                json={"usuEmail": self.email, "usuSenha": self.senha},
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout
+            )
+            self._registrar('login', resp, inicio)
+            resp.raise_for_status()
+            data = resp.json()
+            if 'accessToken' not in data:
+                raise RuntimeError(f"Falha na autenticação: {data}")
+            self._definir_token(data['accessToken'])
+            self._geracao += 1
+            salvar_token_no_env(self._token)
+            print("✔ Token da Plexa renovado")
+            return self._token
+
+    def _credencial(self):
+        """Token válido e a geração a que ele pertence, lidos juntos sob a trava."""
+        with self._trava:
+            if self._token_valido():
+                return self._token, self._geracao
+            geracao = self._geracao
+        self.autenticar(geracao)
+        with self._trava:
+            return self._token, self._geracao
+
+    def token(self):
+        return self._credencial()[0]
+
+    # --- Requisições ---
+    def _registrar(self, endpoint, resp, inicio, erro=False):
+        dt = time.perf_counter() - inicio
+        retries = getattr(getattr(resp, 'raw', None), 'retries', None)
+        with self._trava_metricas:
+            m = self.metricas[endpoint]
+            m['chamadas'] += 1
+            m['latencias'].append(dt)
+            if erro or resp is None or resp.status_code >= 400:
+                m['erros'] += 1
+            if resp is not None and resp.status_code == 401:
+                m['nao_autorizado'] += 1
+            if retries is not None:
+                m['retries'] += len(retries.history)
+
+    def _get(self, endpoint, url):
+        token, geracao = self._credencial()
+        headers = {"Authorization": f"Bearer {token}"}
+        inicio = time.perf_counter()
+        try:
+            resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        except Exception:
+            self._registrar(endpoint, None, inicio, erro=True)
+            raise
+        self._registrar(endpoint, resp, inicio)
+        return resp, geracao
+
+    def get_json(self, endpoint, caminho):
+        """
+        GET autenticado em BASE_URL + caminho; `endpoint` é o nome usado nas
+        métricas. Em 401 reautentica (uma vez por geração de token) e repete.
+        """
+        url = BASE_URL + caminho
+        resp, geracao = self._get(endpoint, url)
+        if resp.status_code == 401:
+            self.autenticar(geracao)
+            resp, _ = self._get(endpoint, url)
+        resp.raise_for_status()
+        return resp.json()
+
+    def imprimir_metricas(self):
+        print("\n📊 Chamadas à API Plexa:")
+        for endpoint, m in sorted(self.metricas.items()):
+            lat = sorted(m['latencias'])
+            ms = lambda v: f"{v * 1000:.0f} ms" if v is not None else "–"
+            print(
+                f"   {endpoint:<12} {m['chamadas']:5d} chamadas | "
+                f"{m['erros']} erros | {m['nao_autorizado']} 401 | {m['retries']} retries | "
+                f"p50 {ms(percentil(lat, 50))} | p95 {ms(percentil(lat, 95))} | "
+                f"máx {ms(lat[-1] if lat else None)}"
+            )
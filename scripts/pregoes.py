@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+Datas de pregão usadas para decidir o que falta atualizar.
+
+Considera apenas fins de semana (sem calendário de feriados), então a data
+só serve para decidir o que buscar, nunca como data de uma cotação gravada:
+num feriado, o "último pregão" é um dia sem negociação, nenhum fundo o tem
+em cotacoes e todos caem na busca histórica normal.
+"""
+from datetime import datetime, timedelta
+
+HORA_FECHAMENTO = 18   # antes disso, o último fechamento disponível é o do pregão anterior
+
+
+def recuar_fim_de_semana(d):
+    while d.weekday() >= 5:
+        d -= timedelta(days=1)
+    return d
+
+
+def ultimo_pregao(agora=None):
+    """Data do último pregão já encerrado em `agora`."""
+    agora = agora or datetime.now()
+    d = agora.date()
+    if agora.hour < HORA_FECHAMENTO:
+        d -= timedelta(days=1)
+    return recuar_fim_de_semana(d)
+
+
+def pregao_anterior(d):
+    return recuar_fim_de_semana(d - timedelta(days=1))
@@ -1,11 +1,17 @@
+import argparse
+import asyncio
 import requests
-import time
-import random
 from bs4 import BeautifulSoup
-import sys
 import sqlite3
+from datetime import datetime
 from pathlib import Path
 import re
+from requests.adapters import HTTPAdapter
+
+from falhas import limpar_falha, registrar_falha
+from limitador import buscar_concorrente
+from migrar import aplicar_migracoes
+from telemetria import instrumentar
 
 # --- Configurações ---
 SCRIPT_DIR = Path(__file__).resolve().parent
@@ -13,6 +19,12 @@ ROOT_DIR = SCRIPT_DIR.parent  # raiz do projeto
 DB_PATH = ROOT_DIR / "data" / "fiis.db"
 BASE_URL = "https://statusinvest.com.br/fundos-imobiliarios"
 
+# Limites de cortesia com statusinvest.com.br (todas as requisições vão para o mesmo host)
+CONCORRENCIA = 3     # requisições simultâneas
+RPS          = 1.5   # requisições por segundo
+LOTE_COMMIT  = 25    # fundos gravados por transação
+ETAPA        = "statusinvest_capital"   # chave do cursor (progresso_coleta) e das falhas (ingest_failures)
+
 # Converte BR number to float
 def parse_br(x: str) -> float:
     s = re.sub(r"\.(?=\d{3},)", "", x)
@@ -22,9 +34,16 @@ def parse_br(x: str) -> float:
     return float(s) if s else 0.0
 
 # Scraping daemon
-def scrape_statusinvest_info(ticker: str) -> dict:
+def criar_sessao(pool: int = CONCORRENCIA) -> requests.Session:
+    session = instrumentar(requests.Session())
+    session.headers['User-Agent'] = 'Mozilla/5.0'
+    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool)
+    session.mount('https://', adapter)
+    return session
+
+def scrape_statusinvest_info(ticker: str, session: requests.Session | None = None) -> dict:
     url = f"{BASE_URL}/{ticker.lower()}"
-    resp = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
+    resp = (session or requests).get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
     resp.raise_for_status()
     soup = BeautifulSoup(resp.text, 'html.parser')
     info = {}
@@ -75,72 +94,126 @@ def scrape_statusinvest_info(ticker: str) -> dict:
             info['taxas_administracao'] = raw
     return info
 
-# Main ETL
-def main():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    # Criar tabela capital_fiis referenciando fiis.id
+def fatores(data: dict) -> tuple[float, float]:
+    """(fator_antigo, fator_novo) do desdobramento/grupamento; (1.0, 1.0) se não houver."""
+    if data['type'] == 'Nenhum':
+        return 1.0, 1.0
+    m = re.match(r"([\d\.,]+)\s*para\s*([\d\.,]+)", data.get('factor', ''))
+    if not m:
+        return 1.0, 1.0
+    return parse_br(m.group(1)), parse_br(m.group(2))
+
+def gravar_capital(cur, fii_id: int, data: dict) -> tuple[float, float]:
+    antigo, novo = fatores(data)
+    # inserir ou atualizar
     cur.execute(
         '''
-        CREATE TABLE IF NOT EXISTS capital_fiis (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fii_id INTEGER UNIQUE,
-            type TEXT,
-            announcement_date TEXT,
-            com_date TEXT,
-            fator_antigo REAL,
-            fator_novo REAL,
-            tipo_gestao TEXT,
-            taxas_administracao TEXT,
-            FOREIGN KEY(fii_id) REFERENCES fiis(id)
-        )
+        INSERT INTO capital_fiis
+        (fii_id,type,announcement_date,com_date,fator_antigo,fator_novo,tipo_gestao,taxas_administracao)
+        VALUES (?,?,?,?,?,?,?,?)
+        ON CONFLICT(fii_id) DO UPDATE SET
+          type=excluded.type,
+          announcement_date=excluded.announcement_date,
+          com_date=excluded.com_date,
+          fator_antigo=excluded.fator_antigo,
+          fator_novo=excluded.fator_novo,
+          tipo_gestao=excluded.tipo_gestao,
+          taxas_administracao=excluded.taxas_administracao
         '''
+        ,(fii_id,data['type'],data['announcement_date'],data['com_date'],antigo,novo,data['tipo_gestao'],data['taxas_administracao'])
     )
-    # Adicionar coluna taxas_administracao se faltar
-    cols = [r[1] for r in cur.execute("PRAGMA table_info(capital_fiis)")]
-    if 'taxas_administracao' not in cols:
-        cur.execute("ALTER TABLE capital_fiis ADD COLUMN taxas_administracao TEXT")
-    # Buscar lista de fiis com id e ticker
-    cur.execute("SELECT id, ticker FROM fiis")
-    entries = cur.fetchall()
-    for fii_id, ticker in entries:
-        try:
-            data = scrape_statusinvest_info(ticker)
-            # fator parse
-            if data['type']=='Nenhum':
-                antigo, novo = 1.0, 1.0
-            else:
-                fs = data.get('factor','')
-                m = re.match(r"([\d\.,]+)\s*para\s*([\d\.,]+)", fs)
-                if m:
-                    antigo = parse_br(m.group(1))
-                    novo = parse_br(m.group(2))
-                else:
-                    antigo, novo = 1.0, 1.0
-            # inserir ou atualizar
-            cur.execute(
-                '''
-                INSERT INTO capital_fiis
-                (fii_id,type,announcement_date,com_date,fator_antigo,fator_novo,tipo_gestao,taxas_administracao)
-                VALUES (?,?,?,?,?,?,?,?)
-                ON CONFLICT(fii_id) DO UPDATE SET
-                  type=excluded.type,
-                  announcement_date=excluded.announcement_date,
-                  com_date=excluded.com_date,
-                  fator_antigo=excluded.fator_antigo,
-                  fator_novo=excluded.fator_novo,
-                  tipo_gestao=excluded.tipo_gestao,
-                  taxas_administracao=excluded.taxas_administracao
-                '''
-                ,(fii_id,data['type'],data['announcement_date'],data['com_date'],antigo,novo,data['tipo_gestao'],data['taxas_administracao'])
-            )
+    return antigo, novo
+
+# Cursor de progresso: último ticker (em ordem alfabética) até o qual todos foram gravados
+def ler_cursor(cur, etapa: str = ETAPA) -> str | None:
+    row = cur.execute("SELECT ultimo_ticker FROM progresso_coleta WHERE etapa = ?", (etapa,)).fetchone()
+    return row[0] if row else None
+
+def salvar_cursor(cur, ticker: str | None, etapa: str = ETAPA):
+    if ticker is None:
+        cur.execute("DELETE FROM progresso_coleta WHERE etapa = ?", (etapa,))
+        return
+    cur.execute(
+        """
+        INSERT INTO progresso_coleta (etapa, ultimo_ticker, atualizado_em) VALUES (?, ?, ?)
+        ON CONFLICT(etapa) DO UPDATE SET
+          ultimo_ticker=excluded.ultimo_ticker,
+          atualizado_em=excluded.atualizado_em
+        """,
+        (etapa, ticker, datetime.now().isoformat(timespec='seconds'))
+    )
+
+async def coletar(conn, entries, concorrencia, rps, lote):
+    """
+    Busca em paralelo (limitado por host) e grava na ordem de chegada,
+    com commit a cada `lote` fundos. O cursor avança sobre o prefixo
+    contínuo de tickers já processados (gravados ou com falha) e é salvo
+    na mesma transação dos dados, então uma execução interrompida retoma
+    sem perder nem pular fundos. As falhas vão para ingest_failures
+    (falhas.py) e o cursor é zerado ao fim de cada passada completa: um
+    ticker que sempre falha não prende a coleta.
+    """
+    cur = conn.cursor()
+    session = criar_sessao(concorrencia)
+    ordem = [ticker for _, ticker in entries]
+    processados = set()
+    proximo = 0          # índice do primeiro ticker ainda não processado
+    pendentes = gravados = erros = 0
+
+    buscar = lambda fii: scrape_statusinvest_info(fii[1], session)
+    async for (fii_id, ticker), data, erro in buscar_concorrente(entries, buscar, concorrencia, rps):
+        if erro:
+            erros += 1
+            print(f"Erro em {ticker}: {erro}")
+            registrar_falha(conn, ETAPA, ticker, erro)
+        else:
+            antigo, novo = gravar_capital(cur, fii_id, data)
+            limpar_falha(conn, ETAPA, ticker)
             print(f"[{ticker}] (ID {fii_id}) gravado. fator_antigo={antigo}, fator_novo={novo}")
-            time.sleep(random.uniform(1,3))
-        except Exception as e:
-            print(f"Erro em {ticker}: {e}")
-            time.sleep(random.uniform(1,3))
+            gravados += 1
+        pendentes += 1
+        processados.add(ticker)
+        while proximo < len(ordem) and ordem[proximo] in processados:
+            proximo += 1
+
+        if pendentes >= lote:
+            if proximo:
+                salvar_cursor(cur, ordem[proximo - 1])
+            conn.commit()
+            pendentes = 0
+
+    # passada completa: a próxima execução começa do zero
+    salvar_cursor(cur, None)
     conn.commit()
+    return gravados, erros
+
+# Main ETL
+def main(concorrencia=CONCORRENCIA, rps=RPS, lote=LOTE_COMMIT, reiniciar=False):
+    conn = sqlite3.connect(DB_PATH)
+    # capital_fiis e progresso_coleta vêm das migrações (0003)
+    aplicar_migracoes(conn)
+    cur = conn.cursor()
+
+    # Buscar lista de fiis com id e ticker, a partir do cursor salvo
+    cursor = None if reiniciar else ler_cursor(cur)
+    if cursor:
+        print(f"Retomando após {cursor}")
+    cur.execute(
+        "SELECT id, ticker FROM fiis WHERE ticker > ? ORDER BY ticker",
+        (cursor or '',)
+    )
+    entries = cur.fetchall()
+
+    print(f"{len(entries)} fundos: {concorrencia} em paralelo, até {rps} req/s")
+    gravados, erros = asyncio.run(coletar(conn, entries, concorrencia, rps, lote))
     conn.close()
+    print(f"Concluído: {gravados} gravados, {erros} erros")
 
 if __name__ == '__main__':
-    main()
+    ap = argparse.ArgumentParser(description="Coleta desdobramentos, gestão e taxas no StatusInvest.")
+    ap.add_argument("--concorrencia", type=int, default=CONCORRENCIA)
+    ap.add_argument("--rps", type=float, default=RPS)
+    ap.add_argument("--lote", type=int, default=LOTE_COMMIT)
+    ap.add_argument("--reiniciar", action="store_true", help="ignora o cursor salvo e percorre todos os fundos")
+    args = ap.parse_args()
+    main(args.concorrencia, args.rps, args.lote, args.reiniciar)
@@ -1,71 +1,472 @@
 #!/usr/bin/env python3
 """
-Orquestração do pipeline:
-1) criar banco
+Orquestração do pipeline como um grafo de dependências:
+1) criar/migrar banco
 2) coletar dados de FIIs
 3) obter indicadores da API
 4) obter dividendos
 5) obter cotações
 6) scrap de imóveis
-7) marcar ativos
-8) atribuir tipo (apenas via adicionaTIpo.py)
+7) cap rate e indicadores do Fundamentus
+8) marcar ativos
+9) gerar snapshot por FII (fii_snapshot)
+10) atribuir tipo (apenas via adicionaTIpo.py)
+
+Cada etapa declara o que lê (entradas) e o que grava (saídas); uma etapa
+depende das etapas declaradas antes dela cujas saídas ela lê. Etapas
+independentes rodam em paralelo (ex.: 4, 5, 6 e 7 só precisam de `fiis`),
+respeitando o limite de etapas simultâneas por host externo. O status de
+cada etapa vai para pipeline_status.json e as falhas para error_log.txt.
+
+Cada execução também é registrada em data/pipeline.db (pipeline_runs e
+pipeline_stage_metrics): início/fim e duração de cada etapa, requisições
+HTTP, bytes e percentis de latência, linhas buscadas/inseridas/puladas e
+falhas por ticker, coletados pelos scripts via telemetria.py. Fica fora de
+fiis.db para o histórico sobreviver à recriação do banco; a página
+Pipeline do dashboard mostra a evolução.
+
+A etapa criar_banco não apaga mais o banco: só aplica as migrações
+pendentes (scripts/migracoes). Com --refresh, cada etapa calcula uma impressão das suas entradas (universo de
+tickers, hash do JSON da API, último pregão, ...). Se a impressão for igual
+à da última execução bem-sucedida, a etapa é marcada como "inalterada" e
+não roda; as que rodam já se limitam aos fundos/períodos que faltam.
+
+As etapas por ticker (dividendos, cotações, imóveis, cap rate) guardam os
+fundos que falharam em ingest_failures (falhas.py), com backoff exponencial
+entre tentativas; as falhas com retentativa vencida entram na impressão, então
+um --refresh também as retenta. Com --so-falhas, só essas etapas rodam, buscando apenas os
+fundos cuja próxima tentativa já venceu, seguidas das etapas que dependem
+delas (ativos, snapshot); as demais ficam "inalteradas".
 """
+import argparse
+import hashlib
+import json
+import sqlite3
+import os
 import subprocess
 import sys
-import os
+import tempfile
+import time
 import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime
+from pathlib import Path
+
+from falhas import tickers_pendentes
+from pregoes import ultimo_pregao
+from telemetria import VARIAVEL_ARQUIVO
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+LOG_PATH = ROOT_DIR / "error_log.txt"
+STATUS_PATH = ROOT_DIR / "pipeline_status.json"
+DB_PATH = ROOT_DIR / "data" / "fiis.db"
+JSON_PATH = ROOT_DIR / "database" / "dados_fundos.json"
+TELEMETRIA_PATH = ROOT_DIR / "data" / "pipeline.db"
+
+PARALELO = 4   # etapas simultâneas no total
+
+# etapas simultâneas por host externo
+LIMITE_POR_HOST = {
+    "api.plexa.com.br":   2,
+    "fundamentus.com.br": 2,
+}
+
+# requisições por segundo toleradas por host, repartidas entre as etapas
+# que podem rodar juntas nele (cada uma recebe --rps total / limite do host)
+RPS_POR_HOST = {
+    "api.plexa.com.br": 5,
+}
+# etapas cujo script aceita --rps (limitador.buscar_concorrente)
+COM_RPS = {"dividendos", "cotacoes"}
+
+# nome -> (script, host externo, entradas, saídas), na ordem do pipeline
+ETAPAS = {
+    "criar_banco":   ("scripts/1_criar_banco.py",           None,
+                      set(), {"schema"}),
+    "coletar_dados": ("scripts/2_coletar_dados.py",          "api.plexa.com.br",
+                      {"schema"}, {"fiis", "dados_fundos.json"}),
+    "indicadores":   ("scripts/3_obter_indicadoresAPI.py",   None,
+                      {"fiis", "dados_fundos.json"}, {"fiis_indicadores"}),
+    "dividendos":    ("scripts/4_obter_dividendos.py",       "api.plexa.com.br",
+                      {"fiis"}, {"fiis_indicadores", "dividendos_mensais"}),
+    "cotacoes":      ("scripts/5_obter_cotacoes.py",         "api.plexa.com.br",
+                      {"fiis"}, {"cotacoes", "cotacoes_semanal", "cotacoes_mensal"}),
+    "imoveis":       ("scripts/6_Imoveis_fundamentus.py",    "fundamentus.com.br",
+                      {"fiis"}, {"fiis_imoveis"}),
+    "cap_rate":      ("scripts/7_cap_rate_fundamentus.py",   "fundamentus.com.br",
+                      {"fiis"}, {"fiis_indicadores"}),
+    "ativos":        ("scripts/fiis_ativos.py",              None,
+                      {"fiis", "cotacoes"}, {"fiis.ativo"}),
+    # depois de ativos (fiis.ativo), como diz gerar_snapshot.py
+    "snapshot":      ("scripts/gerar_snapshot.py",           None,
+                      {"fiis", "fiis.ativo", "cotacoes", "cotacoes_semanal", "fiis_indicadores",
+                       "dividendos_mensais", "fiis_imoveis"}, {"fii_snapshot"}),
+    # Somente aqui fazemos a atribuição de tipos
+    "tipos":         ("scripts/adicionaTIpo.py",             None,
+                      {"fiis", "dados_fundos.json"}, {"fiis.tipo_id"}),
+}
+
+
+# etapas com fila de falhas por ticker (ingest_failures); aceitam --so-falhas
+COM_FILA_FALHAS = {"dividendos", "cotacoes", "imoveis", "cap_rate"}
+
+
+# --- Impressões das entradas (modo --refresh) ---
+def _hash(*partes):
+    return hashlib.sha256("|".join(map(str, partes)).encode("utf-8")).hexdigest()
+
+
+def hash_arquivo(caminho):
+    return hashlib.sha256(caminho.read_bytes()).hexdigest() if caminho.exists() else None
+
+
+def universo(conn):
+    """Hash dos tickers cadastrados: muda quando entra ou sai um fundo."""
+    return _hash(*(t for (t,) in conn.execute("SELECT ticker FROM fiis ORDER BY ticker")))
+
+
+def assinatura_tabelas(conn, *tabelas):
+    """
+    Contador de alterações de cada tabela (migrações 0007 e 0008): muda com
+    inserções, exclusões e atualizações no lugar.
+    """
+    versoes = dict(conn.execute("SELECT tabela, versao FROM contadores_alteracao"))
+    return [versoes.get(t) for t in tabelas]
+
+
+# etapa -> função(conn) com a impressão das entradas; etapas sem função sempre rodam
+# (coletar_dados é a fonte do universo e do JSON: uma única chamada em lote)
+IMPRESSOES = {
+    "indicadores": lambda conn: _hash(hash_arquivo(JSON_PATH), universo(conn)),
+    "tipos":       lambda conn: _hash(hash_arquivo(JSON_PATH), universo(conn)),
+    # já buscam só a janela que falta; sem pregão novo não há o que buscar
+    "dividendos":  lambda conn: _hash(universo(conn), ultimo_pregao()),
+    "cotacoes":    lambda conn: _hash(universo(conn), ultimo_pregao()),
+    # carteira de imóveis muda pouco: no máximo uma coleta por semana
+    "imoveis":     lambda conn: _hash(universo(conn), date.today().isocalendar()[:2]),
+    "cap_rate":    lambda conn: _hash(universo(conn), date.today()),
+    # o corte de 90 dias e as janelas de DY andam com a data
+    "ativos":      lambda conn: _hash(date.today(), assinatura_tabelas(conn, "fiis", "cotacoes")),
+    "snapshot":    lambda conn: _hash(date.today(), assinatura_tabelas(
+                       conn, "fiis", "cotacoes", "fiis_indicadores",
+                       "dividendos_mensais", "fiis_imoveis")),
+}
+
+
+def conectar():
+    # pipeline_impressoes vem da migração 0003, aplicada pela etapa criar_banco
+    return sqlite3.connect(DB_PATH, timeout=30)
+
+
+def com_falhas(conn, nome, entradas):
+    """
+    Soma à impressão das entradas os tickers da etapa com retentativa vencida
+    em ingest_failures (os descartados não contam); sem eles, fica igual.
+    """
+    vencidas = sorted(tickers_pendentes(conn, nome)) if nome in COM_FILA_FALHAS else []
+    return _hash(entradas, *vencidas) if vencidas else entradas
+
+
+def calcular_impressao(nome):
+    """(impressão das entradas, impressão atual com as falhas vencidas, impressão gravada)."""
+    funcao = IMPRESSOES.get(nome)
+    if funcao is None or not DB_PATH.exists():
+        return None, None, None
+    conn = conectar()
+    try:
+        entradas = funcao(conn)
+        row = conn.execute("SELECT impressao FROM pipeline_impressoes WHERE etapa = ?", (nome,)).fetchone()
+        return entradas, com_falhas(conn, nome, entradas), row[0] if row else None
+    finally:
+        conn.close()
+
 
-def run_script(script_path, error_file):
-    """Executa o script e, em caso de erro, registra em error_file."""
-    print(f"▶️ Executando: {script_path}")
+def impressao_final(nome, entradas):
+    """
+    Impressão gravada após o sucesso: as entradas lidas no início com as falhas
+    que ainda vencem agora (ex.: ticker fora do universo), para o próximo
+    --refresh não rodar só porque a fila esvaziou.
+    """
+    conn = conectar()
+    try:
+        return com_falhas(conn, nome, entradas)
+    finally:
+        conn.close()
+
+
+def gravar_impressao(nome, impressao):
+    conn = conectar()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO pipeline_impressoes (etapa, impressao, atualizado_em) VALUES (?, ?, ?)
+                ON CONFLICT(etapa) DO UPDATE SET
+                    impressao     = excluded.impressao,
+                    atualizado_em = excluded.atualizado_em
+            """, (nome, impressao, datetime.now().isoformat(timespec="seconds")))
+    finally:
+        conn.close()
+
+
+# --- Telemetria das execuções (data/pipeline.db) ---
+CAMPOS_METRICAS = (
+    "http_requisicoes", "http_bytes", "latencia_p50_ms", "latencia_p95_ms", "latencia_p99_ms",
+    "linhas_buscadas", "linhas_inseridas", "linhas_puladas", "falhas",
+)
+
+
+def conectar_telemetria(caminho=TELEMETRIA_PATH):
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(caminho, timeout=30)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS pipeline_runs (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            inicio      TIMESTAMP,
+            fim         TIMESTAMP,
+            modo        TEXT,          -- completo | refresh | falhas
+            duracao_s   FLOAT,
+            etapas_ok   INTEGER,
+            etapas_erro INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS pipeline_stage_metrics (
+            run_id           INTEGER NOT NULL,
+            etapa            TEXT    NOT NULL,
+            status           TEXT,     -- ok | erro | pulada | inalterada
+            inicio           TIMESTAMP,
+            fim              TIMESTAMP,
+            duracao_s        FLOAT,
+            returncode       INTEGER,
+            http_requisicoes INTEGER,
+            http_bytes       INTEGER,
+            latencia_p50_ms  FLOAT,
+            latencia_p95_ms  FLOAT,
+            latencia_p99_ms  FLOAT,
+            linhas_buscadas  INTEGER,
+            linhas_inseridas INTEGER,
+            linhas_puladas   INTEGER,
+            falhas           INTEGER,
+            falhas_detalhe   TEXT,     -- JSON {ticker: erro}
+            PRIMARY KEY (run_id, etapa),
+            FOREIGN KEY (run_id) REFERENCES pipeline_runs(id)
+        );
+    """)
+    return conn
+
+
+def registrar_execucao(inicio, fim, modo, resultado, caminho=TELEMETRIA_PATH):
+    """Grava a execução e as métricas de cada etapa; devolve o id da execução."""
+    conn = conectar_telemetria(caminho)
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO pipeline_runs (inicio, fim, modo, duracao_s, etapas_ok, etapas_erro) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (inicio.isoformat(timespec="seconds"), fim.isoformat(timespec="seconds"), modo,
+             round((fim - inicio).total_seconds(), 2),
+             sum(st["status"] == "ok" for st in resultado),
+             sum(st["status"] == "erro" for st in resultado))
+        )
+        run_id = cur.lastrowid
+        conn.executemany(
+            f"""
+            INSERT INTO pipeline_stage_metrics
+                (run_id, etapa, status, inicio, fim, duracao_s, returncode,
+                 {", ".join(CAMPOS_METRICAS)}, falhas_detalhe)
+            VALUES (?, ?, ?, ?, ?, ?, ?, {", ".join("?" * len(CAMPOS_METRICAS))}, ?)
+            """,
+            [(run_id, st["etapa"], st["status"], st.get("inicio"), st.get("fim"),
+              st.get("duracao_s"), st.get("returncode"),
+              *(st.get(c) for c in CAMPOS_METRICAS),
+              json.dumps(st["falhas_detalhe"], ensure_ascii=False) if st.get("falhas_detalhe") else None)
+             for st in resultado]
+        )
+    conn.close()
+    return run_id
+
+
+def dependencias(etapas):
+    """Etapa -> etapas anteriores que gravam algo que ela lê."""
+    nomes = list(etapas)
+    deps = {}
+    for i, nome in enumerate(nomes):
+        entradas = etapas[nome][2]
+        deps[nome] = {anterior for anterior in nomes[:i] if etapas[anterior][3] & entradas}
+    return deps
+
+
+def reprocessamento(etapas, deps):
+    """Etapas do modo --so-falhas: criar_banco, as com fila de falhas e as que dependem delas."""
+    alvo = {"criar_banco"} | (COM_FILA_FALHAS & set(etapas))
+    for nome in etapas:   # na ordem declarada, dependências vêm antes
+        if deps[nome] & (alvo - {"criar_banco"}):
+            alvo.add(nome)
+    return alvo
+
+
+def argumentos(nome, host, limite_por_host, paralelo, so_falhas=False):
+    """Argumentos de linha de comando da etapa: fatia do --rps do host e --so-falhas."""
+    args = []
+    if nome in COM_RPS and host in RPS_POR_HOST:
+        simultaneas = max(1, min(limite_por_host.get(host, paralelo), paralelo))
+        args += ["--rps", f"{RPS_POR_HOST[host] / simultaneas:g}"]
+    if so_falhas and nome in COM_FILA_FALHAS:
+        args.append("--so-falhas")
+    return args
+
+
+def run_script(script_path, args=()):
+    """
+    Executa o script e devolve (returncode, saída, métricas) sem interromper
+    o pipeline; as métricas são as que o script gravou via telemetria.py.
+    """
+    fd, arquivo = tempfile.mkstemp(prefix="metricas_", suffix=".json")
+    os.close(fd)
     try:
         result = subprocess.run(
-            [sys.executable, script_path],
+            [sys.executable, str(script_path), *args],
             capture_output=True,
-            text=True
+            text=True,
+            cwd=ROOT_DIR,
+            env={**os.environ, VARIAVEL_ARQUIVO: arquivo},
         )
-        if result.returncode != 0:
-            error_file.write(f"\n==== ERRO: {script_path} ====\n")
-            error_file.write(result.stdout)
-            error_file.write(result.stderr)
-            error_file.write("\n")
-            print(f"❌ Erro em {script_path}. Veja error_log.txt")
-        else:
-            print(f"✅ Sucesso: {script_path}")
-    except Exception as e:
-        error_file.write(f"\n==== EXCEÇÃO: {script_path} ====\n")
-        error_file.write(traceback.format_exc())
-        error_file.write("\n")
-        print(f"❌ Exceção em {script_path}. Veja error_log.txt")
+        return result.returncode, result.stdout + result.stderr, ler_metricas(arquivo)
+    except Exception:
+        return None, traceback.format_exc(), {}
+    finally:
+        os.remove(arquivo)
+
+
+def ler_metricas(arquivo):
+    try:
+        with open(arquivo, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}   # script sem telemetria (ou que caiu antes de gravar)
+
+
+def executar(etapas=ETAPAS, paralelo=PARALELO, limite_por_host=LIMITE_POR_HOST,
+             error_file=None, refresh=False, so_falhas=False):
+    """
+    Roda as etapas assim que suas dependências terminam com sucesso.
+    Devolve o status estruturado de cada etapa, na ordem declarada.
+    """
+    concluida = ("ok", "inalterada")
+    deps = dependencias(etapas)
+    alvo = reprocessamento(etapas, deps) if so_falhas else set(etapas)
+    status = {nome: {"etapa": nome, "script": etapas[nome][0], "host": etapas[nome][1],
+                     "depende_de": sorted(deps[nome]), "status": "pendente"}
+              for nome in etapas}
+    em_uso = {host: 0 for host in limite_por_host}
+    rodando = {}
+
+    def pode_iniciar(nome):
+        host = etapas[nome][1]
+        return (all(status[d]["status"] in concluida for d in deps[nome])
+                and em_uso.get(host, 0) < limite_por_host.get(host, paralelo))
+
+    with ThreadPoolExecutor(max_workers=paralelo) as executor:
+        while True:
+            for nome, st in status.items():
+                if st["status"] != "pendente":
+                    continue
+                # dependência que falhou ou foi pulada: esta etapa não roda
+                if any(status[d]["status"] in ("erro", "pulada") for d in deps[nome]):
+                    st["status"] = "pulada"
+                    print(f"⏭️ Pulando {nome}: dependência não concluída")
+                    continue
+                script = ROOT_DIR / etapas[nome][0]
+                if not script.is_file():
+                    st["status"] = "erro"
+                    st["erro"] = "script não encontrado"
+                    if error_file:
+                        error_file.write(f"\n==== NÃO ENCONTRADO: {script} ====\n")
+                    print(f"⚠️ Script não encontrado: {script}")
+                    continue
+                if nome not in alvo:
+                    st["status"] = "inalterada"
+                    print(f"⏭️ {nome}: fora do reprocessamento de falhas")
+                    continue
+                if len(rodando) < paralelo and pode_iniciar(nome):
+                    # calculada também na carga completa, para o próximo --refresh;
+                    # o reprocessamento de falhas não conta como coleta completa
+                    entradas, atual, anterior = calcular_impressao(nome) if not so_falhas else (None,) * 3
+                    st["impressao"] = atual
+                    if refresh and atual is not None and atual == anterior:
+                        st["status"] = "inalterada"
+                        print(f"⏭️ {nome}: entradas inalteradas")
+                        continue
+                    st["_entradas"] = entradas
+                    host = etapas[nome][1]
+                    if host:
+                        em_uso[host] = em_uso.get(host, 0) + 1
+                    st["status"] = "rodando"
+                    st["inicio"] = datetime.now().isoformat(timespec="seconds")
+                    st["_t0"] = time.perf_counter()
+                    args = argumentos(nome, host, limite_por_host, paralelo, so_falhas)
+                    print(f"▶️ Executando: {' '.join([etapas[nome][0], *args])}")
+                    rodando[executor.submit(run_script, script, args)] = nome
+
+            if not rodando:
+                break
+
+            prontos, _ = wait(rodando, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                nome = rodando.pop(futuro)
+                st = status[nome]
+                host = etapas[nome][1]
+                if host:
+                    em_uso[host] -= 1
+                returncode, saida, metricas = futuro.result()
+                entradas = st.pop("_entradas")
+                st.update(metricas)
+                st["fim"] = datetime.now().isoformat(timespec="seconds")
+                st["duracao_s"] = round(time.perf_counter() - st.pop("_t0"), 2)
+                st["returncode"] = returncode
+                if returncode == 0:
+                    st["status"] = "ok"
+                    # com falhas por ticker a etapa não está completa: o próximo
+                    # --refresh roda de novo
+                    if entradas and not st.get("falhas"):
+                        gravar_impressao(nome, impressao_final(nome, entradas))
+                    print(f"✅ Sucesso: {etapas[nome][0]} ({st['duracao_s']:.1f}s)")
+                else:
+                    st["status"] = "erro"
+                    if error_file:
+                        error_file.write(f"\n==== ERRO: {etapas[nome][0]} ====\n")
+                        error_file.write(saida)
+                        error_file.write("\n")
+                    print(f"❌ Erro em {etapas[nome][0]}. Veja error_log.txt")
+
+    return list(status.values())
+
 
 if __name__ == '__main__':
-    # Caminho raiz (onde este script está)
-    root_dir = os.path.dirname(os.path.abspath(__file__))
-
-    # Scripts na ordem desejada
-    scripts = [
-        './scripts/1_criar_banco.py',
-        './scripts/2_coletar_dados.py',
-        './scripts/3_obter_indicadoresAPI.py',
-        './scripts/4_obter_dividendos.py',
-        './scripts/5_obter_cotacoes.py',
-        './scripts/6_Imoveis_fundamentus.py',
-        './scripts/fiis_ativos.py',
-        './scripts/adicionaTIpo.py',       # Somente aqui fazemos a atribuição de tipos
-    ]
+    ap = argparse.ArgumentParser(description="Executa o pipeline de coleta em paralelo, por dependências.")
+    ap.add_argument("--paralelo", type=int, default=PARALELO,
+                    help="etapas simultâneas (1 = uma de cada vez, como antes)")
+    ap.add_argument("--refresh", action="store_true",
+                    help="mantém o banco e pula etapas cujas entradas não mudaram")
+    ap.add_argument("--so-falhas", action="store_true",
+                    help="reprocessa só os fundos em ingest_failures com retentativa vencida")
+    args = ap.parse_args()
 
+    inicio = datetime.now()
     # Abre (ou cria) o log de erros
-    log_path = os.path.join(root_dir, 'error_log.txt')
-    with open(log_path, 'w', encoding='utf-8') as errf:
+    with open(LOG_PATH, 'w', encoding='utf-8') as errf:
         errf.write(f"Log de erros iniciado em {sys.argv[0]}\n")
-        # Executa cada um
-        for rel in scripts:
-            full = os.path.join(root_dir, rel)
-            if not os.path.isfile(full):
-                errf.write(f"\n==== NÃO ENCONTRADO: {full} ====\n")
-                print(f"⚠️ Script não encontrado: {full}")
-                continue
-            run_script(full, errf)
+        resultado = executar(paralelo=args.paralelo, error_file=errf, refresh=args.refresh,
+                             so_falhas=args.so_falhas)
+    fim = datetime.now()
+    total = round((fim - inicio).total_seconds(), 2)
+    modo = "falhas" if args.so_falhas else "refresh" if args.refresh else "completo"
+    run_id = registrar_execucao(inicio, fim, modo, resultado)
+
+    STATUS_PATH.write_text(
+        json.dumps({"run_id": run_id, "duracao_total_s": total, "etapas": resultado}, ensure_ascii=False, indent=2),
+        encoding="utf-8"
+    )
 
     print("\n🔎 Execução concluída.")
-    print("   • Verifique error_log.txt para eventuais falhas.")
+    for st in resultado:
+        print(f"   • {st['etapa']:<14} {st['status']:<10} {st.get('duracao_s', 0):7.1f}s")
+    print(f"   Tempo total: {total:.1f}s (execução #{run_id} em {TELEMETRIA_PATH.name})")
+    print("   • Verifique error_log.txt para eventuais falhas e pipeline_status.json para o detalhe.")
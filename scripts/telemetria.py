@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Métricas de execução de uma etapa do pipeline.
+
+Os scripts de coleta registram aqui as requisições HTTP (instrumentar(session)
+conta requisições, bytes e latência de cada resposta), as linhas buscadas,
+inseridas e puladas, e as falhas por ticker. Quando o script roda pelo
+setup.py, a variável de ambiente PIPELINE_METRICAS aponta para um arquivo
+JSON onde o resumo é gravado na saída do processo; o runner o lê e guarda em
+data/pipeline.db. Rodando o script avulso, nada é gravado.
+"""
+import atexit
+import json
+import os
+import threading
+
+VARIAVEL_ARQUIVO = "PIPELINE_METRICAS"
+MAX_FALHAS = 200   # falhas detalhadas guardadas por etapa (o total é sempre contado)
+
+
+def percentil(valores, p):
+    """Percentil por posição (nearest-rank) de uma lista já ordenada."""
+    if not valores:
+        return None
+    i = max(0, min(len(valores) - 1, round(p / 100 * len(valores)) - 1))
+    return valores[i]
+
+
+class Metricas:
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.latencias = []
+        self.bytes = 0
+        self.buscadas = self.inseridas = self.puladas = 0
+        self.n_falhas = 0
+        self.falhas = {}
+
+    def resposta(self, resp, *args, **kwargs):
+        """Hook de resposta do requests: uma chamada por requisição concluída."""
+        with self._trava:
+            self.latencias.append(resp.elapsed.total_seconds())
+            self.bytes += len(resp.content)
+
+    def linhas(self, buscadas=0, inseridas=0, puladas=0):
+        with self._trava:
+            self.buscadas += buscadas
+            self.inseridas += inseridas
+            self.puladas += puladas
+
+    def falha(self, ticker, erro):
+        with self._trava:
+            self.n_falhas += 1
+            if len(self.falhas) < MAX_FALHAS:
+                self.falhas[ticker] = str(erro)[:300]
+
+    def resumo(self):
+        with self._trava:
+            lat = sorted(self.latencias)
+            ms = lambda p: None if not lat else round(percentil(lat, p) * 1000, 1)
+            return {
+                "http_requisicoes": len(lat),
+                "http_bytes": self.bytes,
+                "latencia_p50_ms": ms(50),
+                "latencia_p95_ms": ms(95),
+                "latencia_p99_ms": ms(99),
+                "linhas_buscadas": self.buscadas,
+                "linhas_inseridas": self.inseridas,
+                "linhas_puladas": self.puladas,
+                "falhas": self.n_falhas,
+                "falhas_detalhe": self.falhas,
+            }
+
+    def salvar(self):
+        caminho = os.environ.get(VARIAVEL_ARQUIVO)
+        if not caminho:
+            return
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(self.resumo(), f, ensure_ascii=False)
+
+
+# uma instância por processo, gravada automaticamente na saída
+METRICAS = Metricas()
+atexit.register(METRICAS.salvar)
+
+
+def instrumentar(session):
+    """Registra cada resposta da sessão em METRICAS; devolve a própria sessão."""
+    session.hooks["response"].append(METRICAS.resposta)
+    return session